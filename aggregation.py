@@ -0,0 +1,341 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 12:17
+# @author: agent
+# @contact: agent@local
+# @file: aggregation.py
+# @desc: declarative aggregation engine for feature families
+
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import sketch
+from id_index import get_group_codes
+from logs.instrument import traced
+
+
+# one aggregated feature
+# name: string, name of new feature
+# keys: list, group cols
+# mask: Mask or callable(DataFrame) -> boolean Series, rows taking part in the aggregation, None for all rows
+# val_col: string or callable(DataFrame) -> array, col to be stats, None for count
+# op: string, count, sum, max, min, mean, nunique or a quantile of sketch.QUANTILE_OPS (median, p25, p75, p90)
+AggFeat = namedtuple('AggFeat', ['name', 'keys', 'mask', 'val_col', 'op'])
+
+# ops whose empty group is missing rather than 0, same as a left merge of the grouped counts
+COUNT_OPS = ('count', 'nunique')
+
+
+class Mask(object):
+    """
+    rows where the given cols are not null and the other given cols are null
+    declared by col names instead of a function, so every backend can evaluate it; masks are combined with &
+    """
+
+    def __init__(self, not_null=(), is_null=()):
+        """
+        :param not_null: tuple, cols required to be not null
+        :param is_null: tuple, cols required to be null
+        """
+        self.not_null = tuple(not_null)
+        self.is_null = tuple(is_null)
+
+    def __call__(self, df):
+        mask = np.ones(len(df), dtype=bool)
+        for col in self.not_null:
+            mask &= df[col].notna().to_numpy()
+        for col in self.is_null:
+            mask &= df[col].isna().to_numpy()
+
+        return mask
+
+    def __and__(self, other):
+        return Mask(self.not_null + other.not_null, self.is_null + other.is_null)
+
+    def __repr__(self):
+        return 'Mask(not_null={0}, is_null={1})'.format(self.not_null, self.is_null)
+
+
+def not_null(*cols):
+    """
+    :param cols: col names
+    :return: Mask
+    """
+    return Mask(not_null=cols)
+
+
+def is_null(*cols):
+    """
+    :param cols: col names
+    :return: Mask
+    """
+    return Mask(is_null=cols)
+
+
+def agg_feats(keys, mask, val_col, agg_ops, kws, val_name=None):
+    """
+    declare one feature per op with the naming of utils.add_agg_feats
+    :param keys: list,
+    :param mask: Mask, callable or None,
+    :param val_col: string or callable,
+    :param agg_ops: list, ops like max, min, mean, median
+    :param kws: string, prefix of feature names
+    :param val_name: string, name of val_col used in feature names, required if val_col is callable
+    :return: list of AggFeat
+    """
+    val_name = val_col if val_name is None else val_name
+
+    return [AggFeat('{0}_{1}_{2}'.format(kws, val_name, op), keys, mask, val_col, op) for op in agg_ops]
+
+
+def get_mask(df, mask):
+    """
+    evaluate mask of a feature
+    :param df: DataFrame,
+    :param mask: callable or None,
+    :return: ndarray, boolean
+    """
+    if mask is None:
+        return np.ones(len(df), dtype=bool)
+
+    return np.asarray(mask(df), dtype=bool)
+
+
+def get_values(df, val_col):
+    """
+    get values of a feature as float, same as utils.add_agg_feat_names
+    :param df: DataFrame,
+    :param val_col: string or callable,
+    :return: ndarray, float64
+    """
+    values = val_col(df) if callable(val_col) else df[val_col]
+
+    return pd.Series(values, copy=False).astype('float64').to_numpy()
+
+
+def check_keys(feats):
+    """
+    check all features share the same group cols
+    :param feats: list of AggFeat
+    :return: list, group cols
+    """
+    keys = list(feats[0].keys)
+    for feat in feats[1:]:
+        if list(feat.keys) != keys:
+            raise ValueError('features must share group cols, got {0} and {1}.'.format(keys, feat.keys))
+
+    return keys
+
+
+def get_masked_cols(df, feats):
+    """
+    build one masked column per feature, rows out of mask are False for count and NaN for the others
+    features sharing mask and values share one array, masks and values are only evaluated once
+    :param df: DataFrame,
+    :param feats: list of AggFeat
+    :return: dict, feature name -> ndarray
+    """
+    masks = {}
+    values = {}
+    masked = {}
+    cols = {}
+    for feat in feats:
+        if id(feat.mask) not in masks:
+            masks[id(feat.mask)] = get_mask(df, feat.mask)
+        mask = masks[id(feat.mask)]
+
+        if feat.op == 'count':
+            cols[feat.name] = mask
+            continue
+
+        key = feat.val_col if isinstance(feat.val_col, str) else id(feat.val_col)
+        if key not in values:
+            values[key] = get_values(df, feat.val_col)
+        if (id(feat.mask), key) not in masked:
+            masked[(id(feat.mask), key)] = np.where(mask, values[key], np.nan)
+        cols[feat.name] = masked[(id(feat.mask), key)]
+
+    return cols
+
+
+def get_frame_cols(cols):
+    """
+    one frame col per distinct array, so shared arrays are not copied into the frame several times
+    :param cols: dict, feature name -> ndarray, from get_masked_cols
+    :return: tuple, frame cols and feature name -> frame col name
+    """
+    names = {}
+    frame_cols = {}
+    for name, values in cols.items():
+        if id(values) not in names:
+            names[id(values)] = name
+            frame_cols[name] = values
+
+    return frame_cols, {name: names[id(values)] for name, values in cols.items()}
+
+
+def finalize_counts(df_agg, feats):
+    """
+    turn empty count groups into NaN, count cols stay int if no group is empty
+    :param df_agg: DataFrame,
+    :param feats: list of AggFeat
+    :return: DataFrame
+    """
+    for feat in feats:
+        if feat.op not in COUNT_OPS:
+            continue
+        col = df_agg[feat.name]
+        if (col == 0).any():
+            df_agg[feat.name] = col.where(col != 0).astype('float')
+        else:
+            df_agg[feat.name] = col.astype(np.int64)
+
+    return df_agg
+
+
+# ops computed from values sorted within groups
+SORTED_OPS = ('min', 'max') + tuple(sketch.QUANTILE_OPS)
+
+
+def is_hist_op(op):
+    """
+    quantiles are computed from value histograms, except exact median which pandas computes directly
+    :param op: string,
+    :return: boolean
+    """
+    return op in sketch.QUANTILE_OPS and (op != 'median' or sketch.is_sketched())
+
+
+def get_sorted_stats(groups, values, n_groups):
+    """
+    min, max and quantiles per group with one sort of the valid values
+    quantiles use quantized values in sketch mode, same as the histogram path
+    :param groups: ndarray, group index of rows
+    :param values: ndarray, float, NaN is skipped
+    :param n_groups: int,
+    :return: dict, op -> ndarray of n_groups, NaN for empty groups
+    """
+    valid = ~np.isnan(values)
+    groups, values = groups[valid], values[valid]
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+
+    stats = {op: np.full(n_groups, np.nan) for op in SORTED_OPS}
+    if not len(groups):
+        return stats
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    ends = np.r_[starts[1:], len(groups)] - 1
+    sizes = ends - starts + 1
+    ids = groups[starts]
+    stats['min'][ids] = values[starts]
+    stats['max'][ids] = values[ends]
+    # quantization is monotonic, values stay sorted
+    quantized = sketch.quantize(values) if sketch.is_sketched() else values
+    for op, level in sketch.QUANTILE_OPS.items():
+        stats[op][ids] = sketch.get_sorted_quantiles(quantized if is_hist_op(op) else values, starts, sizes, level)
+
+    return stats
+
+
+def get_code_stat(op, groups, values, n_groups):
+    """
+    count, nunique, sum or mean over integer group index by bincount
+    :param op: string,
+    :param groups: ndarray, group index of rows
+    :param values: ndarray, masked values, NaN out of mask (count: 0/1 mask)
+    :param n_groups: int,
+    :return: ndarray of n_groups
+    """
+    if op == 'count':
+        return np.bincount(groups, weights=values, minlength=n_groups).astype(np.int64)
+
+    valid = ~np.isnan(values)
+    if op == 'nunique':
+        codes, uniques = pd.factorize(values[valid])
+        pairs = np.unique(groups[valid] * max(len(uniques), 1) + codes)
+        return np.bincount(pairs // max(len(uniques), 1), minlength=n_groups).astype(np.int64)
+
+    sums = np.bincount(groups[valid], weights=values[valid], minlength=n_groups)
+    if op == 'sum':
+        return sums
+    if op == 'mean':
+        counts = np.bincount(groups[valid], minlength=n_groups)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(counts > 0, sums / counts, np.nan)
+
+    raise ValueError('unknown op {0}.'.format(op))
+
+
+def aggregate_codes(df, feats, id_index):
+    """
+    same result as aggregate, groups are dense codes of an IdIndex so every op is a bincount or a sort
+    :param df: DataFrame,
+    :param feats: list of AggFeat, grouped by one entity or by user and merchant
+    :param id_index: IdIndex, extended with unseen ids of df
+    :return: DataFrame, group cols and one col per feature
+    """
+    keys = check_keys(feats)
+    groups, n_groups, decode = get_group_codes(df, keys, id_index)
+    cols = get_masked_cols(df, feats)
+
+    # groups in order of first appearance
+    present, first = np.unique(groups, return_index=True)
+    present = present[np.argsort(first, kind='mergesort')]
+
+    res = {key: pd.Series(ids).astype(df[key].dtype) for key, ids in decode(present).items()}
+    sorted_stats = {}
+    for feat in feats:
+        if feat.op in SORTED_OPS:
+            # features masking the same values share one sort
+            key = (id(feat.mask), feat.val_col if isinstance(feat.val_col, str) else id(feat.val_col))
+            if key not in sorted_stats:
+                sorted_stats[key] = get_sorted_stats(groups, cols[feat.name], n_groups)
+            stat = sorted_stats[key][feat.op]
+        else:
+            stat = get_code_stat(feat.op, groups, cols[feat.name], n_groups)
+        res[feat.name] = stat[present]
+
+    return finalize_counts(pd.DataFrame(res), feats)
+
+
+@traced()
+def aggregate(df, feats, id_index=None):
+    """
+    compute all features sharing group cols in one grouped pass
+    keys keep the order of first appearance in df, same as drop_duplicates then left merge
+    :param df: DataFrame,
+    :param feats: list of AggFeat, all with the same group cols
+    :param id_index: IdIndex, group by dense codes instead of hashing the keys, None for a groupby
+    :return: DataFrame, group cols and one col per feature
+    """
+    keys = check_keys(feats)
+    if id_index is not None and not df[keys].isna().any().any():
+        return aggregate_codes(df, feats, id_index)
+
+    cols = get_masked_cols(df, feats)
+    key_cols = [df[key] for key in keys]
+
+    frame_cols, col_names = get_frame_cols(cols)
+
+    ops = {feat.name: (col_names[feat.name], 'sum' if feat.op == 'count' else feat.op) for feat in feats
+           if not is_hist_op(feat.op)}
+    # group size keeps every key even if all features are quantiles
+    ops['#rows'] = (col_names[feats[0].name], 'size')
+    df_agg = pd.DataFrame(frame_cols, index=df.index).groupby(key_cols, sort=False, dropna=False).agg(**ops)
+
+    # quantiles sharing mask and values come from one histogram
+    hist_feats = {}
+    for feat in feats:
+        if is_hist_op(feat.op):
+            key = (id(feat.mask), feat.val_col if isinstance(feat.val_col, str) else id(feat.val_col))
+            hist_feats.setdefault(key, []).append(feat)
+    for group in hist_feats.values():
+        df_hist = sketch.get_hist(df[keys], cols[group[0].name])
+        df_quantile = sketch.get_quantiles(df_hist, keys, {feat.name: sketch.QUANTILE_OPS[feat.op] for feat in group})
+        for feat in group:
+            df_agg[feat.name] = df_quantile[feat.name].reindex(df_agg.index)
+
+    df_agg = df_agg[[feat.name for feat in feats]].reset_index()
+    df_agg.columns = keys + [feat.name for feat in feats]
+
+    return finalize_counts(df_agg, feats)
@@ -0,0 +1,339 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 12:46
+# @author: agent
+# @contact: agent@local
+# @file: backends.py
+# @desc: dataframe backends running preprocess and feature families
+
+# packages
+import numpy as np
+import pandas as pd
+import utilities as utils
+import data_preprocess as prep
+import aggregation
+import sketch
+from aggregation import Mask, check_keys, finalize_counts, is_hist_op
+from logs import logger
+from logs.instrument import traced
+
+try:
+    import polars as pl
+except ImportError:  # polars backend is optional
+    pl = None
+
+
+# set global args
+origin_data_dir = 'data/origin'
+
+BACKENDS = ('pandas', 'polars')
+# backend in use, part of the stage cache key of feature families
+settings = {'backend': 'pandas'}
+# polars expression builders of value functions used in feature declarations
+value_exprs = {}
+
+
+def configure(backend='pandas'):
+    """
+    backend of preprocess and feature families, inputs and outputs are pandas DataFrame on every backend
+    polars translates AggFeat into lazy queries, masks must be aggregation.Mask
+    :param backend: string, pandas or polars
+    :return:
+    """
+    settings['backend'] = get_backend(backend)
+
+
+def get_backend(backend=None):
+    """
+    :param backend: string, default is configured backend
+    :return: string, validated backend
+    """
+    backend = settings['backend'] if backend is None else backend
+    if backend not in BACKENDS:
+        raise ValueError('backend must be one of {0}, got {1}.'.format(BACKENDS, backend))
+    if backend == 'polars' and pl is None:
+        raise ImportError('polars is required by the polars backend.')
+
+    return backend
+
+
+def register_value(func, builder):
+    """
+    register polars expression of a value function of feature declarations
+    :param func: callable(DataFrame) -> array, val_col of AggFeat
+    :param builder: callable() -> polars expression
+    :return:
+    """
+    value_exprs[func] = builder
+
+
+def day_number_expr(col):
+    """
+    yyyyMMdd col as polars date, same as date_utils.to_day_number
+    :param col: string,
+    :return: polars expression
+    """
+    dates = pl.col(col).cast(pl.Int64)
+
+    return pl.date(dates // 10000, dates // 100 % 100, dates % 100)
+
+
+def days_gap_expr(x, y):
+    """
+    days between two yyyyMMdd cols, -1 if any of them is missing, same as date_utils.get_days_gap
+    :param x: string, date_received
+    :param y: string, date_used
+    :return: polars expression
+    """
+    return (day_number_expr(y) - day_number_expr(x)).dt.total_days().fill_null(-1)
+
+
+def equal_expr(col, value):
+    """
+    indicator of col equal to value, null is 0
+    :param col: string,
+    :param value: scalar,
+    :return: polars expression
+    """
+    return (pl.col(col) == value).fill_null(False)
+
+
+def mask_expr(mask):
+    """
+    :param mask: Mask or None
+    :return: polars expression, boolean
+    """
+    if mask is None:
+        return pl.lit(True)
+    if not isinstance(mask, Mask):
+        raise ValueError('polars backend requires aggregation.Mask, got {0}.'.format(mask))
+
+    conds = [pl.col(col).is_not_null() for col in mask.not_null] + [pl.col(col).is_null() for col in mask.is_null]
+
+    return pl.all_horizontal(conds) if conds else pl.lit(True)
+
+
+def value_expr(val_col):
+    """
+    :param val_col: string or registered function
+    :return: polars expression, float64
+    """
+    if isinstance(val_col, str):
+        return pl.col(val_col).cast(pl.Float64)
+    if val_col not in value_exprs:
+        raise ValueError('value function {0} has no polars expression, see register_value.'.format(val_col))
+
+    return value_exprs[val_col]().cast(pl.Float64)
+
+
+def quantize_expr(values):
+    """
+    polars version of sketch.quantize
+    :param values: polars expression
+    :return: polars expression
+    """
+    accuracy = sketch.settings['accuracy']
+    gamma = (1 + accuracy) / (1 - accuracy)
+    buckets = (values.abs().log() / np.log(gamma)).ceil()
+    represent = pl.lit(gamma).pow(buckets) * 2 / (gamma + 1)
+
+    return pl.when(values == 0).then(values).otherwise(values.sign() * represent)
+
+
+def agg_expr(feat):
+    """
+    polars aggregation expression of one feature, rows out of mask are null
+    :param feat: AggFeat
+    :return: polars expression
+    """
+    mask = mask_expr(feat.mask)
+    if feat.op == 'count':
+        counts = pl.len() if feat.mask is None else mask.cast(pl.Int64).sum()  # literal cannot be aggregated
+        return counts.cast(pl.Int64).alias(feat.name)
+
+    values = pl.when(mask).then(value_expr(feat.val_col)).otherwise(None)
+    if feat.op == 'nunique':
+        # null is counted as a value by n_unique
+        return (values.n_unique().cast(pl.Int64) - values.is_null().any().cast(pl.Int64)).alias(feat.name)
+    if feat.op in ('sum', 'max', 'min', 'mean'):
+        return getattr(values, feat.op)().alias(feat.name)
+    if feat.op in sketch.QUANTILE_OPS:
+        values = quantize_expr(values) if is_hist_op(feat.op) and sketch.is_sketched() else values
+        return values.quantile(sketch.QUANTILE_OPS[feat.op], interpolation='linear').alias(feat.name)
+
+    raise ValueError('op {0} is not supported by polars backend.'.format(feat.op))
+
+
+def to_polars(df, cols):
+    """
+    :param df: DataFrame,
+    :param cols: list,
+    :return: polars DataFrame, NaN is null
+    """
+    return pl.from_pandas(df[cols], nan_to_null=True)
+
+
+def restore_dtypes(df_res, df, cols):
+    """
+    cast cols back to the dtypes of pandas input
+    :param df_res: DataFrame, converted from polars
+    :param df: DataFrame, pandas input
+    :param cols: list,
+    :return: DataFrame
+    """
+    for col in cols:
+        if df_res[col].dtype != df[col].dtype:
+            df_res[col] = df_res[col].astype(df[col].dtype)
+
+    return df_res
+
+
+def get_used_cols(df, feats):
+    """
+    cols referenced by keys, masks and string values of features
+    :param df: DataFrame,
+    :param feats: list of AggFeat
+    :return: list, in the order of df
+    """
+    used = set()
+    for feat in feats:
+        used.update(feat.keys)
+        if isinstance(feat.mask, Mask):
+            used.update(feat.mask.not_null + feat.mask.is_null)
+        if isinstance(feat.val_col, str):
+            used.add(feat.val_col)
+    if any(callable(feat.val_col) for feat in feats):  # registered expressions may use any col
+        return list(df.columns)
+
+    return [col for col in df.columns if col in used]
+
+
+def aggregate_polars(df, feats):
+    """
+    polars version of aggregation.aggregate, one lazy group by with keys in order of first appearance
+    :param df: DataFrame,
+    :param feats: list of AggFeat
+    :return: DataFrame, group cols and one col per feature
+    """
+    keys = check_keys(feats)
+    df_agg = to_polars(df, get_used_cols(df, feats)).lazy() \
+        .group_by(keys, maintain_order=True) \
+        .agg([agg_expr(feat) for feat in feats]) \
+        .collect() \
+        .to_pandas()
+
+    return finalize_counts(restore_dtypes(df_agg, df, keys), feats)
+
+
+@traced()
+def aggregate(df, feats, id_index=None, backend=None):
+    """
+    aggregate features with the chosen backend
+    :param df: DataFrame,
+    :param feats: list of AggFeat, all with the same group cols
+    :param id_index: IdIndex, only used by pandas backend
+    :param backend: string, default is configured backend
+    :return: DataFrame, group cols and one col per feature
+    """
+    if get_backend(backend) == 'polars':
+        return aggregate_polars(df, feats)
+
+    return aggregation.aggregate(df, feats, id_index=id_index)
+
+
+def get_new_feats_polars(df):
+    """
+    polars version of data_preprocess.get_new_feats, discount is parsed once per distinct value and joined back
+    :param df: DataFrame,
+    :return: DataFrame, new frame with the index of df
+    """
+    parsers = [('is_full_reduction', prep.is_full_reduction),
+               ('full_cond', prep.get_full_reduction_cond),
+               ('full_save', prep.get_full_reduction_save),
+               ('discount_rate', prep.get_discount_rate)]
+
+    # parsers see str of each value, so missing values are parsed as 'nan' like in pandas
+    discounts = df['discount_rate'].astype(str).to_numpy()
+    uniques = pd.unique(discounts)
+    df_lookup = pl.DataFrame([pl.Series('#discount', uniques, dtype=pl.Utf8)] + [
+        pl.Series(col, [parser(v) for v in uniques], dtype=pl.Float64 if col == 'discount_rate' else pl.Int64)
+        for col, parser in parsers])
+
+    cols = [col for col in df.columns if col != 'discount_rate']
+    df_res = to_polars(df, cols).lazy() \
+        .with_columns(pl.Series('#discount', discounts, dtype=pl.Utf8)) \
+        .join(df_lookup.lazy(), on='#discount', how='left') \
+        .with_columns(pl.col('distance').fill_null(-1).cast(pl.Int64)) \
+        .select(list(df.columns) + [col for col, _ in parsers[:-1]]) \
+        .collect() \
+        .to_pandas()
+    df_res.index = df.index
+
+    return restore_dtypes(df_res, df, [col for col in df.columns if col not in ('discount_rate', 'distance')])
+
+
+@traced()
+def get_new_feats(df, backend=None):
+    """
+    preprocess with the chosen backend
+    :param df: DataFrame
+    :param backend: string, default is configured backend
+    :return: DataFrame
+    """
+    if get_backend(backend) == 'polars':
+        return get_new_feats_polars(df)
+
+    return prep.get_new_feats(df)
+
+
+@traced()
+def check_parity(df, backend='polars', families=None, rtol=1e-9):
+    """
+    compare preprocess and feature families of a backend with pandas
+    :param df: DataFrame, offline data with renamed cols
+    :param backend: string,
+    :param families: list, (name, features, post process function), default is feature_engineering.FAMILIES
+    :param rtol: float, relative tolerance of float cols
+    :return: dict, stage -> None if equal, otherwise the difference
+    """
+    import feature_engineering as fe
+
+    if families is None:
+        families = [(post_func.__name__, feats, post_func) for feats, post_func, _ in fe.FAMILIES]
+
+    res = {}
+    df_pandas = get_new_feats(df.copy(), backend='pandas')
+    df_other = get_new_feats(df.copy(), backend=backend)
+    stages = [('get_new_feats', df_pandas, df_other)]
+    for name, feats, post_func in families:
+        stages.append((name, post_func(aggregate(df_pandas, feats, backend='pandas')),
+                       post_func(aggregate(df_pandas, feats, backend=backend))))
+
+    for name, expected, actual in stages:
+        try:
+            pd.testing.assert_frame_equal(expected, actual, check_dtype=False, rtol=rtol)
+            res[name] = None
+        except AssertionError as e:
+            res[name] = str(e)
+        logger.info('{0} parity of {1}: {2}'.format(backend, name, 'ok' if res[name] is None else res[name]))
+
+    return res
+
+
+@traced()
+def main():
+    """
+    check parity of every available backend on offline train set
+    :return:
+    """
+    df = utils.read_data(file_name='ccf_offline_stage1_train.csv', data_dir=origin_data_dir, is_sample=True)
+    for backend in BACKENDS[1:]:
+        if backend == 'polars' and pl is None:
+            logger.info('polars is not installed, parity check is skipped')
+            continue
+        check_parity(df, backend)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,7 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 12:28
+# @author: agent
+# @contact: agent@local
+# @file: __init__.py
+# @desc: benchmarks on synthetic data, run with python -m benchmarks.run_benchmarks --rows 100000 --output bench.json
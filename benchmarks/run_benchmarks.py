@@ -0,0 +1,478 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 12:28
+# @author: agent
+# @contact: agent@local
+# @file: run_benchmarks.py
+# @desc: time every public function of the pipeline on synthetic data, record peak RSS and allocations
+
+import os
+import sys
+import json
+import time
+import shutil
+import inspect
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import tracemalloc
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utilities as utils  # noqa: E402
+import data_preprocess as prep  # noqa: E402
+import feature_engineering as fe  # noqa: E402
+from id_index import IdIndex  # noqa: E402
+from benchmarks.synthetic import gen_offline_data, gen_online_data  # noqa: E402
+
+
+TRAIN_FILE = 'ccf_offline_stage1_train.csv'
+TEST_FILE = 'ccf_offline_stage1_test_revised.csv'
+TEST_COLS = ['user_id', 'merchant_id', 'coupon_id', 'discount_rate', 'distance', 'date_received']
+ONLINE_FILE = 'ccf_online_stage1_train.csv'
+BENCH_MODULES = [utils, prep, fe]
+
+# one benchmark case
+# name: string, module.function, with a suffix for variants
+# func: callable, called with the args from make_args
+# make_args: callable(Context) -> tuple of args and kwargs, not timed
+BenchCase = namedtuple('BenchCase', ['name', 'func', 'make_args'])
+
+
+class Context(object):
+    """
+    data shared by benchmark cases of one scale, every case gets its own copy
+    """
+
+    def __init__(self, data_dir, out_dir):
+        self.data_dir = data_dir
+        self.out_dir = out_dir
+        self.train = utils.read_data(TRAIN_FILE, data_dir=data_dir)
+        self.test = utils.read_data(TEST_FILE, rename_col=TEST_COLS, data_dir=data_dir)
+        self.prep = prep.get_new_feats(self.train.copy())
+        self.merchant = fe.aggregate(self.prep, fe.MERCHANT_FEATS)
+        self.user = fe.aggregate(self.prep, fe.USER_FEATS)
+        self.user_merchant = fe.aggregate(self.prep, fe.USER_MERCHANT_FEATS)
+        self.train_path = os.path.join(data_dir, TRAIN_FILE)
+        self.cache_path, self.meta_path = utils.get_cache_path(self.train_path, utils.RAW_COLS, True)
+        self.online = utils.read_data(ONLINE_FILE, rename_col=utils.ONLINE_COLS, data_dir=data_dir,
+                                      usecols=fe.ONLINE_USECOLS)
+        self.online_feats = fe.aggregate(self.online, fe.ONLINE_FEATS)
+        # layouts written once, read back by load cases
+        utils.save_data(self.prep, 'bench_load', out_dir, fmt='parquet')
+        utils.save_data(self.prep, 'bench_load_part', out_dir, compression='gzip', partition_by='user_id')
+
+    def coupon_rows(self):
+        return self.train[(~self.train['coupon_id'].isna()) & (~self.train['date_received'].isna())].copy()
+
+    def arrow_table(self, typed=True):
+        read_options, convert_options = utils.get_arrow_options(utils.RAW_COLS, typed, None)
+        return utils.pa_csv.read_csv(self.train_path, read_options=read_options, convert_options=convert_options)
+
+    def online_chunks(self):
+        return utils.read_data(ONLINE_FILE, rename_col=utils.ONLINE_COLS, data_dir=self.data_dir,
+                               chunksize=200000, usecols=fe.ONLINE_USECOLS)
+
+    def tmp_file(self, name):
+        path = os.path.join(self.out_dir, '.{0}-{1}'.format(name, time.time_ns()))
+        with open(path, 'w') as f:
+            f.write(name)
+        return path
+
+
+class PeakRSS(object):
+    """
+    sample resident set size in a background thread to get the peak of one stage
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak = 0
+        self.running = False
+        self.thread = None
+
+    @staticmethod
+    def get_rss():
+        """
+        :return: int, bytes of resident memory, 0 if not supported
+        """
+        try:
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        except (OSError, ValueError):
+            return 0
+
+    def sample(self):
+        while self.running:
+            self.peak = max(self.peak, self.get_rss())
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        self.start = self.peak = self.get_rss()
+        self.running = True
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.running = False
+        self.thread.join()
+        self.peak = max(self.peak, self.get_rss())
+
+
+def consume(res):
+    """
+    exhaust generators so lazy functions are timed
+    :param res: object
+    :return: object, number of rows for generators of DataFrame
+    """
+    if inspect.isgenerator(res):
+        return sum(len(item) for item in res)
+
+    return res
+
+
+def set_globals(ctx):
+    """
+    module globals normally set in __main__ blocks
+    :param ctx: Context
+    :return:
+    """
+    prep.original_data_dir = ctx.data_dir
+    prep.prep_data_dir = ctx.out_dir
+    fe.origin_data_dir = ctx.data_dir
+    fe.feat_data_fir = ctx.out_dir
+
+
+def get_cases():
+    """
+    benchmark cases of public functions, scalar functions are benchmarked the way they are applied on columns
+    :return: list of BenchCase
+    """
+    def apply(func, col):
+        return lambda df: df[col].apply(func)
+
+    def apply_pair(func, x, y):
+        return lambda df: [func(a, b) for a, b in zip(df[x], df[y])]
+
+    def grp(ctx, cols, val_col=None):
+        df = ctx.prep[~ctx.prep.date.isna()]
+        return df[cols + ([val_col] if val_col else [])].copy()
+
+    return [
+        # utilities
+        BenchCase('utilities.read_data', utils.read_data,
+                  lambda c: ((TRAIN_FILE,), {'data_dir': c.data_dir, 'use_cache': False})),
+        BenchCase('utilities.read_data[c]', utils.read_data,
+                  lambda c: ((TRAIN_FILE,), {'data_dir': c.data_dir, 'use_cache': False, 'engine': 'c'})),
+        BenchCase('utilities.read_data[usecols]', utils.read_data,
+                  lambda c: ((TRAIN_FILE,), {'data_dir': c.data_dir, 'use_cache': False,
+                                             'usecols': ['user_id', 'merchant_id', 'date']})),
+        BenchCase('utilities.read_data[untyped]', utils.read_data,
+                  lambda c: ((TRAIN_FILE,), {'data_dir': c.data_dir, 'use_cache': False, 'typed': False})),
+        BenchCase('utilities.read_data[cache]', utils.read_data,
+                  lambda c: ((TRAIN_FILE,), {'data_dir': c.data_dir})),
+        BenchCase('utilities.read_data_chunks', utils.read_data_chunks,
+                  lambda c: ((c.train_path, utils.RAW_COLS, 200000), {})),
+        BenchCase('utilities.read_csv', utils.read_csv, lambda c: ((c.train_path, utils.RAW_COLS), {})),
+        BenchCase('utilities.iter_csv_arrow', utils.iter_csv_arrow,
+                  lambda c: ((c.train_path, utils.RAW_COLS, 200000), {})),
+        BenchCase('utilities.save_data', utils.save_data, lambda c: ((c.prep.copy(), 'bench_save', c.out_dir), {})),
+        BenchCase('utilities.save_data_chunks', utils.save_data_chunks,
+                  lambda c: ((utils.read_data(TRAIN_FILE, data_dir=c.data_dir, chunksize=200000),
+                              'bench_save_chunks', c.out_dir), {})),
+        BenchCase('utilities.get_file_hash', utils.get_file_hash, lambda c: ((c.train_path,), {})),
+        BenchCase('utilities.get_cache_path', utils.get_cache_path,
+                  lambda c: ((c.train_path, utils.RAW_COLS, True), {})),
+        BenchCase('utilities.check_cache', utils.check_cache,
+                  lambda c: ((c.train_path, c.cache_path, c.meta_path), {})),
+        BenchCase('utilities.load_cache', utils.load_cache,
+                  lambda c: ((c.train_path, c.cache_path, c.meta_path), {})),
+        BenchCase('utilities.save_cache', utils.save_cache,
+                  lambda c: ((c.train.copy(), c.train_path, c.cache_path, c.meta_path), {})),
+        BenchCase('utilities.get_month', apply(utils.get_month, 'date'),
+                  lambda c: ((c.train.astype({'date': float}),), {})),
+        BenchCase('utilities.get_day', apply(utils.get_day, 'date'),
+                  lambda c: ((c.train.astype({'date': float}),), {})),
+        BenchCase('utilities.get_diff_btw_dates', apply_pair(utils.get_diff_btw_dates, 'date_received', 'date'),
+                  lambda c: ((c.train.astype({'date': float, 'date_received': float}),), {})),
+        BenchCase('utilities.add_agg_feat_names', utils.add_agg_feat_names,
+                  lambda c: ((c.prep[['merchant_id']].drop_duplicates(), grp(c, ['merchant_id'], 'distance'),
+                              ['merchant_id'], 'distance', fe.AGG_OPTS, ['a', 'b', 'c', 'd']), {})),
+        BenchCase('utilities.add_agg_feats', utils.add_agg_feats,
+                  lambda c: ((c.prep[['merchant_id']].drop_duplicates(), grp(c, ['merchant_id'], 'distance'),
+                              ['merchant_id'], 'distance', fe.AGG_OPTS, 'm'), {})),
+        BenchCase('utilities.downcast', utils.downcast, lambda c: ((c.user.copy(),), {})),
+        BenchCase('utilities.get_engine', utils.get_engine, lambda c: ((), {})),
+        BenchCase('utilities.get_csv_kwargs', utils.get_csv_kwargs, lambda c: ((utils.RAW_COLS, True, None), {})),
+        BenchCase('utilities.get_arrow_type', utils.get_arrow_type, lambda c: (('Int32',), {})),
+        BenchCase('utilities.get_arrow_options', utils.get_arrow_options,
+                  lambda c: ((utils.RAW_COLS, True, None), {})),
+        BenchCase('utilities.fix_arrow_table', utils.fix_arrow_table, lambda c: ((c.arrow_table(), True), {})),
+        BenchCase('utilities.arrow_to_pandas', utils.arrow_to_pandas,
+                  lambda c: ((utils.fix_arrow_table(c.arrow_table(), True), True), {})),
+        BenchCase('utilities.get_save_ext', utils.get_save_ext, lambda c: (('csv', 'gzip'), {})),
+        BenchCase('utilities.get_partitions', utils.get_partitions, lambda c: ((c.prep, 'user_id'), {})),
+        BenchCase('utilities.get_partitions[month]', utils.get_partitions, lambda c: ((c.prep, 'month'), {})),
+        BenchCase('utilities.write_file', utils.write_file,
+                  lambda c: ((c.prep, os.path.join(c.out_dir, 'bench_write.parquet'), 'parquet'), {})),
+        BenchCase('utilities.save_data[partition]', utils.save_data,
+                  lambda c: ((c.prep.copy(), 'bench_save_part', c.out_dir), {'fmt': 'parquet',
+                                                                            'partition_by': 'user_id'})),
+        BenchCase('utilities.replace_path', utils.replace_path,
+                  lambda c: ((c.tmp_file('bench_replace'), os.path.join(c.out_dir, 'bench_replace')), {})),
+        BenchCase('utilities.load_data', utils.load_data, lambda c: (('bench_load', c.out_dir), {})),
+        BenchCase('utilities.load_data[csv_partition]', utils.load_data,
+                  lambda c: (('bench_load_part', c.out_dir), {'fmt': 'csv', 'compression': 'gzip'})),
+        BenchCase('utilities.read_csv_partitions', utils.read_csv_partitions,
+                  lambda c: ((os.path.join(c.out_dir, 'bench_load_part'), '.csv.gz'), {})),
+        BenchCase('utilities.get_partition_value', utils.get_partition_value, lambda c: (('12',), {})),
+        BenchCase('utilities.add_count_new_feats', utils.add_count_new_feats,
+                  lambda c: ((c.prep[['merchant_id']].drop_duplicates(), grp(c, ['merchant_id']), 'merchant_id',
+                              'm_total_sales'), {})),
+        # data_preprocess
+        BenchCase('data_preprocess.get_discount_rate', apply(prep.get_discount_rate, 'discount_rate'),
+                  lambda c: ((c.train.astype({'discount_rate': object}),), {})),
+        BenchCase('data_preprocess.is_full_reduction', apply(prep.is_full_reduction, 'discount_rate'),
+                  lambda c: ((c.train.astype({'discount_rate': object}),), {})),
+        BenchCase('data_preprocess.get_full_reduction_cond', apply(prep.get_full_reduction_cond, 'discount_rate'),
+                  lambda c: ((c.train.astype({'discount_rate': object}),), {})),
+        BenchCase('data_preprocess.get_full_reduction_save', apply(prep.get_full_reduction_save, 'discount_rate'),
+                  lambda c: ((c.train.astype({'discount_rate': object}),), {})),
+        BenchCase('data_preprocess.get_label', apply_pair(prep.get_label, 'date_received', 'date'),
+                  lambda c: ((c.train.astype({'date': float, 'date_received': float}),), {})),
+        BenchCase('data_preprocess.parse_discount_rate', prep.parse_discount_rate,
+                  lambda c: ((c.train['discount_rate'],), {})),
+        BenchCase('data_preprocess.get_new_feats', prep.get_new_feats, lambda c: ((c.train.copy(),), {})),
+        BenchCase('data_preprocess.get_new_label', prep.get_new_label, lambda c: ((c.prep.copy(),), {})),
+        BenchCase('data_preprocess.main', prep.main, lambda c: ((), {})),
+        # feature_engineering
+        BenchCase('feature_engineering.get_day_gap', fe.get_day_gap, lambda c: ((c.prep,), {})),
+        BenchCase('feature_engineering.add_merchant_rate_feats', fe.add_merchant_rate_feats,
+                  lambda c: ((c.merchant.copy(),), {})),
+        BenchCase('feature_engineering.add_user_rate_feats', fe.add_user_rate_feats, lambda c: ((c.user.copy(),), {})),
+        BenchCase('feature_engineering.add_user_merchant_rate_feats', fe.add_user_merchant_rate_feats,
+                  lambda c: ((c.user_merchant.copy(),), {})),
+        BenchCase('feature_engineering.get_merchant_feats', fe.get_merchant_feats, lambda c: ((c.prep,), {})),
+        BenchCase('feature_engineering.get_user_feats', fe.get_user_feats, lambda c: ((c.prep,), {})),
+        BenchCase('feature_engineering.get_user_merchant_feats', fe.get_user_merchant_feats,
+                  lambda c: ((c.prep,), {})),
+        BenchCase('feature_engineering.get_receipt_feats', fe.get_receipt_feats, lambda c: ((c.prep,), {})),
+        BenchCase('feature_engineering.get_family_feats', fe.get_family_feats, lambda c: ((c.prep,), {})),
+        BenchCase('feature_engineering.is_click', fe.is_click, lambda c: ((c.online,), {})),
+        BenchCase('feature_engineering.is_buy', fe.is_buy, lambda c: ((c.online,), {})),
+        BenchCase('feature_engineering.is_fixed_buy', fe.is_fixed_buy, lambda c: ((c.online,), {})),
+        BenchCase('feature_engineering.add_online_rate_feats', fe.add_online_rate_feats,
+                  lambda c: ((c.online_feats.copy(),), {})),
+        BenchCase('feature_engineering.get_online_feats', fe.get_online_feats, lambda c: ((c.online_chunks(),), {})),
+        BenchCase('feature_engineering.take_feats', fe.take_feats,
+                  lambda c: ((c.user.drop(columns=['user_id']), np.arange(len(c.user))[::-1]), {})),
+        BenchCase('feature_engineering.join_lean', fe.join_lean,
+                  lambda c: ((c.prep, [(c.merchant, ['merchant_id']), (c.user, ['user_id']),
+                                       (c.user_merchant, ['user_id', 'merchant_id'])]), {})),
+        BenchCase('feature_engineering.basic_feature_version', fe.basic_feature_version,
+                  lambda c: ((c.coupon_rows(), True), {})),
+        BenchCase('feature_engineering.relation_feature_version', fe.relation_feature_version,
+                  lambda c: ((c.coupon_rows(), True), {})),
+        BenchCase('feature_engineering.relation_feature_version[lean]', fe.relation_feature_version,
+                  lambda c: ((c.coupon_rows(), True), {'lean': True})),
+        BenchCase('feature_engineering.relation_feature_version[id_index]', fe.relation_feature_version,
+                  lambda c: ((c.coupon_rows(), True), {'id_index': IdIndex().update(c.train)})),
+        BenchCase('feature_engineering.export_feats', fe.export_feats,
+                  lambda c: ((c.prep.drop(columns=['date']), prep.get_new_feats(c.test.copy()), 'bench'),
+                             {'data_dir': c.out_dir})),
+        BenchCase('feature_engineering.basic_feature_generator', fe.basic_feature_generator,
+                  lambda c: ((fe.basic_feature_version,), {})),
+        BenchCase('feature_engineering.relation_feature_generator', fe.relation_feature_generator,
+                  lambda c: ((fe.relation_feature_version,), {'use_online': True, 'export_fmt': 'npy'})),
+        BenchCase('feature_engineering.main', fe.main, lambda c: ((), {})),
+    ]
+
+
+def get_public_funcs():
+    """
+    public functions defined in benchmarked modules
+    :return: list, names like module.function
+    """
+    names = []
+    for module in BENCH_MODULES:
+        for name, obj in inspect.getmembers(module, inspect.isfunction):
+            if not name.startswith('_') and obj.__module__ == module.__name__:
+                names.append('{0}.{1}'.format(module.__name__, name))
+
+    return names
+
+
+def run_case(case, ctx, trace_alloc=False):
+    """
+    run one case and measure it
+    :param case: BenchCase
+    :param ctx: Context
+    :param trace_alloc: boolean, run once more under tracemalloc to record allocations
+    :return: dict
+    """
+    args, kwargs = case.make_args(ctx)
+    rows_in = next((len(arg) for arg in args if isinstance(arg, (pd.DataFrame, pd.Series))), None)
+
+    with PeakRSS() as rss:
+        t0 = time.perf_counter()
+        res = consume(case.func(*args, **kwargs))
+        seconds = time.perf_counter() - t0
+
+    record = {
+        'name': case.name,
+        'seconds': round(seconds, 6),
+        'rss_start_mb': round(rss.start / 2 ** 20, 3),
+        'rss_peak_mb': round(rss.peak / 2 ** 20, 3),
+        'rss_delta_mb': round((rss.peak - rss.start) / 2 ** 20, 3),
+        'rows_in': rows_in,
+        'rows_out': len(res) if isinstance(res, (pd.DataFrame, pd.Series, list)) else None,
+    }
+    del res
+
+    if trace_alloc:
+        args, kwargs = case.make_args(ctx)
+        tracemalloc.start()
+        consume(case.func(*args, **kwargs))
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        record['alloc_peak_mb'] = round(peak / 2 ** 20, 3)
+        record['alloc_retained_mb'] = round(current / 2 ** 20, 3)
+
+    return record
+
+
+def get_version():
+    """
+    :return: dict, code and library versions results were measured with
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=root,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    return {'commit': commit, 'python': platform.python_version(), 'pandas': pd.__version__,
+            'numpy': np.__version__, 'machine': platform.machine(), 'cpus': os.cpu_count()}
+
+
+def run_benchmarks(scales, cases=None, trace_alloc=False, keep_data=False, pattern=None):
+    """
+    run benchmark cases on synthetic data of each scale
+    :param scales: list of int, rows of synthetic train set
+    :param cases: list of BenchCase, default is get_cases()
+    :param trace_alloc: boolean,
+    :param keep_data: boolean, keep generated data in temp dir
+    :param pattern: string, only run cases whose name contains it
+    :return: dict, machine-readable results
+    """
+    cases = get_cases() if cases is None else cases
+    if pattern:
+        cases = [case for case in cases if pattern in case.name]
+    covered = set(case.name.split('[')[0] for case in cases)
+
+    results = {'version': get_version(), 'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+               'not_covered': sorted(set(get_public_funcs()) - covered) if not pattern else [],
+               'scales': []}
+    for n_rows in scales:
+        work_dir = tempfile.mkdtemp(prefix='o2o_bench_')
+        data_dir = os.path.join(work_dir, 'origin')
+        out_dir = os.path.join(work_dir, 'out')
+        os.makedirs(out_dir)
+        try:
+            t0 = time.perf_counter()
+            gen_offline_data(data_dir, n_rows)
+            gen_online_data(data_dir, n_rows)
+            gen_seconds = time.perf_counter() - t0
+
+            ctx = Context(data_dir, out_dir)
+            set_globals(ctx)
+            records = []
+            for case in cases:
+                try:
+                    record = run_case(case, ctx, trace_alloc=trace_alloc)
+                except Exception as e:  # keep benchmarking other cases, failure is part of the results
+                    record = {'name': case.name, 'error': '{0}: {1}'.format(type(e).__name__, e)}
+                    print('[{0}] {1}: failed with {2}'.format(n_rows, case.name, record['error']))
+                else:
+                    print('[{0}] {1}: {2}s, peak rss {3}MB'.format(n_rows, case.name, record['seconds'],
+                                                                   record['rss_peak_mb']))
+                records.append(record)
+            results['scales'].append({'rows': n_rows, 'gen_seconds': round(gen_seconds, 3), 'cases': records})
+        finally:
+            if not keep_data:
+                shutil.rmtree(work_dir, ignore_errors=True)
+
+    return results
+
+
+def compare(old, new, threshold=0.2):
+    """
+    compare two result files, a case regresses if it is slower by more than threshold
+    :param old: dict, results of base version
+    :param new: dict, results of new version
+    :param threshold: float, relative slow down
+    :return: list of dict, regressions
+    """
+    def index(results):
+        return {(scale['rows'], case['name']): case for scale in results['scales'] for case in scale['cases']}
+
+    old_cases = index(old)
+    regressions = []
+    for key, case in index(new).items():
+        if key not in old_cases or not old_cases[key].get('seconds') or 'seconds' not in case:
+            continue
+        ratio = case['seconds'] / old_cases[key]['seconds']
+        if ratio > 1 + threshold:
+            regressions.append({'rows': key[0], 'name': key[1], 'old_seconds': old_cases[key]['seconds'],
+                                'new_seconds': case['seconds'], 'ratio': round(ratio, 3)})
+
+    return regressions
+
+
+def main():
+    """
+    main function
+    :return:
+    """
+    parser = argparse.ArgumentParser(description='benchmark of o2o coupon preprocess and feature pipeline')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100000], help='rows of synthetic train set')
+    parser.add_argument('--output', default='bench_results.json', help='path of json results')
+    parser.add_argument('--trace-alloc', action='store_true', help='record allocations with tracemalloc')
+    parser.add_argument('--filter', default=None, help='only run cases whose name contains it')
+    parser.add_argument('--keep-data', action='store_true', help='keep generated data')
+    parser.add_argument('--compare', default=None, help='json results of base version to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2, help='relative slow down regarded as regression')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.rows, trace_alloc=args.trace_alloc, keep_data=args.keep_data,
+                             pattern=args.filter)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('results are saved to {0}'.format(args.output))
+
+    # a failed case or a public function without case fails the run like a regression
+    failed = [case['name'] for scale in results['scales'] for case in scale['cases'] if 'error' in case]
+    for name in failed:
+        print('FAILED', name)
+    for name in results['not_covered']:
+        print('NOT COVERED', name)
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(json.load(f), results, threshold=args.threshold)
+        for regression in regressions:
+            print('REGRESSION', regression)
+    if failed or results['not_covered'] or regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+
+    main()
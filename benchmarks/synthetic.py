@@ -0,0 +1,153 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 12:28
+# @author: agent
+# @contact: agent@local
+# @file: synthetic.py
+# @desc: synthetic data with the schema of ccf_offline_stage1_train, ccf_offline_stage1_test_revised and ccf_online_stage1_train
+
+import os
+import numpy as np
+import pandas as pd
+
+
+# raw header of offline data
+TRAIN_HEADER = ['User_id', 'Merchant_id', 'Coupon_id', 'Discount_rate', 'Distance', 'Date_received', 'Date']
+TEST_HEADER = TRAIN_HEADER[:-1]
+ONLINE_HEADER = ['User_id', 'Merchant_id', 'Action', 'Coupon_id', 'Discount_rate', 'Date_received', 'Date']
+
+# ratios close to the 1.75M rows of ccf_offline_stage1_train
+USER_RATIO = 0.31  # distinct users per row
+MERCHANT_RATIO = 0.005  # distinct merchants per row
+COUPON_RATIO = 0.0055  # distinct coupons per row
+COUPON_RATE = 0.6  # rows with coupon received
+USED_RATE = 0.07  # coupons used
+DISTANCE_NULL_RATE = 0.06
+# online actions are click 0, buy 1 and receive coupon 2
+ONLINE_ACTION_RATES = [0.6, 0.25, 0.15]
+FIXED_RATE = 0.05  # buys of fixed price deals
+
+DISCOUNTS = np.array(['0.95', '0.9', '0.8', '0.5', '20:1', '20:5', '30:5', '50:5', '50:10', '100:10',
+                      '100:20', '150:20', '200:20', '200:30', '300:30', 'null'])
+FIRST_DAY = np.datetime64('2016-01-01')
+RECEIVED_DAYS = 166  # 20160101 - 20160615
+LAST_DAY = np.datetime64('2016-06-30')
+
+
+def to_yyyymmdd(days):
+    """
+    days since FIRST_DAY to yyyyMMdd strings
+    :param days: ndarray, int
+    :return: ndarray, string
+    """
+    dates = (FIRST_DAY + days.astype('timedelta64[D]')).astype(str)
+
+    return np.char.replace(dates, '-', '')
+
+
+def gen_chunk(n_rows, total_rows, seed, is_test=False):
+    """
+    generate one chunk of raw offline data
+    :param n_rows: int, rows of chunk
+    :param total_rows: int, rows of the whole file, decides the number of users, merchants and coupons
+    :param seed: int,
+    :param is_test: boolean, test set has no date col and every row has coupon
+    :return: DataFrame, with raw header, nulls are written as 'null'
+    """
+    rng = np.random.default_rng(seed)
+    n_users = max(int(total_rows * USER_RATIO), 1)
+    n_merchants = max(int(total_rows * MERCHANT_RATIO), 1)
+    n_coupons = max(int(total_rows * COUPON_RATIO), 1)
+
+    # skewed ids, a few users and merchants are much more active
+    user_id = (rng.zipf(1.3, n_rows) % n_users) + 1
+    merchant_id = (rng.zipf(1.2, n_rows) % n_merchants) + 1
+    has_coupon = np.ones(n_rows, dtype=bool) if is_test else rng.random(n_rows) < COUPON_RATE
+
+    coupon_id = np.where(has_coupon, (rng.integers(0, n_coupons, n_rows) + 1).astype(str), 'null')
+    discount = DISCOUNTS[rng.integers(0, len(DISCOUNTS) - 1, n_rows)]
+    discount_rate = np.where(has_coupon, discount, 'null')
+    distance = np.where(rng.random(n_rows) < DISTANCE_NULL_RATE, 'null', rng.integers(0, 11, n_rows).astype(str))
+
+    received = rng.integers(0, RECEIVED_DAYS, n_rows)
+    date_received = np.where(has_coupon, to_yyyymmdd(received), 'null')
+
+    df = pd.DataFrame({'User_id': user_id, 'Merchant_id': merchant_id, 'Coupon_id': coupon_id,
+                       'Discount_rate': discount_rate, 'Distance': distance, 'Date_received': date_received})
+    if is_test:
+        return df
+
+    # used coupon is paid within 0-30 days, row without coupon is a normal transaction
+    max_day = (LAST_DAY - FIRST_DAY).astype(int)
+    used = np.minimum(received + rng.integers(0, 31, n_rows), max_day)
+    paid = rng.integers(0, max_day + 1, n_rows)
+    is_used = has_coupon & (rng.random(n_rows) < USED_RATE)
+    df['Date'] = np.where(is_used, to_yyyymmdd(used), np.where(has_coupon, 'null', to_yyyymmdd(paid)))
+
+    return df
+
+
+def gen_offline_data(data_dir, n_rows, seed=10, chunk_sz=1000000, n_test_rows=None):
+    """
+    write synthetic ccf_offline_stage1_train.csv and ccf_offline_stage1_test_revised.csv
+    rows are generated chunk by chunk, so 50M rows can be written with bounded memory
+    :param data_dir: string,
+    :param n_rows: int, rows of train set
+    :param seed: int,
+    :param chunk_sz: int,
+    :param n_test_rows: int, rows of test set, default is n_rows / 15 like the original data
+    :return: tuple, paths of train and test set
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    n_test_rows = max(n_rows // 15, 1) if n_test_rows is None else n_test_rows
+
+    paths = []
+    for file_name, rows, is_test in [('ccf_offline_stage1_train.csv', n_rows, False),
+                                     ('ccf_offline_stage1_test_revised.csv', n_test_rows, True)]:
+        path = os.path.join(data_dir, file_name)
+        for i, offset in enumerate(range(0, rows, chunk_sz)):
+            df = gen_chunk(min(chunk_sz, rows - offset), rows, seed + i + (10 ** 6 if is_test else 0), is_test)
+            df.to_csv(path, index=False, mode='w' if i == 0 else 'a', header=(i == 0))
+        paths.append(path)
+
+    return tuple(paths)
+
+
+def gen_online_data(data_dir, n_rows, n_offline_rows=None, seed=10):
+    """
+    write synthetic ccf_online_stage1_train.csv, users overlap with users of gen_offline_data
+    :param data_dir: string,
+    :param n_rows: int, rows of online data
+    :param n_offline_rows: int, rows of the offline train set, decides the number of users, default is n_rows
+    :param seed: int,
+    :return: string, path of online data
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    rng = np.random.default_rng(seed + 2 * 10 ** 6)
+    n_users = max(int((n_rows if n_offline_rows is None else n_offline_rows) * USER_RATIO), 1)
+    n_merchants = max(int(n_rows * MERCHANT_RATIO), 1)
+    n_coupons = max(int(n_rows * COUPON_RATIO), 1)
+
+    user_id = (rng.zipf(1.3, n_rows) % n_users) + 1
+    merchant_id = (rng.zipf(1.2, n_rows) % n_merchants) + 1
+    action = rng.choice(3, n_rows, p=ONLINE_ACTION_RATES)
+    is_fixed = (action == 1) & (rng.random(n_rows) < FIXED_RATE)
+    # coupons are received by action 2 and used by some buys
+    received = rng.integers(0, RECEIVED_DAYS, n_rows)
+    is_used = (action == 1) & ~is_fixed & (rng.random(n_rows) < USED_RATE)
+    has_coupon = (action == 2) | is_used
+    coupon_id = np.where(is_fixed, 'fixed', np.where(has_coupon, (rng.integers(0, n_coupons, n_rows) + 1).astype(str),
+                                                     'null'))
+    discount_rate = np.where(is_fixed, 'fixed', np.where(has_coupon, DISCOUNTS[rng.integers(0, len(DISCOUNTS) - 1,
+                                                                                            n_rows)], 'null'))
+    max_day = (LAST_DAY - FIRST_DAY).astype(int)
+    used = np.minimum(received + rng.integers(0, 31, n_rows), max_day)
+    date = np.where(action == 1, to_yyyymmdd(np.where(is_used, used, rng.integers(0, max_day + 1, n_rows))), 'null')
+
+    df = pd.DataFrame({'User_id': user_id, 'Merchant_id': merchant_id, 'Action': action, 'Coupon_id': coupon_id,
+                       'Discount_rate': discount_rate,
+                       'Date_received': np.where(has_coupon, to_yyyymmdd(received), 'null'), 'Date': date})
+    path = os.path.join(data_dir, 'ccf_online_stage1_train.csv')
+    df.to_csv(path, index=False)
+
+    return path
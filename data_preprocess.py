@@ -8,16 +8,21 @@
 
 
 import numpy as np
+import pandas as pd
 from datetime import date
 import time
 import utilities as utils
+import date_utils
+import stage_cache
 from logs import logger
+from logs.instrument import traced
 import warnings
 warnings.filterwarnings('ignore')
 
 
 # set global args
 is_sample = False
+sample_by = None
 original_data_dir = 'data/origin'
 prep_data_dir = 'data/prep'
 
@@ -125,6 +130,37 @@ def get_label(x, y):
         return -1
 
 
+@traced()
+def parse_discount_rate(s):
+    """
+    parse discount rate strings in bulk
+    every scalar parser is only called once per distinct value, results are then
+    broadcast back to the rows by the factorized codes
+    :param s: Series, raw discount rate like 0.95, 100:10 or null
+    :return: DataFrame, columns are is_full_reduction, full_cond, full_save and discount_rate
+    """
+    parsers = [('is_full_reduction', is_full_reduction),
+               ('full_cond', get_full_reduction_cond),
+               ('full_save', get_full_reduction_save),
+               ('discount_rate', get_discount_rate)]
+
+    codes, uniques = pd.factorize(s)
+    values = list(uniques)
+    if (codes == -1).any():
+        # missing value is coded as -1, which takes the last entry of the lookup table
+        values.append(np.nan)
+
+    df_parsed = pd.DataFrame(index=s.index)
+    for col, parser in parsers:
+        table = pd.Series([parser(v) for v in values], dtype=None if values else 'float')
+        df_parsed[col] = table.values.take(codes)
+
+    return df_parsed
+
+
+@traced()
+@stage_cache.cached_stage(deps=[parse_discount_rate, is_full_reduction, get_full_reduction_cond,
+                                get_full_reduction_save, get_discount_rate])
 def get_new_feats(df):
     """
     add new features (DO NOT use on test set)
@@ -132,12 +168,10 @@ def get_new_feats(df):
     :return:
     """
 
-    # full reduction related
-    df['is_full_reduction'] = df['discount_rate'].apply(is_full_reduction)
-    df['full_cond'] = df['discount_rate'].apply(get_full_reduction_cond)
-    df['full_save'] = df['discount_rate'].apply(get_full_reduction_save)
-    # discount rate formatted
-    df['discount_rate'] = df['discount_rate'].apply(get_discount_rate)
+    # full reduction related and discount rate formatted, parsed in one pass
+    df_parsed = parse_discount_rate(df['discount_rate'])
+    for col in df_parsed.columns:
+        df[col] = df_parsed[col]
     # missing distance
     df['distance'] = df['distance'].replace(np.nan, -1).astype(int)
     # date related
@@ -147,19 +181,22 @@ def get_new_feats(df):
     return df
 
 
+@traced()
+@stage_cache.cached_stage(deps=[date_utils.to_day_number, date_utils.get_days_gap, date_utils.get_label])
 def get_new_label(df):
     """
 
     :param df:
     :return:
     """
-    # date_used and date_received
-    df['days_gap'] = df.apply(lambda row: utils.get_diff_btw_dates(row['date_received'], row['date']), axis=1)
-    df['label'] = df.apply(lambda row: get_label(row['date_received'], row['date']), axis=1)
+    # date_used and date_received, computed on whole columns
+    df['days_gap'] = date_utils.get_days_gap(df['date_received'], df['date'])
+    df['label'] = date_utils.get_label(df['date_received'], df['date'])
 
     return df
 
 
+@traced()
 def main():
     """
     main func
@@ -170,14 +207,15 @@ def main():
     # read original datafile
     # 1. offline training set
     df_off_train = utils.read_data(file_name='ccf_offline_stage1_train.csv', data_dir=original_data_dir,
-                                   is_sample=is_sample)
+                                   is_sample=is_sample, sample_by=sample_by)
     # 2. online training set
-    # df_on_train = read_data(file_name='ccf_online_stage1_train.csv')
+    # df_on_train = utils.read_data(file_name='ccf_online_stage1_train.csv', rename_col=utils.ONLINE_COLS,
+    #                               data_dir=original_data_dir, usecols=['user_id', 'action', 'date'])
     # 3. offline test set
     rename_cols = ['user_id', 'merchant_id', 'coupon_id', 'discount_rate',
                    'distance', 'date_received']
     df_off_test = utils.read_data(file_name='ccf_offline_stage1_test_revised.csv', rename_col=rename_cols,
-                                  data_dir=original_data_dir, is_sample=is_sample)
+                                  data_dir=original_data_dir, is_sample=is_sample, sample_by=sample_by)
 
     # get features
     # 1. offline training set
@@ -194,4 +232,5 @@ def main():
 
 if __name__ == '__main__':
 
+    stage_cache.configure('data/cache')
     main()
@@ -0,0 +1,199 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 13:03
+# @author: agent
+# @contact: agent@local
+# @file: export.py
+# @desc: model-ready feature matrix export that can be memory-mapped without parsing
+
+# packages
+import os
+import json
+import uuid
+import shutil
+import numpy as np
+import pandas as pd
+import utilities as utils
+from logs import logger
+from logs.instrument import traced
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # only npy export without pyarrow
+    pa = None
+    feather = None
+
+
+EXPORT_FMTS = ('npy', 'arrow')
+# cols never used as features: ids and dates only locate a row, days_gap is known after the coupon is used
+KEY_COLS = ['user_id', 'merchant_id', 'coupon_id', 'date_received']
+EXCLUDE_COLS = KEY_COLS + ['date', 'days_gap', 'window_id']
+# rows converted to the matrix at a time, so only one block of rows is copied in memory
+BLOCK_SZ = 1 << 18
+
+
+def get_feature_cols(df, label_col='label'):
+    """
+    numeric cols of the frame except keys, dates and label
+    :param df: DataFrame,
+    :param label_col: string,
+    :return: list
+    """
+    return [col for col in df.columns if col not in EXCLUDE_COLS and col != label_col and
+            (pd.api.types.is_numeric_dtype(df[col]) or pd.api.types.is_bool_dtype(df[col]))]
+
+
+def get_col_values(s, dtype=None):
+    """
+    values of a col with missing as NaN, nullable cols have no numpy view
+    :param s: Series,
+    :param dtype: numpy dtype, None to keep the dtype of numpy cols
+    :return: ndarray
+    """
+    if not isinstance(s.dtype, np.dtype):  # nullable ints and booleans
+        return s.to_numpy(dtype=dtype or np.float32, na_value=np.nan)
+
+    return s.to_numpy(dtype=dtype, copy=False)
+
+
+def get_key_values(s):
+    """
+    :param s: Series, id or date col
+    :return: ndarray, int64, -1 for missing
+    """
+    return pd.Series(s, copy=False).astype('float64').fillna(-1).to_numpy(np.int64)
+
+
+def write_npy(df, dir_path, feature_cols, label_col, key_cols, dtype):
+    """
+    row-major X.npy, y.npy and keys.npy, read back with np.load(mmap_mode='r')
+    :param df: DataFrame,
+    :param dir_path: string,
+    :param feature_cols: list,
+    :param label_col: string or None,
+    :param key_cols: list,
+    :param dtype: numpy dtype of the matrix
+    :return:
+    """
+    matrix = np.lib.format.open_memmap(os.path.join(dir_path, 'X.npy'), mode='w+', dtype=dtype,
+                                       shape=(len(df), len(feature_cols)))
+    for start in range(0, len(df), BLOCK_SZ):
+        block = df.iloc[start:start + BLOCK_SZ]
+        # rows of a block are written at once, the matrix is row-major
+        matrix[start:start + len(block)] = np.column_stack([get_col_values(block[col], dtype) for col in feature_cols])
+    matrix.flush()
+    del matrix
+
+    if label_col is not None:
+        np.save(os.path.join(dir_path, 'y.npy'), get_col_values(df[label_col], np.float32))
+    if key_cols:
+        np.save(os.path.join(dir_path, 'keys.npy'), np.column_stack([get_key_values(df[col]) for col in key_cols]))
+
+
+def write_arrow(df, dir_path, feature_cols, label_col, key_cols, dtype):
+    """
+    uncompressed Arrow IPC file of features and label, can keep mixed precision cols, read back with memory_map
+    :param df: DataFrame,
+    :param dir_path: string,
+    :param feature_cols: list,
+    :param label_col: string or None,
+    :param key_cols: list,
+    :param dtype: numpy dtype of features, None to keep downcast dtypes of each col
+    :return:
+    """
+    if pa is None:
+        raise ImportError('pyarrow is required by arrow export.')
+
+    if dtype is None:
+        df_feats = utils.downcast(df[feature_cols].copy())
+        cols = {col: get_col_values(df_feats[col]) for col in feature_cols}
+    else:
+        cols = {col: get_col_values(df[col], dtype) for col in feature_cols}
+    if label_col is not None:
+        cols[label_col] = get_col_values(df[label_col], np.float32)
+    for col in key_cols:
+        cols[col] = get_key_values(df[col])
+
+    # uncompressed so the file can be memory-mapped
+    feather.write_feather(pa.table(cols), os.path.join(dir_path, 'data.arrow'), compression='uncompressed')
+
+
+@traced()
+def export_matrix(df, file_name, data_dir, fmt='npy', label_col='label', feature_cols=None, dtype='float32',
+                  key_cols=None):
+    """
+    export feature cols as a model-ready matrix with label vector and feature manifest
+    files are written to a temp dir then renamed, so readers never see a partial export
+    :param df: DataFrame, output of a feature version
+    :param file_name: string, name of output dir
+    :param data_dir: string,
+    :param fmt: string, npy or arrow
+    :param label_col: string, exported as label vector if present in df
+    :param feature_cols: list, default is numeric cols except keys, dates and label; pass the features of the train
+                         manifest when exporting test data so both matrices have the same cols
+    :param dtype: string, dtype of features, None keeps downcast dtype of each col and requires arrow
+    :param key_cols: list, cols exported to locate rows, default is KEY_COLS in df
+    :return: string, path of output dir
+    """
+    if fmt not in EXPORT_FMTS:
+        raise ValueError('format {0} is not supported.'.format(fmt))
+    if dtype is None and fmt == 'npy':
+        raise ValueError('npy export requires one dtype.')
+    feature_cols = get_feature_cols(df, label_col) if feature_cols is None else list(feature_cols)
+    missing = [col for col in feature_cols if col not in df.columns]
+    if missing:
+        raise ValueError('feature cols {0} are not in data.'.format(missing))
+    label_col = label_col if label_col in df.columns else None
+    key_cols = [col for col in KEY_COLS if col in df.columns] if key_cols is None else list(key_cols)
+    dtype = None if dtype is None else np.dtype(dtype)
+
+    path = '{0}/{1}'.format(data_dir, file_name)
+    tmp_path = '{0}/.tmp-{1}-{2}'.format(data_dir, file_name, uuid.uuid4().hex)
+    os.makedirs(tmp_path)
+    try:
+        write = write_npy if fmt == 'npy' else write_arrow
+        write(df, tmp_path, feature_cols, label_col, key_cols, dtype)
+        manifest = {'format': fmt, 'n_rows': len(df), 'features': feature_cols,
+                    'dtype': 'mixed' if dtype is None else dtype.name, 'label': label_col, 'keys': key_cols}
+        with open(os.path.join(tmp_path, 'manifest.json'), 'w') as f:
+            json.dump(manifest, f, indent=2)
+        utils.replace_path(tmp_path, path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    logger.info('{0} is exported with {1} rows and {2} features'.format(path, len(df), len(feature_cols)))
+
+    return path
+
+
+def load_manifest(path):
+    """
+    :param path: string, output dir of export_matrix
+    :return: dict
+    """
+    with open(os.path.join(path, 'manifest.json')) as f:
+        return json.load(f)
+
+
+@traced()
+def load_matrix(path):
+    """
+    map exported matrix without parsing or copying
+    :param path: string, output dir of export_matrix
+    :return: tuple, features (memory-mapped ndarray for npy, pyarrow Table for arrow), label or None, keys or None
+             and manifest
+    """
+    manifest = load_manifest(path)
+    if manifest['format'] == 'npy':
+        def load(name):
+            file_path = os.path.join(path, name)
+            return np.load(file_path, mmap_mode='r') if os.path.exists(file_path) else None
+
+        return load('X.npy'), load('y.npy'), load('keys.npy'), manifest
+
+    table = feather.read_table(os.path.join(path, 'data.arrow'), memory_map=True)
+    label = table.column(manifest['label']).to_numpy() if manifest['label'] else None
+    keys = table.select(manifest['keys']) if manifest['keys'] else None
+
+    return table.select(manifest['features']), label, keys, manifest
@@ -7,49 +7,163 @@
 # @desc:
 
 import utilities as utils
+import date_utils
 import pandas as pd
 from logs import logger
+from logs.instrument import traced
 import time
 import data_preprocess as prep
+from aggregation import AggFeat, agg_feats, not_null, is_null
+import parallel
+import stage_cache
+import aggregation
+import sketch
+import backends
+import spill
+import receipt
+import export
+from receipt import ReceiptFeat
+from backends import aggregate
+import os
+import numpy as np
+from id_index import IdIndex, get_group_codes, get_join_positions, join_feats
+
+
+# set global args
+origin_data_dir = 'data/origin'
+feat_data_fir = 'data/features'
+
+
+def get_day_gap(df):
+    """
+    day gap between receiving and using coupon
+    :param df: DataFrame
+    :return: ndarray
+    """
+    return date_utils.get_days_gap(df.date_received, df.date)
+
+
+backends.register_value(get_day_gap, lambda: backends.days_gap_expr('date_received', 'date'))
 
 
-def get_merchant_feats(df_feats):
+def is_click(df):
     """
-    extract merchant related features
-    separate feature DataFrame and original DataFrame
-    :param df_feats: DataFrame
-    :return: DataFrame, with features of merchant
+    online action is click
+    :param df: DataFrame, online data
+    :return: Series, boolean
     """
-    # extract merchant related data
-    related_cols = ['merchant_id', 'coupon_id', 'distance', 'date_received', 'date']
-    df_merchant = df_feats[related_cols].copy()
-    # get merchant ids then drop duplicates
-    ids = df_merchant[['merchant_id']].copy()
-    ids.drop_duplicates(inplace=True)
+    return df['action'].eq(0).fillna(False)
 
-    # feat1. count of transaction for each merchant
-    f1 = df_merchant[~df_merchant.date.isna()][['merchant_id']].copy()  # date not Nan means transaction
-    df_merchant_feats = utils.add_count_new_feats(df=ids, df_grp=f1, grp_cols='merchant_id',
-                                                  new_feat_name='m_total_sales')
 
-    # feat2. count of transaction with coupon for each merchant
-    f2 = df_merchant[(~df_merchant.date.isna()) & (~df_merchant.coupon_id.isna())][['merchant_id']].copy()
-    df_merchant_feats = utils.add_count_new_feats(df=df_merchant_feats, df_grp=f2, grp_cols='merchant_id',
-                                                  new_feat_name='m_sales_with_coupon')
+def is_buy(df):
+    """
+    online action is buy
+    :param df: DataFrame, online data
+    :return: Series, boolean
+    """
+    return df['action'].eq(1).fillna(False)
+
+
+def is_fixed_buy(df):
+    """
+    online buy of a fixed price deal
+    :param df: DataFrame, online data
+    :return: Series, boolean
+    """
+    return df['discount_rate'].eq('fixed').fillna(False)
+
 
+backends.register_value(is_click, lambda: backends.equal_expr('action', 0))
+backends.register_value(is_buy, lambda: backends.equal_expr('action', 1))
+backends.register_value(is_fixed_buy, lambda: backends.equal_expr('discount_rate', 'fixed'))
+
+
+# declaration of aggregated features of each family, see aggregation.AggFeat
+AGG_OPTS = ['max', 'min', 'mean', 'median']
+
+MERCHANT_FEATS = [
+    # feat1. count of transaction for each merchant
+    AggFeat('m_total_sales', ['merchant_id'], not_null('date'), None, 'count'),
+    # feat2. count of transaction with coupon for each merchant
+    AggFeat('m_sales_with_coupon', ['merchant_id'], not_null('date', 'coupon_id'), None, 'count'),
     # feat3. count of distributed coupon for each merchant
-    f3 = df_merchant[~df_merchant.coupon_id.isna()][['merchant_id']].copy()
-    df_merchant_feats = utils.add_count_new_feats(df=df_merchant_feats, df_grp=f3, grp_cols='merchant_id',
-                                                  new_feat_name='m_total_coupon')
-
-    # feat4. max, min, mean, median of user distance for each merchant with used coupon
-    f4 = df_merchant[(~df_merchant.date.isna()) & (~df_merchant.coupon_id.isna())
-                     & (~df_merchant.distance.isna())][['merchant_id', 'distance']].copy()
-    f4.distance = f4.distance.astype('int')
-    agg_opts = ['max', 'min', 'mean', 'median']
-    df_merchant_feats = utils.add_agg_feats(df=df_merchant_feats, df_grp=f4, grp_cols=['merchant_id'],
-                                            val_col='distance', agg_ops=agg_opts, kws='m')
+    AggFeat('m_total_coupon', ['merchant_id'], not_null('coupon_id'), None, 'count'),
+] + agg_feats(  # feat4. max, min, mean, median of user distance for each merchant with used coupon
+    ['merchant_id'], not_null('date', 'coupon_id', 'distance'), 'distance', AGG_OPTS, 'm')
+
+USER_FEATS = [
+    # feat1. count of transacted merchant for each user
+    AggFeat('u_pay_merchant', ['user_id'], not_null('date'), 'merchant_id', 'nunique'),
+] + agg_feats(  # feat2. max, min, mean, median of user distance for each user using coupon
+    ['user_id'], not_null('date', 'coupon_id', 'distance'), 'distance', AGG_OPTS, 'user'
+) + [
+    # feat3. count of transaction with coupon for each user
+    AggFeat('u_pay_with_coupon', ['user_id'], not_null('date', 'coupon_id'), None, 'count'),
+    # feat4. count of transaction of each user
+    AggFeat('u_pay_total', ['user_id'], not_null('date'), None, 'count'),
+    # feat5. count of receiving coupon of each user
+    AggFeat('u_received_coupon', ['user_id'], not_null('coupon_id'), None, 'count'),
+] + agg_feats(  # feat6. max, min, mean, median of day gap between receiving and using coupon
+    ['user_id'], not_null('date', 'date_received', 'coupon_id'), get_day_gap, AGG_OPTS, 'u', val_name='day_gap')
 
+USER_MERCHANT_FEATS = [
+    # feat1. count of transaction between each user and merchant, date not null means consumption
+    AggFeat('um_pay_count', ['user_id', 'merchant_id'], not_null('date'), None, 'count'),
+    # feat2. count of receiving coupon
+    AggFeat('um_received_coupon', ['user_id', 'merchant_id'], not_null('coupon_id'), None, 'count'),
+    # feat3. count of used coupon
+    AggFeat('um_used_coupon', ['user_id', 'merchant_id'], not_null('date', 'date_received'), None, 'count'),
+    # feat4. count of user interact with merchant, including pay or not pay
+    AggFeat('um_interact_count', ['user_id', 'merchant_id'], None, None, 'count'),
+    # feat5. count of not used coupon
+    AggFeat('um_not_used_coupon', ['user_id', 'merchant_id'], is_null('date', 'coupon_id'), None, 'count'),
+]
+
+ONLINE_FEATS = [
+    # feat1. count of online actions, clicks and buys of each user
+    AggFeat('on_u_action', ['user_id'], None, None, 'count'),
+    AggFeat('on_u_click', ['user_id'], None, is_click, 'sum'),
+    AggFeat('on_u_buy', ['user_id'], None, is_buy, 'sum'),
+    # feat2. count of online coupons received and used by each user
+    AggFeat('on_u_received_coupon', ['user_id'], not_null('date_received'), None, 'count'),
+    AggFeat('on_u_used_coupon', ['user_id'], not_null('coupon_id', 'date'), None, 'count'),
+    # feat3. count of online fixed price deals bought by each user
+    AggFeat('on_u_fixed_buy', ['user_id'], None, is_fixed_buy, 'sum'),
+]
+# cols of online data used by ONLINE_FEATS
+ONLINE_USECOLS = ['user_id', 'action', 'coupon_id', 'discount_rate', 'date_received', 'date']
+# rows of each chunk of online data
+ONLINE_CHUNK_SZ = 1000000
+
+# per receipt features relative to the day each coupon is received, see receipt.ReceiptFeat
+RECEIPT_FEATS = [
+    # feat1. count of coupons received by the user on the same day, before and after that day, in total
+    ReceiptFeat('r_u_receive_day', ['user_id'], (0, 0), 'count'),
+    ReceiptFeat('r_u_receive_before', ['user_id'], (None, -1), 'count'),
+    ReceiptFeat('r_u_receive_after', ['user_id'], (1, None), 'count'),
+    ReceiptFeat('r_u_receive_total', ['user_id'], (None, None), 'count'),
+    # feat2. days since the previous and until the next receipt of the user
+    ReceiptFeat('r_u_prev_gap', ['user_id'], None, 'prev_gap'),
+    ReceiptFeat('r_u_next_gap', ['user_id'], None, 'next_gap'),
+    # feat3. count of coupons received by the user from the merchant within 7 and 15 days
+    ReceiptFeat('r_um_receive_7d', ['user_id', 'merchant_id'], (-7, 7), 'count'),
+    ReceiptFeat('r_um_receive_15d', ['user_id', 'merchant_id'], (-15, 15), 'count'),
+    # feat4. count of the same coupon received by the user on the same day and in total
+    ReceiptFeat('r_uc_receive_day', ['user_id', 'coupon_id'], (0, 0), 'count'),
+    ReceiptFeat('r_uc_receive_total', ['user_id', 'coupon_id'], (None, None), 'count'),
+    # feat5. days since the previous and until the next receipt of the same coupon by the user
+    ReceiptFeat('r_uc_prev_gap', ['user_id', 'coupon_id'], None, 'prev_gap'),
+    ReceiptFeat('r_uc_next_gap', ['user_id', 'coupon_id'], None, 'next_gap'),
+]
+
+
+@traced()
+def add_merchant_rate_feats(df_merchant_feats):
+    """
+    add rate features of merchant based on aggregated counts
+    :param df_merchant_feats: DataFrame, aggregated MERCHANT_FEATS
+    :return: DataFrame
+    """
     # feat5. how much percentage of coupon being used for each merchant
     df_merchant_feats['m_sales_with_coupon'].fillna(0, inplace=True)
     df_merchant_feats['m_coupon_used_rate'] = \
@@ -60,62 +174,17 @@ def get_merchant_feats(df_feats):
         df_merchant_feats.m_sales_with_coupon.astype('float') / df_merchant_feats.m_total_sales
 
     df_merchant_feats['m_total_coupon'].fillna(0, inplace=True)
-    print(df_merchant_feats.columns)
 
     return df_merchant_feats
 
 
-def get_user_feats(df_feats):
+@traced()
+def add_user_rate_feats(df_user_feats):
     """
-    extract user related features
-    separate feature DataFrame and original DataFrame
-    :param df_feats: DataFrame, all data to extract features
-    :return: DataFrame, with features of users
+    add rate features of user based on aggregated counts
+    :param df_user_feats: DataFrame, aggregated USER_FEATS
+    :return: DataFrame
     """
-
-    # extract user related data
-    related_cols = ['user_id', 'merchant_id', 'coupon_id', 'discount_rate', 'distance', 'date_received', 'date']
-    df_user = df_feats[related_cols].copy()
-    # get merchant ids then drop duplicates
-    ids = df_user[['user_id']].copy()
-    ids.drop_duplicates(inplace=True)
-
-    # feat1. count of transacted merchant for each user
-    f1 = df_user[~(df_user.date.isna())][['user_id', 'merchant_id']].copy()
-    f1.drop_duplicates(inplace=True)  # keep unique user-merchant pair
-    df_user_feats = utils.add_count_new_feats(df=ids, df_grp=f1[['user_id']], grp_cols='user_id',
-                                              new_feat_name='u_pay_merchant')
-
-    # feat2. max, min, mean, median of user distance for each user using coupon
-    f2 = df_user[(~df_user.date.isna()) & (~df_user.coupon_id.isna())
-                 & (~df_user.distance.isna())][['user_id', 'distance']].copy()
-    f2.distance = f2.distance.astype('int')
-    agg_opts = ['max', 'min', 'mean', 'median']
-    df_user_feats = utils.add_agg_feats(df=df_user_feats, df_grp=f2, grp_cols=['user_id'],
-                                        val_col='distance', agg_ops=agg_opts, kws='user')
-
-    # feat3. count of transaction with coupon for each user
-    f3 = df_user[(~df_user.date.isna()) & (~df_user.coupon_id.isna())][['user_id']].copy()
-    df_user_feats = utils.add_count_new_feats(df=df_user_feats, df_grp=f3, grp_cols='user_id',
-                                              new_feat_name='u_pay_with_coupon')
-
-    # feat4. count of transaction of each user
-    f4 = df_user[~df_user.date.isna()][['user_id']].copy()
-    df_user_feats = utils.add_count_new_feats(df=df_user_feats, df_grp=f4, grp_cols='user_id',
-                                              new_feat_name='u_pay_total')
-
-    # feat5. count of receiving coupon of each user
-    f5 = df_user[~df_user.coupon_id.isna()][['user_id']].copy()
-    df_user_feats = utils.add_count_new_feats(df=df_user_feats, df_grp=f5, grp_cols='user_id',
-                                              new_feat_name='u_received_coupon')
-
-    # feat6. max, min, mean, median of day gap between receiving and using coupon
-    f6 = df_user[(~df_user.date.isna()) & (~df_user.date_received.isna())
-                 & (~df_user.coupon_id.isna())][['user_id', 'date', 'date_received']].copy()
-    f6['day_gap'] = f6.apply(lambda row: utils.get_diff_btw_dates(row.date_received, row.date), axis=1)
-    df_user_feats = utils.add_agg_feats(df=df_user_feats, df_grp=f6, grp_cols=['user_id'],
-                                        val_col='day_gap', agg_ops=agg_opts, kws='u')
-
     df_user_feats['u_pay_merchant'].fillna(0, inplace=True)
 
     # feat7. how much percentage of transaction using coupon for each user
@@ -130,51 +199,16 @@ def get_user_feats(df_feats):
     df_user_feats['u_pay_total'].fillna(0, inplace=True)
     df_user_feats['u_received_coupon'].fillna(0, inplace=True)
 
-    print(df_user_feats.columns)
-
     return df_user_feats
 
 
-def get_user_merchant_feats(df_feats):
+@traced()
+def add_user_merchant_rate_feats(df_user_merchant):
     """
-    extract features between user and merchant
-    separate feature DataFrame and original DataFrame
-    :param df_feats: DataFrame, all data to extract features
-    :return: DataFrame, with features of users
+    add rate features between user and merchant based on aggregated counts
+    :param df_user_merchant: DataFrame, aggregated USER_MERCHANT_FEATS
+    :return: DataFrame
     """
-    # get user-merchant ids then drop duplicates
-    ids = df_feats[['user_id', 'merchant_id']].copy()
-    ids.drop_duplicates(inplace=True)
-
-    # feat1. count of transaction between each user and merchant
-    f1 = df_feats[['user_id', 'merchant_id', 'date']].copy()
-    f1 = f1[~f1['date'].isna()][['user_id', 'merchant_id']]  # date not null means consumption
-    df_user_merchant = utils.add_count_new_feats(df=ids, df_grp=f1, grp_cols=['user_id', 'merchant_id'],
-                                                 new_feat_name='um_pay_count')
-
-    # feat2. count of receiving coupon
-    f2 = df_feats[['user_id', 'merchant_id', 'coupon_id']].copy()
-    f2 = f2[~f2['coupon_id'].isna()][['user_id', 'merchant_id']]
-    df_user_merchant = utils.add_count_new_feats(df=df_user_merchant, df_grp=f2, grp_cols=['user_id', 'merchant_id'],
-                                                 new_feat_name='um_received_coupon')
-
-    # feat3. count of used coupon
-    f3 = df_feats[['user_id', 'merchant_id', 'date', 'date_received']].copy()
-    f3 = f3[(~f3['date'].isna()) & (~f3['date_received'].isna())][['user_id', 'merchant_id']]
-    df_user_merchant = utils.add_count_new_feats(df=df_user_merchant, df_grp=f3, grp_cols=['user_id', 'merchant_id'],
-                                                 new_feat_name='um_used_coupon')
-
-    # feat4. count of user interact with merchant, including pay or not pay
-    f4 = df_feats[['user_id', 'merchant_id']].copy()
-    df_user_merchant = utils.add_count_new_feats(df=df_user_merchant, df_grp=f4, grp_cols=['user_id', 'merchant_id'],
-                                                 new_feat_name='um_interact_count')
-
-    # feat5. count of not used coupon
-    f5 = df_feats[['user_id', 'merchant_id', 'date', 'coupon_id']].copy()
-    f5 = f5[(f5['date'].isna()) & (f5['coupon_id'].isna())][['user_id', 'merchant_id']]
-    df_user_merchant = utils.add_count_new_feats(df=df_user_merchant, df_grp=f5, grp_cols=['user_id', 'merchant_id'],
-                                                 new_feat_name='um_not_used_coupon')
-
     # fill NaN
     df_user_merchant['um_used_coupon'].fillna(0, inplace=True)
     df_user_merchant['um_not_used_coupon'].fillna(0, inplace=True)
@@ -198,11 +232,218 @@ def get_user_merchant_feats(df_feats):
     return df_user_merchant
 
 
-def basic_feature_version(df, is_train):
+@traced()
+def add_online_rate_feats(df_online_feats):
+    """
+    add rate features of online behavior based on aggregated counts
+    :param df_online_feats: DataFrame, aggregated ONLINE_FEATS
+    :return: DataFrame
+    """
+    df_online_feats['on_u_received_coupon'].fillna(0, inplace=True)
+    df_online_feats['on_u_used_coupon'].fillna(0, inplace=True)
+
+    # feat4. how much percentage of online actions being buy for each user
+    df_online_feats['on_u_buy_rate'] = df_online_feats.on_u_buy.astype('float') / df_online_feats.on_u_action
+
+    # feat5. how much percentage of online coupon being used for each user
+    df_online_feats['on_u_coupon_used_rate'] = \
+        df_online_feats.on_u_used_coupon.astype('float') / df_online_feats.on_u_received_coupon
+
+    return df_online_feats
+
+
+# feature families as (features, post process function, partition key), independent given the input frame
+FAMILIES = [
+    (MERCHANT_FEATS, add_merchant_rate_feats, 'merchant_id'),
+    (USER_FEATS, add_user_rate_feats, 'user_id'),
+    (USER_MERCHANT_FEATS, add_user_merchant_rate_feats, 'user_id'),
+]
+# cols used by feature families
+FAMILY_COLS = ['user_id', 'merchant_id', 'coupon_id', 'distance', 'date_received', 'date']
+# cols downcast in memory lean mode besides family features
+LEAN_COLS = ['discount_rate', 'distance', 'is_full_reduction', 'full_cond', 'full_save', 'days_gap', 'label'] + \
+    [feat.name for feat in RECEIPT_FEATS]
+# code feature families depend on, part of their stage cache key
+FAMILY_DEPS = [aggregation, backends, backends.settings, sketch, sketch.settings, get_group_codes, spill, FAMILIES,
+               get_day_gap, date_utils.to_day_number, date_utils.get_days_gap]
+
+
+@traced()
+@stage_cache.cached_stage(deps=FAMILY_DEPS, ignore=['id_index'])
+def get_merchant_feats(df_feats, id_index=None):
+    """
+    extract merchant related features
+    separate feature DataFrame and original DataFrame
+    :param df_feats: DataFrame
+    :param id_index: IdIndex, aggregate on dense id codes, None for a groupby
+    :return: DataFrame, with features of merchant
+    """
+    df_merchant_feats = aggregate(df_feats, MERCHANT_FEATS, id_index=id_index)
+    df_merchant_feats = add_merchant_rate_feats(df_merchant_feats)
+    logger.debug('merchant features: {0}'.format(list(df_merchant_feats.columns)))
+
+    return df_merchant_feats
+
+
+@traced()
+@stage_cache.cached_stage(deps=FAMILY_DEPS, ignore=['id_index'])
+def get_user_feats(df_feats, id_index=None):
+    """
+    extract user related features
+    separate feature DataFrame and original DataFrame
+    :param df_feats: DataFrame, all data to extract features
+    :param id_index: IdIndex, aggregate on dense id codes, None for a groupby
+    :return: DataFrame, with features of users
+    """
+    df_user_feats = aggregate(df_feats, USER_FEATS, id_index=id_index)
+    df_user_feats = add_user_rate_feats(df_user_feats)
+    logger.debug('user features: {0}'.format(list(df_user_feats.columns)))
+
+    return df_user_feats
+
+
+@traced()
+@stage_cache.cached_stage(deps=FAMILY_DEPS, ignore=['id_index'])
+def get_user_merchant_feats(df_feats, id_index=None):
+    """
+    extract features between user and merchant
+    separate feature DataFrame and original DataFrame
+    pairs are aggregated out of core over disk buckets once spill is configured, the pair count is the largest
+    :param df_feats: DataFrame, all data to extract features
+    :param id_index: IdIndex, aggregate on dense id codes, None for a groupby
+    :return: DataFrame, with features of users
+    """
+    if spill.is_enabled():
+        df_user_merchant = spill.aggregate(df_feats, USER_MERCHANT_FEATS)
+    else:
+        df_user_merchant = aggregate(df_feats, USER_MERCHANT_FEATS, id_index=id_index)
+    df_user_merchant = add_user_merchant_rate_feats(df_user_merchant)
+
+    return df_user_merchant
+
+
+@traced()
+@stage_cache.cached_stage(deps=[receipt, RECEIPT_FEATS, date_utils.to_day_number])
+def get_receipt_feats(df_feats):
+    """
+    extract per receipt features, counts and gaps of receipts around the day of each receipt
+    :param df_feats: DataFrame, all data to extract features
+    :return: DataFrame, with the index of df_feats
+    """
+    return receipt.compute(df_feats, RECEIPT_FEATS)
+
+
+@traced()
+def get_online_feats(chunks, id_index=None):
+    """
+    extract user features of online behavior by streaming aggregation over chunks of online data
+    only users of id_index are kept, so the state is bounded by the offline users rather than the online file
+    :param chunks: iterable of DataFrame, online data with cols of utils.ONLINE_COLS
+    :param id_index: IdIndex, users to keep, None for all users
+    :return: DataFrame, with features of users
+    """
+    # streaming imports this module
+    from streaming import StreamingAggregator
+
+    aggregator = StreamingAggregator(ONLINE_FEATS)
+    n_rows = 0
+    for df in chunks:
+        n_rows += len(df)
+        if id_index is not None:
+            df = df[id_index.encode('user_id', df['user_id']) >= 0]
+        aggregator.update(df)
+    if aggregator.is_empty():
+        raise ValueError('online data is empty.')
+
+    df_online_feats = add_online_rate_feats(aggregator.finalize())
+    logger.info('online features of {0} users from {1} rows'.format(len(df_online_feats), n_rows))
+
+    return df_online_feats
+
+
+def take_feats(df_feats, pos):
+    """
+    rows of features by position, int and bool cols become nullable of the same width if some rows are missing,
+    so counts keep exact values
+    :param df_feats: DataFrame,
+    :param pos: ndarray, row of df_feats, -1 for missing
+    :return: dict, col -> ndarray or nullable array
+    """
+    missing = pos < 0
+    cols = {}
+    for col in df_feats.columns:
+        values = df_feats[col].to_numpy()[pos]
+        if missing.any():
+            if values.dtype.kind in 'iu':
+                values[missing] = 0
+                values = pd.arrays.IntegerArray(values, missing)
+            elif values.dtype.kind == 'b':
+                values[missing] = False
+                values = pd.arrays.BooleanArray(values, missing)
+            else:
+                values[missing] = np.nan
+        cols[col] = values
+
+    return cols
+
+
+@traced()
+def join_lean(df_res, family_feats, id_index=None):
+    """
+    memory lean version of joining features of families then dropping duplicates
+    feature values only depend on keys, so rows are deduplicated before the join with the same result;
+    features are downcast and gathered by position into the result frame without merge copies
+    :param df_res: DataFrame, output of prep.get_new_feats
+    :param family_feats: list, (features DataFrame, key cols) of each family
+    :param id_index: IdIndex, codes of keys, a temporary one is used if None
+    :return: DataFrame
+    """
+    id_index = IdIndex() if id_index is None else id_index
+    df_res = utils.downcast(df_res.drop_duplicates().reset_index(drop=True),
+                            [col for col in LEAN_COLS if col in df_res.columns])
+
+    cols = {col: df_res[col] for col in df_res.columns}
+    for df_feat, keys in family_feats:
+        pos = get_join_positions(df_res, df_feat, keys, id_index)
+        cols.update(take_feats(utils.downcast(df_feat.drop(keys, axis=1)), pos))
+
+    # frame is built from the gathered arrays without consolidating them
+    return pd.DataFrame(cols, copy=False)
+
+
+def get_family_feats(df_feats, n_jobs=1, id_index=None, df_online_feat=None):
+    """
+    merchant, user and user-merchant features, and online features if given
+    :param df_feats: DataFrame, output of prep.get_new_feats
+    :param n_jobs: int, number of processes running feature families, 1 for serial
+    :param id_index: IdIndex, aggregate on dense id codes instead of groupby
+    :param df_online_feat: DataFrame, output of get_online_feats
+    :return: list, (features DataFrame, key cols) of each family
+    """
+    if n_jobs <= 1:
+        df_merchant_feat = get_merchant_feats(df_feats=df_feats, id_index=id_index)
+        df_user_feat = get_user_feats(df_feats=df_feats, id_index=id_index)
+        df_merchant_user_feat = get_user_merchant_feats(df_feats=df_feats, id_index=id_index)
+    else:
+        df_merchant_feat, df_user_feat, df_merchant_user_feat = \
+            parallel.run_families(df_feats, FAMILIES, FAMILY_COLS, n_jobs=n_jobs)
+    family_feats = [(df_merchant_feat, ['merchant_id']), (df_user_feat, ['user_id']),
+                    (df_merchant_user_feat, ['user_id', 'merchant_id'])]
+    if df_online_feat is not None:
+        family_feats.append((df_online_feat, ['user_id']))
+
+    return family_feats
+
+
+@traced()
+@stage_cache.cached_stage(deps=[prep.get_new_feats, prep.get_new_label, backends, backends.settings, utils.downcast,
+                                LEAN_COLS])
+def basic_feature_version(df, is_train, lean=False):
     """
     Version1. only basic features with preprocess
     :param df: DataFrame
     :param is_train:
+    :param lean: boolean, downcast features to save memory
     :return:
     """
     logger.info('======== BASIC VERSION FEATURE PREPROCESS START ========')
@@ -210,17 +451,14 @@ def basic_feature_version(df, is_train):
 
     # get features
     # 1. offline training set
-    df_res = prep.get_new_feats(df)
+    df_res = backends.get_new_feats(df)
     df_res.drop_duplicates(inplace=True)
 
-    file_name = 'ccf_offline_stage1_test_v1.csv'
-
     if is_train:
         df_res = prep.get_new_label(df_res)
 
-        file_name = 'ccf_offline_stage1_train_v1.csv'
-
-    utils.save_data(df_res, file_name=file_name, data_dir=feat_data_fir)
+    if lean:
+        utils.downcast(df_res, [col for col in LEAN_COLS if col in df_res.columns])
 
     t1 = time.time()
     logger.info('process used time {0}s.'.format(round(t1 - t0), 3))
@@ -229,35 +467,55 @@ def basic_feature_version(df, is_train):
     return df_res
 
 
-def relation_feature_version(df, is_train):
+@traced()
+@stage_cache.cached_stage(deps=[prep.get_new_feats, prep.get_new_label, parallel, join_feats, join_lean,
+                                take_feats, get_join_positions, utils.downcast, LEAN_COLS, FAMILY_DEPS,
+                                receipt, RECEIPT_FEATS, get_family_feats],
+                          ignore=['n_jobs', 'id_index'])
+def relation_feature_version(df, is_train, n_jobs=1, id_index=None, lean=False, df_online_feat=None,
+                             family_feats=None):
     """
     Version2. basic features and relation features
     :param df: DataFrame
     :param is_train:
+    :param n_jobs: int, number of processes running feature families, 1 for serial
+    :param id_index: IdIndex, aggregate and join on dense id codes instead of groupby and merge
+    :param lean: boolean, downcast features and join without intermediate copies, values equal within float32
+    :param df_online_feat: DataFrame, output of get_online_feats, joined by user if given
+    :param family_feats: list, output of get_family_feats joined as it is, e.g. families of the train set for test
+        rows, which have no consume date; families are aggregated from df if None
     :return:
     """
     logger.info('======== RELATION VERSION FEATURE PREPROCESS START ========')
     t0 = time.time()
 
     # get features
-    df_res = prep.get_new_feats(df)
-    # get merchant features
-    df_merchant_feat = get_merchant_feats(df_feats=df)
-    df_res = df_res.merge(df_merchant_feat, on='merchant_id', how='left')
-    # get user features
-    df_user_feat = get_user_feats(df_feats=df)
-    df_res = df_res.merge(df_user_feat, on='user_id', how='left')
-    # get user and merchant features
-    df_merchant_user_feat = get_user_merchant_feats(df_feats=df)
-    df_res = df_res.merge(df_merchant_user_feat, on=['user_id', 'merchant_id'], how='left')
-
-    df_res.drop_duplicates(inplace=True)
+    df_res = backends.get_new_feats(df)
+    # get per receipt features, before rows are deduplicated by the joins
+    df_receipt_feat = get_receipt_feats(df_feats=df_res)
+    for col in df_receipt_feat.columns:
+        df_res[col] = df_receipt_feat[col]
+    # get merchant, user, user and merchant features
+    if family_feats is None:
+        family_feats = get_family_feats(df_res, n_jobs=n_jobs, id_index=id_index, df_online_feat=df_online_feat)
+    if lean:
+        df_res = join_lean(df_res, family_feats, id_index)
+    else:
+        for df_feat, keys in family_feats:
+            if id_index is not None:
+                df_res = join_feats(df_res, df_feat, keys, id_index)
+            else:
+                df_res = df_res.merge(df_feat, on=keys, how='left')
+
+        df_res.drop_duplicates(inplace=True)
 
     # file_name = 'ccf_offline_stage1_test_v2.csv'
 
     if is_train:
         df_res = prep.get_new_label(df_res)
         # file_name = 'ccf_offline_stage1_train_v2.csv'
+        if lean:
+            utils.downcast(df_res, ['days_gap', 'label'])
 
     t1 = time.time()
     logger.info('process used time {0}s.'.format(round(t1 - t0), 3))
@@ -266,24 +524,48 @@ def relation_feature_version(df, is_train):
     return df_res
 
 
-def basic_feature_generator(feature_func):
+def export_feats(df_train, df_test, feature_name, data_dir=None, fmt='npy'):
+    """
+    export train and test features as model-ready matrices with the same feature cols
+    :param df_train: DataFrame,
+    :param df_test: DataFrame,
+    :param feature_name: string, name of feature version
+    :param data_dir: string, default is feat_data_fir
+    :param fmt: string, npy or arrow
+    :return:
+    """
+    data_dir = feat_data_fir if data_dir is None else data_dir
+    train_path = export.export_matrix(df_train, 'train_{0}_matrix'.format(feature_name), data_dir, fmt=fmt)
+    export.export_matrix(df_test, 'test_{0}_matrix'.format(feature_name), data_dir, fmt=fmt,
+                         feature_cols=export.load_manifest(train_path)['features'])
+
+
+@traced()
+def basic_feature_generator(feature_func, is_sample=False, sample_by=None, is_lean=False, export_fmt=None):
     """
 
     :param feature_func:
+    :param is_sample: boolean, read a sample of the data
+    :param sample_by: list, key cols to sample by, every row of sampled keys is kept, None for rows
+    :param is_lean: boolean, downcast features to save memory
+    :param export_fmt: string, npy or arrow to export model-ready matrices next to the csv output, None to skip
     :return:
     """
 
     # train features
     df_train = utils.read_data(file_name='ccf_offline_stage1_train.csv', data_dir=origin_data_dir,
-                               is_sample=is_sample)
+                               is_sample=is_sample, sample_by=sample_by)
     df_train = df_train[(~df_train['coupon_id'].isna()) & (~df_train['date_received'].isna())]
-    df_train_ = feature_func(df=df_train, is_train=True)
+    df_train_ = feature_func(df=df_train, is_train=True, lean=is_lean)
+    # saved here rather than in the feature version, which is skipped when loaded from stage cache
+    utils.save_data(df_train_, file_name='ccf_offline_stage1_train_v1.csv', data_dir=feat_data_fir)
 
     # test features
     rename_cols = ['user_id', 'merchant_id', 'coupon_id', 'discount_rate', 'distance', 'date_received']
     df_test = utils.read_data(file_name='ccf_offline_stage1_test_revised.csv', rename_col=rename_cols,
-                              data_dir=origin_data_dir, is_sample=is_sample)
-    df_test_ = feature_func(df=df_test, is_train=False)
+                              data_dir=origin_data_dir, is_sample=is_sample, sample_by=sample_by)
+    df_test_ = feature_func(df=df_test, is_train=False, lean=is_lean)
+    utils.save_data(df_test_, file_name='ccf_offline_stage1_test_v1.csv', data_dir=feat_data_fir)
 
     df_train_.drop(['date', 'merchant_id'], axis=1, inplace=True)
     df_test_.drop(['merchant_id'], axis=1, inplace=True)
@@ -291,29 +573,67 @@ def basic_feature_generator(feature_func):
     # save train and test dataset
     utils.save_data(df_train_, file_name='train_{}'.format(feature_func.__name__), data_dir=feat_data_fir)
     utils.save_data(df_test_, file_name='test_{}'.format(feature_func.__name__), data_dir=feat_data_fir)
+    if export_fmt:
+        export_feats(df_train_, df_test_, feature_func.__name__, fmt=export_fmt)
 
 
-def relation_feature_generator(feature_func):
+@traced()
+def relation_feature_generator(feature_func, is_sample=False, sample_by=None, is_lean=False, use_online=False,
+                               export_fmt=None):
     """
 
     :param feature_func:
+    :param is_sample: boolean, read a sample of the data
+    :param sample_by: list, key cols to sample by, every row of sampled keys is kept, None for rows
+    :param is_lean: boolean, downcast features and join without intermediate copies
+    :param use_online: boolean, join online features streamed from the online data
+    :param export_fmt: string, npy or arrow to export model-ready matrices next to the csv output, None to skip
     :return:
     """
-    # train features
+    # ids are encoded once at ingest, the dictionary is extended and persisted across runs
+    index_path = os.path.join(feat_data_fir, 'id_index.npz')
+    id_index = IdIndex.load(index_path) if os.path.exists(index_path) else IdIndex()
+
     df_train = utils.read_data(file_name='ccf_offline_stage1_train.csv', data_dir=origin_data_dir,
-                               is_sample=is_sample)
+                               is_sample=is_sample, sample_by=sample_by)
     df_train = df_train[(~df_train['coupon_id'].isna()) & (~df_train['date_received'].isna())]
-    df_train_ = feature_func(df=df_train, is_train=True)
-
-    # # test features
+    id_index.update(df_train)
     rename_cols = ['user_id', 'merchant_id', 'coupon_id', 'discount_rate', 'distance', 'date_received']
     df_test = utils.read_data(file_name='ccf_offline_stage1_test_revised.csv', rename_col=rename_cols,
-                              data_dir=origin_data_dir, is_sample=is_sample)
-    df_test_ = feature_func(df=df_test, is_train=False)
+                              data_dir=origin_data_dir, is_sample=is_sample, sample_by=sample_by)
+    id_index.update(df_test)
+
+    # online features of offline users, streamed from the online data
+    df_online_feat = None
+    if use_online:
+        chunks = utils.read_data(file_name='ccf_online_stage1_train.csv', rename_col=utils.ONLINE_COLS,
+                                 data_dir=origin_data_dir, chunksize=ONLINE_CHUNK_SZ, usecols=ONLINE_USECOLS)
+        df_online_feat = get_online_feats(chunks, id_index=id_index)
+
+    # families are aggregated from the train history once and joined to both sets,
+    # test rows have no consume date to aggregate
+    family_feats = get_family_feats(backends.get_new_feats(df_train.copy()), id_index=id_index,
+                                    df_online_feat=df_online_feat)
+
+    # train features
+    df_train_ = feature_func(df=df_train, is_train=True, id_index=id_index, lean=is_lean,
+                             family_feats=family_feats)
+
+    # # test features
+    df_test_ = feature_func(df=df_test, is_train=False, id_index=id_index, lean=is_lean,
+                            family_feats=family_feats)
+    id_index.save(index_path)
+
+    # save train and test dataset
+    utils.save_data(df_train_, file_name='train_{}'.format(feature_func.__name__), data_dir=feat_data_fir)
+    utils.save_data(df_test_, file_name='test_{}'.format(feature_func.__name__), data_dir=feat_data_fir)
+    if export_fmt:
+        export_feats(df_train_, df_test_, feature_func.__name__, fmt=export_fmt)
     #
-    print(df_test_.columns)
+    logger.debug('relation features: {0}'.format(list(df_test_.columns)))
 
 
+@traced()
 def main():
     """
     main function
@@ -321,13 +641,15 @@ def main():
     :return:
     """
 
-    basic_feature_generator(feature_func=basic_feature_version)
-    # relation_feature_generator(feature_func=relation_feature_version)
+    # every row of sampled users, same users in train and test
+    # export_fmt: model-ready matrices next to the csv output, None to skip
+    basic_feature_generator(feature_func=basic_feature_version, is_sample=True, sample_by=['user_id'],
+                            export_fmt='npy')
+    # relation_feature_generator(feature_func=relation_feature_version, is_sample=True, sample_by=['user_id'],
+    #                            use_online=True, export_fmt='npy')
 
 
 if __name__ == '__main__':
 
-    is_sample = True
-    origin_data_dir = 'data/origin'
-    feat_data_fir = 'data/features'
+    stage_cache.configure('data/cache')
     main()
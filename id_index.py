@@ -0,0 +1,203 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 12:34
+# @author: agent
+# @contact: agent@local
+# @file: id_index.py
+# @desc: persistent dictionary encoding of user, merchant and coupon ids
+
+import os
+import numpy as np
+import pandas as pd
+
+
+# entities with their own dictionary
+ENTITIES = ('user_id', 'merchant_id', 'coupon_id')
+
+
+def as_id_array(values):
+    """
+    raw ids as int64 array, missing ids are reported by the mask
+    :param values: Series or array-like, int/float/nullable int ids
+    :return: tuple, ndarray of int64 ids (0 for missing) and boolean mask of valid ids
+    """
+    values = pd.Series(values, copy=False).astype('float64').to_numpy()
+    valid = ~np.isnan(values)
+
+    return np.where(valid, values, 0).astype(np.int64), valid
+
+
+def get_pair_key(user_codes, merchant_codes):
+    """
+    pack user and merchant codes into one 64-bit key
+    :param user_codes: ndarray, int
+    :param merchant_codes: ndarray, int
+    :return: ndarray, int64
+    """
+    return (np.asarray(user_codes, dtype=np.int64) << 32) | np.asarray(merchant_codes, dtype=np.int64)
+
+
+def split_pair_key(pair_keys):
+    """
+    :param pair_keys: ndarray, int64
+    :return: tuple, user codes and merchant codes
+    """
+    pair_keys = np.asarray(pair_keys, dtype=np.int64)
+
+    return (pair_keys >> 32).astype(np.int32), (pair_keys & 0xFFFFFFFF).astype(np.int32)
+
+
+class IdIndex(object):
+    """
+    map raw ids of each entity to dense int32 codes, codes are stable once assigned
+    new ids are appended in order of first appearance, so the index can be extended by every ingest
+    """
+
+    def __init__(self, ids=None):
+        """
+        :param ids: dict, entity -> ndarray of raw ids in code order
+        """
+        self.ids = {entity: np.array([], dtype=np.int64) for entity in ENTITIES}
+        self.ids.update(ids or {})
+        self.lookup = {entity: pd.Index(ids) for entity, ids in self.ids.items()}
+
+    def __len__(self):
+        return sum(len(ids) for ids in self.ids.values())
+
+    def size(self, entity):
+        """
+        :param entity: string,
+        :return: int, number of codes of entity
+        """
+        return len(self.ids[entity])
+
+    def update(self, df):
+        """
+        add unseen ids of the entity cols in df
+        :param df: DataFrame
+        :return: IdIndex
+        """
+        for entity in ENTITIES:
+            if entity not in df:
+                continue
+            ids, valid = as_id_array(df[entity])
+            ids = pd.unique(ids[valid])
+            new_ids = ids[self.lookup[entity].get_indexer(ids) == -1]
+            if len(new_ids):
+                self.ids[entity] = np.concatenate([self.ids[entity], new_ids])
+                self.lookup[entity] = pd.Index(self.ids[entity])
+
+        return self
+
+    def encode(self, entity, values):
+        """
+        :param entity: string,
+        :param values: Series or array-like, raw ids
+        :return: ndarray, int32 codes, -1 for missing or unseen ids
+        """
+        ids, valid = as_id_array(values)
+        codes = self.lookup[entity].get_indexer(ids)
+        codes[~valid] = -1
+
+        return codes.astype(np.int32)
+
+    def decode(self, entity, codes):
+        """
+        :param entity: string,
+        :param codes: ndarray, int codes, all valid
+        :return: ndarray, int64 raw ids
+        """
+        return self.ids[entity][codes]
+
+    def save(self, path):
+        """
+        :param path: string, .npz file
+        :return:
+        """
+        dir_path = os.path.dirname(path)
+        if dir_path:
+            os.makedirs(dir_path, exist_ok=True)
+        np.savez(path, **self.ids)
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: string, .npz file
+        :return: IdIndex
+        """
+        with np.load(path) as data:
+            return cls({entity: data[entity] for entity in data.files})
+
+
+def get_group_codes(df, keys, id_index):
+    """
+    dense group index of each row for keys of one entity or a user-merchant pair
+    :param df: DataFrame,
+    :param keys: list, [entity] or ['user_id', 'merchant_id']
+    :param id_index: IdIndex, updated with ids of df
+    :return: tuple, group index of rows, number of groups and function decoding group index to key cols
+    """
+    id_index.update(df[keys])
+    if len(keys) == 1:
+        entity = keys[0]
+
+        def decode(groups):
+            return {entity: id_index.decode(entity, groups)}
+
+        return id_index.encode(entity, df[entity]).astype(np.int64), id_index.size(entity), decode
+
+    if keys != ['user_id', 'merchant_id']:
+        raise ValueError('keys {0} cannot be encoded.'.format(keys))
+
+    pair_keys = get_pair_key(id_index.encode('user_id', df['user_id']), id_index.encode('merchant_id',
+                                                                                         df['merchant_id']))
+    groups, uniques = pd.factorize(pair_keys)
+
+    def decode(groups):
+        user_codes, merchant_codes = split_pair_key(uniques[groups])
+        return {'user_id': id_index.decode('user_id', user_codes),
+                'merchant_id': id_index.decode('merchant_id', merchant_codes)}
+
+    return groups.astype(np.int64), len(uniques), decode
+
+
+def get_join_positions(df, df_feats, keys, id_index):
+    """
+    row of df_feats matching each row of df, by codes instead of hashing the key cols
+    :param df: DataFrame,
+    :param df_feats: DataFrame, unique keys
+    :param keys: list, [entity] or ['user_id', 'merchant_id']
+    :param id_index: IdIndex,
+    :return: ndarray, int64, -1 for rows without features
+    """
+    id_index.update(df[keys]).update(df_feats[keys])
+    if len(keys) == 1:
+        left = id_index.encode(keys[0], df[keys[0]])
+        right = id_index.encode(keys[0], df_feats[keys[0]])
+        table = np.full(id_index.size(keys[0]) + 1, -1, dtype=np.int64)  # last slot for missing ids
+        table[right] = np.arange(len(right))
+        return table[left]
+
+    left = get_pair_key(id_index.encode('user_id', df['user_id']), id_index.encode('merchant_id', df['merchant_id']))
+    right = get_pair_key(id_index.encode('user_id', df_feats['user_id']),
+                         id_index.encode('merchant_id', df_feats['merchant_id']))
+
+    return pd.Index(right).get_indexer(left)
+
+
+def join_feats(df, df_feats, keys, id_index):
+    """
+    left join features by array indexing on codes instead of merge, rows keep order of df
+    :param df: DataFrame,
+    :param df_feats: DataFrame, unique keys
+    :param keys: list, [entity] or ['user_id', 'merchant_id']
+    :param id_index: IdIndex,
+    :return: DataFrame, with a new RangeIndex like merge
+    """
+    pos = get_join_positions(df, df_feats, keys, id_index)
+
+    # position -1 is not in the index, so unmatched rows are NaN like a left merge
+    df_joined = df_feats.drop(keys, axis=1).reset_index(drop=True).reindex(pos)
+    df_joined.index = pd.RangeIndex(len(df))
+
+    return pd.concat([df.reset_index(drop=True), df_joined], axis=1)
@@ -0,0 +1,320 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 12:24
+# @author: agent
+# @contact: agent@local
+# @file: incremental.py
+# @desc: incremental and time-windowed feature recomputation on persisted aggregate states
+
+import os
+import json
+import time
+import numpy as np
+import pandas as pd
+import utilities as utils
+import data_preprocess as prep
+import feature_engineering as fe
+from aggregation import check_keys
+from streaming import StreamingAggregator, hash_keys
+from logs import logger
+
+
+# names of feature families, same order as feature_engineering.FAMILIES
+FAMILY_NAMES = ['merchant', 'user', 'user_merchant']
+
+
+def get_partition_day(df):
+    """
+    day partition of each row, date_received for coupon rows, date for transactions without coupon
+    :param df: DataFrame
+    :return: ndarray, int, format is like yyyyMMdd
+    """
+    date_received = pd.Series(df['date_received'], copy=False).astype('float64').to_numpy()
+    date = pd.Series(df['date'], copy=False).astype('float64').to_numpy()
+
+    return np.where(np.isnan(date_received), date, date_received).astype(np.int64)
+
+
+def get_usage_day(df, part_days):
+    """
+    day the coupon is used if it is after the day partition, a window ending before it must not see the usage
+    :param df: DataFrame
+    :param part_days: ndarray, output of get_partition_day
+    :return: ndarray, int, format is like yyyyMMdd, 0 if the usage is never after the end of a window of the row
+    """
+    date = pd.Series(df['date'], copy=False).astype('float64').to_numpy()
+    with np.errstate(invalid='ignore'):
+        is_later = date > part_days
+
+    return np.where(is_later, date, 0).astype(np.int64)
+
+
+def get_day_digests(df, part_days):
+    """
+    digest of the raw rows of each day partition, independent of row order,
+    a day whose rows changed after it was applied, e.g. a coupon used later, gets another digest
+    :param df: DataFrame, raw rows
+    :param part_days: ndarray, output of get_partition_day
+    :return: dict, day -> string
+    """
+    hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    df_hash = pd.DataFrame({'day': part_days, 'hi': (hashes >> np.uint64(32)).astype(np.int64),
+                            'lo': (hashes & np.uint64(0xFFFFFFFF)).astype(np.int64)})
+    df_digest = df_hash.groupby('day').agg(n=('hi', 'size'), hi=('hi', 'sum'), lo=('lo', 'sum'))
+
+    return {int(day): '{0}-{1}-{2}'.format(n, hi, lo) for day, n, hi, lo in df_digest.itertuples()}
+
+
+def upsert_feats(df_feats, df_new, keys):
+    """
+    replace features of existing keys and append new keys at the end
+    :param df_feats: DataFrame or None, current features
+    :param df_new: DataFrame, features of affected keys
+    :param keys: list, group cols
+    :return: DataFrame
+    """
+    if df_feats is None:
+        return df_new
+
+    is_old = np.isin(hash_keys(df_feats[keys]), hash_keys(df_new[keys]))
+    df_feats = df_feats.copy()
+    df_feats['#order'] = np.arange(len(df_feats))
+    # existing keys keep their position, new keys are appended in order of df_new
+    df_new = df_new.merge(df_feats.loc[is_old, keys + ['#order']], on=keys, how='left')
+    order = df_new['#order'].to_numpy(dtype='float64')
+    is_new = np.isnan(order)
+    order[is_new] = len(df_feats) + np.arange(is_new.sum())
+    df_new['#order'] = order
+    df_feats = pd.concat([df_feats[~is_old], df_new], ignore_index=True)
+
+    return df_feats.sort_values('#order', kind='mergesort').drop('#order', axis=1).reset_index(drop=True)
+
+
+class IncrementalFeatureStore(object):
+    """
+    per-key aggregate states of merchant, user and user-merchant features persisted on disk
+    state_dir:
+        manifest.json: applied day partitions and digests of their raw rows
+        <family>/<yyyyMMdd>.pkl: partial states of one day partition
+        <family>/<yyyyMMdd>_late.pkl: rows of the day partition used on a later day
+        <family>/total.pkl: partial states merged over all days
+        <family>/features.pkl: features of all keys
+    a new day partition only merges its partial states and refreshes features of affected keys,
+    windows are finalized from the day partials within the date range,
+    usage after the end of the window is hidden like windows.stack_feat_rows so that labels do not leak
+    """
+
+    def __init__(self, state_dir):
+        """
+        :param state_dir: string, directory of persisted states
+        """
+        self.state_dir = state_dir
+        self.families = dict(zip(FAMILY_NAMES, fe.FAMILIES))
+        for name in FAMILY_NAMES:
+            os.makedirs(os.path.join(state_dir, name), exist_ok=True)
+
+        self.manifest_path = os.path.join(state_dir, 'manifest.json')
+        self.days = []
+        self.digests = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            self.days = manifest['days']
+            self.digests = {int(day): digest for day, digest in manifest.get('digests', {}).items()}
+
+    def get_path(self, name, part):
+        """
+        :param name: string, family name
+        :param part: int or string, day partition or total/features
+        :return: string
+        """
+        return os.path.join(self.state_dir, name, '{0}.pkl'.format(part))
+
+    def load_aggregator(self, name, part):
+        """
+        load persisted partial states into a new aggregator
+        :param name: string,
+        :param part: int or string,
+        :return: StreamingAggregator
+        """
+        aggregator = StreamingAggregator(self.families[name][0])
+        path = self.get_path(name, part)
+        if os.path.exists(path):
+            aggregator.set_state(pd.read_pickle(path))
+
+        return aggregator
+
+    def save_aggregator(self, aggregator, name, part):
+        """
+        :param aggregator: StreamingAggregator
+        :param name: string,
+        :param part: int or string,
+        :return:
+        """
+        pd.to_pickle(aggregator.get_state(), self.get_path(name, part))
+
+    def save_day(self, df, name, day, is_late):
+        """
+        partial states of one day partition, rows used after the day are kept as rows instead,
+        since a window ending before their usage must see them as not used
+        :param df: DataFrame, rows of the day
+        :param name: string,
+        :param day: int, day partition
+        :param is_late: ndarray, boolean, rows used after the day, output of get_usage_day > 0
+        :return:
+        """
+        aggregator = StreamingAggregator(self.families[name][0])
+        aggregator.update(df[~is_late])
+        self.save_aggregator(aggregator, name, day)
+        pd.to_pickle(df[is_late], self.get_path(name, '{0}_late'.format(day)))
+
+    def get_day_keys(self, name, day):
+        """
+        keys of an applied day partition
+        :param name: string,
+        :param day: int,
+        :return: DataFrame, key cols
+        """
+        aggregator = self.load_aggregator(name, day)
+        df_keys = [pd.read_pickle(self.get_path(name, '{0}_late'.format(day)))[aggregator.keys]]
+        if not aggregator.is_empty():
+            df_keys.append(aggregator.get_state()['scalar'].index.to_frame(index=False))
+
+        return pd.concat(df_keys, ignore_index=True)
+
+    def merge_days(self, name, days, end=None):
+        """
+        merge partial states of some day partitions
+        :param name: string,
+        :param days: list of int
+        :param end: int, last day of the window, usage after it is hidden, None to see all usage
+        :return: StreamingAggregator
+        """
+        aggregator = StreamingAggregator(self.families[name][0])
+        df_late = []
+        for day in sorted(days):
+            aggregator.merge_state(self.load_aggregator(name, day).get_state())
+            df_late.append(pd.read_pickle(self.get_path(name, '{0}_late'.format(day))))
+        df_late = pd.concat(df_late) if df_late else None
+        if df_late is not None and len(df_late):
+            if end is not None:
+                df_late['date'] = df_late['date'].mask(df_late['date'].astype('float64') > end)
+            aggregator.update(df_late)
+
+        return aggregator
+
+    def apply_partition(self, df, digests=None):
+        """
+        apply new rows, processed by prep.get_new_feats, grouped into day partitions
+        a day applied again replaces its previous partition, then totals are rebuilt from day partials
+        :param df: DataFrame, all rows of each day partition in it
+        :param digests: dict, day -> digest of raw rows from get_day_digests, recorded in the manifest
+        :return: dict, family name -> number of affected keys
+        """
+        t0 = time.time()
+        part_days = get_partition_day(df)
+        is_late = get_usage_day(df, part_days) > 0
+        new_days = sorted(set(part_days.tolist()))
+        is_replace = any(day in self.days for day in new_days)
+
+        affected = {}
+        for name in FAMILY_NAMES:
+            feats, post_func, _ = self.families[name]
+            keys = check_keys(feats)
+            # keys of replaced days are refreshed too, they may not be in the new rows any more
+            df_keys = pd.concat([df[keys]] + [self.get_day_keys(name, day) for day in new_days if day in self.days],
+                                ignore_index=True)
+            for day in new_days:
+                is_day = part_days == day
+                self.save_day(df[is_day], name, day, is_late[is_day])
+            if is_replace:
+                total = self.merge_days(name, sorted(set(self.days) | set(new_days)))
+            else:
+                # merging partial states of the new rows at once equals merging each day partial
+                total = self.load_aggregator(name, 'total')
+                total.update(df)
+            self.save_aggregator(total, name, 'total')
+
+            # only features of keys in the new rows are finalized again
+            index = pd.MultiIndex.from_frame(df_keys) if len(keys) > 1 else pd.Index(df_keys[keys[0]])
+            df_new = post_func(total.select(index.unique()).finalize())
+            path = self.get_path(name, 'features')
+            df_feats = pd.read_pickle(path) if os.path.exists(path) else None
+            pd.to_pickle(upsert_feats(df_feats, df_new, keys), path)
+            affected[name] = len(df_new)
+
+        self.days = sorted(set(self.days) | set(new_days))
+        self.digests.update(digests or {})
+        with open(self.manifest_path, 'w') as f:
+            json.dump({'days': self.days, 'digests': {str(day): digest for day, digest in self.digests.items()}}, f)
+
+        logger.info('partitions {0} applied in {1}s, affected keys {2}'.format(
+            new_days, round(time.time() - t0, 3), affected))
+
+        return affected
+
+    def get_feats(self, name, start=None, end=None):
+        """
+        features of one family over all applied days or a window of days
+        :param name: string, merchant, user or user_merchant
+        :param start: int, first day of window, format is like yyyyMMdd, inclusive
+        :param end: int, last day of window, inclusive, coupons used after it count as not used
+        :return: DataFrame
+        """
+        if start is None and end is None:
+            return pd.read_pickle(self.get_path(name, 'features'))
+
+        days = [day for day in self.days if (start is None or day >= start) and (end is None or day <= end)]
+        aggregator = self.merge_days(name, days, end=end)
+        if aggregator.is_empty():
+            raise ValueError('no partition is applied between {0} and {1}.'.format(start, end))
+
+        return self.families[name][1](aggregator.finalize())
+
+    def get_window_dataset(self, df, feat_range, label_range, is_train=True):
+        """
+        sliding window dataset, features come from feat_range and rows with coupon received in label_range
+        :param df: DataFrame, processed by prep.get_new_feats
+        :param feat_range: tuple, (start, end) days of features, usage after end is hidden
+        :param label_range: tuple, (start, end) days of received coupons
+        :param is_train: boolean, add label if True
+        :return: DataFrame
+        """
+        date_received = pd.Series(df['date_received'], copy=False).astype('float64')
+        df_res = df[date_received.between(*label_range).values]
+
+        df_res = df_res.merge(self.get_feats('merchant', *feat_range), on='merchant_id', how='left')
+        df_res = df_res.merge(self.get_feats('user', *feat_range), on='user_id', how='left')
+        df_res = df_res.merge(self.get_feats('user_merchant', *feat_range), on=['user_id', 'merchant_id'],
+                              how='left')
+        if is_train:
+            df_res = prep.get_new_label(df_res)
+
+        return df_res
+
+
+def update_feature_store(state_dir, file_name, data_dir):
+    """
+    apply day partitions of a data file that are new or whose rows changed since they were applied,
+    e.g. a coupon received on an applied day gets its usage date later; unchanged days are not processed again
+    :param state_dir: string,
+    :param file_name: string,
+    :param data_dir: string,
+    :return: IncrementalFeatureStore
+    """
+    store = IncrementalFeatureStore(state_dir)
+    df = utils.read_data(file_name=file_name, data_dir=data_dir)
+    # partition days and digests only depend on raw rows, only rows of changed days are processed
+    part_days = get_partition_day(df)
+    digests = get_day_digests(df, part_days)
+    changed = [day for day, digest in digests.items() if store.digests.get(day) != digest]
+    if changed:
+        store.apply_partition(prep.get_new_feats(df[np.isin(part_days, changed)].copy()),
+                              digests={day: digests[day] for day in changed})
+
+    return store
+
+
+if __name__ == '__main__':
+
+    update_feature_store(state_dir='data/state', file_name='ccf_offline_stage1_train.csv', data_dir='data/origin')
@@ -40,7 +40,7 @@ handler.setLevel(logger_level)
 # 创建 handler 输出到文件
 # a+: pro
 # w+: dev
-file_handler = logging.FileHandler(file_logger_name, mode='a+')
+file_handler = logging.FileHandler(file_logger_name, mode='a+', delay=True)
 file_handler.setLevel(logger_level)
 
 # 创建 logging format
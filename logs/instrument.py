@@ -0,0 +1,356 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 12:29
+# @author: agent
+# @contact: agent@local
+# @file: instrument.py
+# @desc: timing, memory and shape of traced pipeline stages sent to log or json lines sinks
+
+# packages
+import os
+import json
+import time
+import inspect
+import threading
+import functools
+import contextlib
+from logs import logger
+
+
+# 全局开关与 sink
+enabled = False
+sinks = []
+# 嵌套 span 的栈, 每个线程一个
+_local = threading.local()
+
+
+def get_rss():
+    """
+    resident memory of current process
+    :return: int, bytes, 0 if not supported
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        return 0
+
+
+def get_shape(obj):
+    """
+    shape of DataFrame/Series/ndarray like object
+    :param obj: object
+    :return: list or None
+    """
+    shape = getattr(obj, 'shape', None)
+    if isinstance(shape, tuple):
+        return list(shape)
+
+    return None
+
+
+def get_memory(obj):
+    """
+    memory of DataFrame/Series/ndarray like object, object cols are not inspected deeply
+    :param obj: object
+    :return: int, bytes, None if unknown
+    """
+    usage = getattr(obj, 'memory_usage', None)
+    if callable(usage):
+        mem = usage(index=True)
+        return int(mem.sum()) if hasattr(mem, 'sum') else int(mem)
+
+    return getattr(obj, 'nbytes', None)
+
+
+class LoggerSink(object):
+    """
+    emit records as json through logs.logger
+    """
+
+    def __call__(self, record):
+        logger.info(json.dumps(record, default=str))
+
+
+class JsonLinesSink(object):
+    """
+    append records as json lines to a file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record, default=str)
+        with self.lock:
+            with open(self.path, 'a') as f:
+                f.write(line + '\n')
+
+
+class MemoryReport(object):
+    """
+    collect span records and summarize memory of each stage
+    usage:
+        report = MemoryReport()
+        configure(True, [report])
+        ...
+        logger.info(report.format())
+    """
+
+    def __init__(self):
+        self.records = []
+        self.lock = threading.Lock()
+
+    def __call__(self, record):
+        with self.lock:
+            self.records.append(record)
+
+    def summary(self):
+        """
+        :return: list of dict, one per stage, sorted by max rss growth
+        """
+        stages = {}
+        for record in self.records:
+            stage = stages.setdefault(record['name'], {'name': record['name'], 'calls': 0, 'seconds': 0.0,
+                                                       'rss_delta_mb': 0.0, 'rss_after_mb': 0.0,
+                                                       'mem_out_mb': 0.0})
+            stage['calls'] += 1
+            stage['seconds'] = round(stage['seconds'] + record['seconds'], 6)
+            for key in ('rss_delta_mb', 'rss_after_mb', 'mem_out_mb'):
+                stage[key] = max(stage[key], record.get(key) or 0.0)
+
+        return sorted(stages.values(), key=lambda stage: -stage['rss_delta_mb'])
+
+    def format(self):
+        """
+        :return: string, text table of summary
+        """
+        lines = ['{0:<60} {1:>6} {2:>10} {3:>14} {4:>14} {5:>12}'.format(
+            'stage', 'calls', 'seconds', 'rss_delta_mb', 'rss_after_mb', 'mem_out_mb')]
+        for stage in self.summary():
+            lines.append('{name:<60} {calls:>6} {seconds:>10.3f} {rss_delta_mb:>14.3f} {rss_after_mb:>14.3f} '
+                         '{mem_out_mb:>12.3f}'.format(**stage))
+
+        return '\n'.join(lines)
+
+
+def configure(is_enabled=True, sink_list=None):
+    """
+    enable or disable instrumentation, disabled by default, traced then only costs one check
+    also enabled at import by O2O_INSTRUMENT=1 (logger) or O2O_INSTRUMENT_PATH=xxx.jsonl (json lines file)
+    :param is_enabled: boolean,
+    :param sink_list: list of callable(record), default is LoggerSink
+    :return:
+    """
+    global enabled, sinks
+
+    sinks = list(sink_list) if sink_list is not None else [LoggerSink()]
+    enabled = is_enabled
+
+
+def get_stack():
+    """
+    :return: list, open spans of the current thread, innermost last
+    """
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+
+    return stack
+
+
+def emit(record):
+    """
+    send one record to all sinks
+    :param record: dict
+    :return:
+    """
+    for sink in sinks:
+        sink(record)
+
+
+class Span(object):
+    """
+    timed span of one stage
+    usage:
+        with span('prep.get_new_feats', rows_in=len(df)) as sp:
+            ...
+            sp.set(rows_out=len(df_res))
+    """
+
+    def __init__(self, name, **fields):
+        self.name = name
+        self.fields = fields
+
+    def set(self, **fields):
+        """
+        add fields to the record
+        :param fields: e.g. rows_in, rows_out, shape_out
+        :return:
+        """
+        self.fields.update(fields)
+
+    def resume(self):
+        """
+        put the span back on the stack of the current thread, parent of spans opened inside
+        :return:
+        """
+        get_stack().append(self)
+
+    def suspend(self):
+        """
+        take the span off the stack while a traced generator is paused
+        :return:
+        """
+        stack = get_stack()
+        if self in stack:
+            stack.remove(self)
+
+    def __enter__(self):
+        stack = get_stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self.start = time.time()
+        self.rss_before = get_rss()
+        self.t0 = time.perf_counter()
+
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.t0
+        rss_after = get_rss()
+        self.suspend()
+
+        record = {
+            'event': 'span',
+            'name': self.name,
+            'parent': self.parent,
+            'start': round(self.start, 6),
+            'seconds': round(seconds, 6),
+            'rss_before_mb': round(self.rss_before / 2 ** 20, 3),
+            'rss_after_mb': round(rss_after / 2 ** 20, 3),
+            'rss_delta_mb': round((rss_after - self.rss_before) / 2 ** 20, 3),
+        }
+        record.update(self.fields)
+        if record.get('rows_in') is not None and seconds > 0:
+            record['rows_per_sec'] = round(record['rows_in'] / seconds, 1)
+        if exc_type is GeneratorExit:
+            # the consumer stopped before the generator was exhausted
+            record['closed'] = True
+        elif exc_type is not None:
+            record['error'] = '{0}: {1}'.format(exc_type.__name__, exc)
+        emit(record)
+
+        return False
+
+
+class NullSpan(object):
+    """
+    span of disabled mode, does nothing
+    """
+
+    def set(self, **fields):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_null_span = NullSpan()
+
+
+def span(name, **fields):
+    """
+    timed span as context manager
+    :param name: string,
+    :param fields: extra fields of the record
+    :return: Span, or a no-op span if disabled
+    """
+    if not enabled:
+        return _null_span
+
+    return Span(name, **fields)
+
+
+def trace_generator(gen, sp, exit_stack):
+    """
+    iterate a generator returned by a traced function, its span is closed when iteration ends
+    the span is only on the stack while the generator runs, seconds_inside leaves out the time of the consumer
+    :param gen: generator
+    :param sp: Span, opened when the function was called
+    :param exit_stack: ExitStack, closes the span
+    :return: generator
+    """
+    n_chunks = 0
+    n_rows = 0
+    seconds = 0.0
+    with exit_stack:
+        try:
+            while True:
+                sp.resume()
+                t0 = time.perf_counter()
+                try:
+                    item = next(gen)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += time.perf_counter() - t0
+                    sp.suspend()
+                n_chunks += 1
+                if get_shape(item) is not None:
+                    n_rows += len(item)
+                yield item
+        finally:
+            gen.close()
+            sp.set(chunks_out=n_chunks, rows_out=n_rows, seconds_inside=round(seconds, 6))
+
+
+def traced(name=None):
+    """
+    decorator wrapping a function in a span
+    rows and shape of the first DataFrame-like argument and of the result are recorded
+    a returned generator is wrapped, its span ends with the iteration and records chunks and rows yielded
+    :param name: string, default is module.function
+    :return: decorator
+    """
+    def decorator(func):
+        span_name = name or '{0}.{1}'.format(func.__module__, func.__name__)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+
+            frame = next((arg for arg in list(args) + list(kwargs.values()) if get_shape(arg) is not None), None)
+            fields = {}
+            if frame is not None:
+                fields['rows_in'] = len(frame)
+                fields['shape_in'] = get_shape(frame)
+            with contextlib.ExitStack() as exit_stack:
+                sp = exit_stack.enter_context(Span(span_name, **fields))
+                res = func(*args, **kwargs)
+                if inspect.isgenerator(res):
+                    sp.suspend()
+                    return trace_generator(res, sp, exit_stack.pop_all())
+                if get_shape(res) is not None:
+                    sp.set(rows_out=len(res), shape_out=get_shape(res))
+                    memory = get_memory(res)
+                    if memory is not None:
+                        sp.set(mem_out_mb=round(memory / 2 ** 20, 3))
+
+            return res
+
+        return wrapper
+
+    return decorator
+
+
+# 通过环境变量开启, 无需修改代码
+if os.environ.get('O2O_INSTRUMENT_PATH'):
+    configure(True, [JsonLinesSink(os.environ['O2O_INSTRUMENT_PATH'])])
+elif os.environ.get('O2O_INSTRUMENT', '0') not in ('', '0'):
+    configure(True)
@@ -0,0 +1,121 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 12:21
+# @author: agent
+# @contact: agent@local
+# @file: parallel.py
+# @desc: process pool execution of feature families over hash-partitioned shards
+
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import pandas as pd
+from aggregation import AggFeat, aggregate
+
+
+# columns and feature families shared with workers, set by init_worker
+_shared = {}
+_families = []
+
+
+def share_cols(df, cols, part_keys, n_shards):
+    """
+    copy input columns and shard id of each partition key into shared memory
+    :param df: DataFrame,
+    :param cols: list, cols used by features
+    :param part_keys: list, cols to hash-partition rows by
+    :param n_shards: int,
+    :return: tuple, shared memory blocks and specs (name, block name, length, numpy dtype, pandas dtype)
+    """
+    arrays = {}
+    dtypes = {}
+    for col in cols:
+        arrays[col] = pd.Series(df[col], copy=False).astype('float64').to_numpy()
+        dtypes[col] = str(df[col].dtype)
+    for key in part_keys:
+        arrays['#shard_' + key] = (pd.util.hash_array(arrays[key]) % n_shards).astype(np.int32)
+        dtypes['#shard_' + key] = None
+
+    blocks = []
+    specs = []
+    for name, arr in arrays.items():
+        block = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=block.buf)[:] = arr
+        blocks.append(block)
+        specs.append((name, block.name, len(arr), arr.dtype.str, dtypes[name]))
+
+    return blocks, specs
+
+
+def init_worker(specs, families):
+    """
+    attach shared columns in worker, no frame is pickled per worker
+    :param specs: list, specs from share_cols
+    :param families: list of tuple, (features, post process function, partition key)
+    :return:
+    """
+    _families[:] = families
+    for name, block_name, length, np_dtype, pd_dtype in specs:
+        block = shared_memory.SharedMemory(name=block_name)
+        _shared[name] = (block, np.ndarray((length,), dtype=np_dtype, buffer=block.buf), pd_dtype)
+
+
+def run_shard(task):
+    """
+    compute one family on one shard, rows of a key always fall into the same shard
+    :param task: tuple, index of family, shard id
+    :return: DataFrame, features of keys in the shard and position of their first row
+    """
+    family_idx, shard = task
+    feats, post_func, part_key = _families[family_idx]
+
+    pos = np.flatnonzero(_shared['#shard_' + part_key][1] == shard)
+    df = pd.DataFrame({name: pd.Series(arr[pos]).astype(pd_dtype)
+                       for name, (_, arr, pd_dtype) in _shared.items() if pd_dtype is not None})
+    df['#pos'] = pos
+
+    df_agg = aggregate(df, feats + [AggFeat('#first', feats[0].keys, None, '#pos', 'min')])
+
+    return post_func(df_agg)
+
+
+def run_families(df, families, cols, n_jobs=1, start_method=None):
+    """
+    run independent feature families in a process pool, each family split into n_jobs shards
+    results are identical to running post_func(aggregate(df, feats)) one after another
+    :param df: DataFrame,
+    :param families: list of tuple, (features, post process function, partition key)
+    :param cols: list, cols used by features, must be numeric
+    :param n_jobs: int, number of worker processes, 1 for serial
+    :param start_method: string, fork, spawn or forkserver, default is the platform default
+    :return: list of DataFrame, one per family
+    """
+    if n_jobs <= 1:
+        return [post_func(aggregate(df, feats)) for feats, post_func, _ in families]
+
+    part_keys = sorted(set(part_key for _, _, part_key in families))
+    blocks, specs = share_cols(df, cols, part_keys, n_jobs)
+    try:
+        tasks = [(i, shard) for i in range(len(families)) for shard in range(n_jobs)]
+        # families are passed to workers by pickle: masks are aggregation.Mask and col functions are module level,
+        # so any start method works, spawned workers only attach shared columns instead of copying the frame
+        with ProcessPoolExecutor(max_workers=n_jobs, mp_context=mp.get_context(start_method),
+                                 initializer=init_worker, initargs=(specs, families)) as executor:
+            shards = list(executor.map(run_shard, tasks))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    res = []
+    for i in range(len(families)):
+        # empty shards are skipped so they do not change dtypes of the concatenated frame
+        family_shards = shards[i * n_jobs: (i + 1) * n_jobs]
+        df_res = pd.concat([df_shard for df_shard in family_shards if len(df_shard)] or family_shards[:1],
+                           ignore_index=True)
+        # restore order of first appearance of keys, same as the serial path
+        df_res = df_res.sort_values('#first', kind='mergesort').drop('#first', axis=1).reset_index(drop=True)
+        res.append(df_res)
+
+    return res
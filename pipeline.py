@@ -0,0 +1,518 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 13:07
+# @author: agent
+# @contact: agent@local
+# @file: pipeline.py
+# @desc: dependency-aware pipeline runner with concurrent nodes and resumable checkpoints
+
+# packages
+import os
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import functools
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import utilities as utils
+import data_preprocess as prep
+import feature_engineering as fe
+import backends
+import stage_cache
+from logs import logger
+from logs.instrument import traced, span
+
+
+# one stage of the pipeline
+# name: string, unique name of node
+# func: callable, called with the values of inputs in order, returns one value per output, a tuple if several
+# inputs: list, names of outputs of other nodes
+# outputs: list, names of values produced, empty for nodes only writing files
+# deps: list, code, declarations or stamps the result depends on besides func and its bound args, part of the key
+# checkpoint: boolean, save outputs when finished; False for nodes cheaper to rerun than to load, like reads,
+#             and for nodes only writing files, which would be skipped on resume even if their files were deleted
+Node = namedtuple('Node', ['name', 'func', 'inputs', 'outputs', 'deps', 'checkpoint'], defaults=[None, True])
+# input file in deps of a node, stamped when the pipeline runs rather than when nodes are built
+FileStamp = namedtuple('FileStamp', ['path'])
+
+# default config of the feature pipeline
+CONFIG = {
+    'origin_data_dir': 'data/origin',
+    'feat_data_dir': 'data/features',
+    'checkpoint_dir': 'data/checkpoints',
+    'version': 'relation_feature_version',  # or basic_feature_version
+    'is_sample': False,
+    'sample_by': None,
+    'use_online': False,
+    'export_fmt': None,  # npy or arrow to export model-ready matrices
+    'n_workers': 4,
+    'resume': True,
+}
+VERSIONS = ('basic_feature_version', 'relation_feature_version')
+TRAIN_FILE = 'ccf_offline_stage1_train.csv'
+TEST_FILE = 'ccf_offline_stage1_test_revised.csv'
+ONLINE_FILE = 'ccf_online_stage1_train.csv'
+TEST_COLS = ['user_id', 'merchant_id', 'coupon_id', 'discount_rate', 'distance', 'date_received']
+CHECKPOINT_META = 'node.json'
+
+
+def get_func_source(func):
+    """
+    source of a node function, args bound by functools.partial included
+    :param func: callable,
+    :return: string
+    """
+    if isinstance(func, functools.partial):
+        return '{0}\nargs={1!r}\nkeywords={2!r}'.format(get_func_source(func.func), func.args,
+                                                       sorted(func.keywords.items()))
+
+    return stage_cache.get_source(func)
+
+
+def get_file_stamp(file_path):
+    """
+    size and modify time of an input file, cheaper than hashing the content
+    a missing file gets a stamp too, the node reading it fails when it runs
+    :param file_path: string,
+    :return: string
+    """
+    if not os.path.exists(file_path):
+        return '{0}:missing'.format(file_path)
+    stat = os.stat(file_path)
+
+    return '{0}:{1}:{2}'.format(file_path, stat.st_size, stat.st_mtime_ns)
+
+
+def get_deps_source(deps):
+    """
+    source of deps of a node, FileStamp replaced by the current stamp of the file
+    :param deps: list, deps of a Node
+    :return: string
+    """
+    return stage_cache.get_source([get_file_stamp(dep.path) if isinstance(dep, FileStamp) else dep
+                                   for dep in deps or []])
+
+
+def sort_nodes(nodes):
+    """
+    check names and dependencies of nodes
+    :param nodes: list of Node
+    :return: tuple, nodes in topological order, output name -> producing node name
+    """
+    by_name = {}
+    producers = {}
+    for node in nodes:
+        if node.name in by_name:
+            raise ValueError('duplicate node {0}.'.format(node.name))
+        by_name[node.name] = node
+        for output in node.outputs:
+            if output in producers:
+                raise ValueError('output {0} is produced by both {1} and {2}.'.format(
+                    output, producers[output], node.name))
+            producers[output] = node.name
+    for node in nodes:
+        missing = [name for name in node.inputs if name not in producers]
+        if missing:
+            raise ValueError('inputs {0} of node {1} are not produced by any node.'.format(missing, node.name))
+
+    # depth first, nodes keep their declared order where dependencies allow
+    order = []
+    state = {}
+
+    def visit(name, path):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            raise ValueError('nodes form a cycle: {0}.'.format(' -> '.join(path + [name])))
+        state[name] = 'visiting'
+        for output in by_name[name].inputs:
+            visit(producers[output], path + [name])
+        state[name] = 'done'
+        order.append(by_name[name])
+
+    for node in nodes:
+        visit(node.name, [])
+
+    return order, producers
+
+
+def get_keys(order, producers):
+    """
+    key of each node, changes if its code, args, deps or any upstream node changes
+    :param order: list of Node, topological order
+    :param producers: dict, output name -> producing node name
+    :return: dict, node name -> md5
+    """
+    keys = {}
+    for node in order:
+        md5 = hashlib.md5(get_func_source(node.func).encode('utf-8'))
+        md5.update(get_deps_source(node.deps).encode('utf-8'))
+        for name in node.inputs:
+            md5.update('{0}={1}'.format(name, keys[producers[name]]).encode('utf-8'))
+        keys[node.name] = md5.hexdigest()
+
+    return keys
+
+
+def read_checkpoint(checkpoint_dir, node, key):
+    """
+    :param checkpoint_dir: string,
+    :param node: Node,
+    :param key: string,
+    :return: dict, output name -> saved file, None if there is no checkpoint of the key
+    """
+    meta_path = os.path.join(checkpoint_dir, node.name, CHECKPOINT_META)
+    if not os.path.exists(meta_path):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta['key'] != key or sorted(meta['outputs']) != sorted(node.outputs):
+        return None
+
+    return {name: os.path.join(checkpoint_dir, node.name, file_name) for name, file_name in meta['outputs'].items()}
+
+
+def write_checkpoint(checkpoint_dir, node, key, outputs):
+    """
+    save outputs of a finished node, the checkpoint only appears once all files are written
+    :param checkpoint_dir: string,
+    :param node: Node,
+    :param key: string,
+    :param outputs: dict, output name -> value
+    :return:
+    """
+    path = os.path.join(checkpoint_dir, node.name)
+    tmp_path = os.path.join(checkpoint_dir, '.tmp-{0}-{1}'.format(node.name, uuid.uuid4().hex))
+    os.makedirs(tmp_path)
+    try:
+        files = {name: os.path.basename(stage_cache.save_result(value, os.path.join(tmp_path, name)))
+                 for name, value in outputs.items()}
+        with open(os.path.join(tmp_path, CHECKPOINT_META), 'w') as f:
+            json.dump({'key': key, 'outputs': files, 'time': time.time()}, f, indent=2)
+        utils.replace_path(tmp_path, path)
+    except BaseException:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+
+
+def run_node(node, args, key, checkpoint_dir=None):
+    """
+    :param node: Node,
+    :param args: list, values of inputs
+    :param key: string,
+    :param checkpoint_dir: string, None to skip checkpoint
+    :return: dict, output name -> value
+    """
+    logger.info('node {0} starts'.format(node.name))
+    t0 = time.time()
+    with span('pipeline.{0}'.format(node.name)):
+        res = node.func(*args)
+    if len(node.outputs) == 0:
+        outputs = {}
+    elif len(node.outputs) == 1:
+        outputs = {node.outputs[0]: res}
+    else:
+        if not isinstance(res, tuple) or len(res) != len(node.outputs):
+            raise ValueError('node {0} should return {1} values.'.format(node.name, len(node.outputs)))
+        outputs = dict(zip(node.outputs, res))
+
+    if checkpoint_dir is not None and node.checkpoint:
+        write_checkpoint(checkpoint_dir, node, key, outputs)
+    logger.info('node {0} finished in {1}s'.format(node.name, round(time.time() - t0, 3)))
+
+    return outputs
+
+
+@traced()
+def run_pipeline(nodes, targets=None, n_workers=4, checkpoint_dir=None, resume=True):
+    """
+    run nodes needed by the targets, independent nodes concurrently in threads
+    outputs of resumed nodes are only loaded if a node to run needs them, values are released once no node needs them
+    on failure, running nodes are finished and checkpointed before the error is raised, so the next run resumes
+    :param nodes: list of Node
+    :param targets: list, names of nodes to run, default is nodes no other node depends on
+    :param n_workers: int, nodes running at the same time
+    :param checkpoint_dir: string, None to disable checkpoints
+    :param resume: boolean, skip nodes with a checkpoint of the same key
+    :return: dict, report with outputs of targets and names of nodes run and resumed
+    """
+    t0 = time.time()
+    order, producers = sort_nodes(nodes)
+    by_name = {node.name: node for node in order}
+    keys = get_keys(order, producers)
+    if targets is None:
+        used = {producers[name] for node in order for name in node.inputs}
+        targets = [node.name for node in order if node.name not in used]
+    unknown = [name for name in targets if name not in by_name]
+    if unknown:
+        raise ValueError('unknown target nodes {0}.'.format(unknown))
+    if checkpoint_dir is not None:
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    # walk back from targets, upstream of a node with a checkpoint is not needed
+    saved = {}
+    to_run = set()
+    stack = list(targets)
+    while stack:
+        name = stack.pop()
+        if name in to_run or name in saved:
+            continue
+        files = None
+        if checkpoint_dir is not None and resume and by_name[name].checkpoint:
+            files = read_checkpoint(checkpoint_dir, by_name[name], keys[name])
+        if files is not None:
+            saved[name] = files
+        else:
+            to_run.add(name)
+            stack.extend(producers[output] for output in by_name[name].inputs)
+    logger.info('pipeline runs {0} nodes, resumes {1} nodes from checkpoints'.format(
+        len(to_run), len(saved)))
+
+    # values are released once no remaining node needs them
+    target_outputs = {output for name in targets for output in by_name[name].outputs}
+    n_consumers = {}
+    for name in to_run:
+        for output in by_name[name].inputs:
+            n_consumers[output] = n_consumers.get(output, 0) + 1
+    values = {}
+
+    def get_value(output):
+        if output not in values:
+            values[output] = stage_cache.load_result(saved[producers[output]][output])
+        return values[output]
+
+    def release(node):
+        for output in node.inputs:
+            n_consumers[output] -= 1
+            if n_consumers[output] == 0 and output not in target_outputs:
+                values.pop(output, None)
+
+    finished = set(saved)
+    pending = [node for node in order if node.name in to_run]
+    ran = []
+    error = None
+    with ThreadPoolExecutor(max_workers=max(n_workers, 1)) as pool:
+        running = {}
+        while pending or running:
+            if error is None:
+                for node in [node for node in pending if all(producers[name] in finished for name in node.inputs)]:
+                    pending.remove(node)
+                    args = [get_value(name) for name in node.inputs]
+                    running[pool.submit(run_node, node, args, keys[node.name], checkpoint_dir)] = node
+            if not running:
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                node = running.pop(future)
+                try:
+                    values.update(future.result())
+                except Exception as e:
+                    logger.error('node {0} failed: {1!r}'.format(node.name, e))
+                    error = e if error is None else error
+                    continue
+                finished.add(node.name)
+                ran.append(node.name)
+                release(node)
+    if error is not None:
+        raise error
+
+    report = {'outputs': {output: get_value(output) for output in sorted(target_outputs)}, 'ran': ran,
+              'resumed': sorted(saved), 'seconds': round(time.time() - t0, 3)}
+    logger.info('pipeline finished in {0}s, ran {1}, resumed {2}'.format(report['seconds'], ran, report['resumed']))
+
+    return report
+
+
+def read_offline(file_name, data_dir, is_train, is_sample=False, sample_by=None):
+    """
+    :param file_name: string,
+    :param data_dir: string,
+    :param is_train: boolean, train rows without coupon are dropped
+    :param is_sample: boolean,
+    :param sample_by: list, sample by hash of these cols
+    :return: DataFrame
+    """
+    df = utils.read_data(file_name=file_name, rename_col=None if is_train else TEST_COLS, data_dir=data_dir,
+                         is_sample=is_sample, sample_by=sample_by)
+    if is_train:
+        df = df[(~df['coupon_id'].isna()) & (~df['date_received'].isna())]
+
+    return df
+
+
+def read_online_feats(data_dir):
+    """
+    :param data_dir: string,
+    :return: DataFrame, online features of users
+    """
+    chunks = utils.read_data(file_name=ONLINE_FILE, rename_col=utils.ONLINE_COLS, data_dir=data_dir,
+                             chunksize=fe.ONLINE_CHUNK_SZ, usecols=fe.ONLINE_USECOLS)
+
+    return fe.get_online_feats(chunks)
+
+
+def join_relation_feats(df_feats, df_receipt_feat, df_merchant_feat, df_user_feat, df_user_merchant_feat,
+                        df_online_feat=None):
+    """
+    same joins as feature_engineering.relation_feature_version with merge
+    :param df_feats: DataFrame, output of get_new_feats
+    :param df_receipt_feat: DataFrame, receipt features of df_feats in row order
+    :param df_merchant_feat: DataFrame,
+    :param df_user_feat: DataFrame,
+    :param df_user_merchant_feat: DataFrame,
+    :param df_online_feat: DataFrame,
+    :return: DataFrame
+    """
+    df_res = df_feats.copy()
+    for col in df_receipt_feat.columns:
+        df_res[col] = df_receipt_feat[col]
+    family_feats = [(df_merchant_feat, ['merchant_id']), (df_user_feat, ['user_id']),
+                    (df_user_merchant_feat, ['user_id', 'merchant_id'])]
+    if df_online_feat is not None:
+        family_feats.append((df_online_feat, ['user_id']))
+    for df_feat, keys in family_feats:
+        df_res = df_res.merge(df_feat, on=keys, how='left')
+
+    return df_res.drop_duplicates()
+
+
+def drop_duplicates(df):
+    """
+    :param df: DataFrame,
+    :return: DataFrame
+    """
+    return df.drop_duplicates()
+
+
+def label_rows(df):
+    """
+    :param df: DataFrame, train features
+    :return: DataFrame, with days_gap and label
+    """
+    return prep.get_new_label(df.drop_duplicates())
+
+
+def save_set(df, file_name, data_dir, drop_cols=None):
+    """
+    :param df: DataFrame,
+    :param file_name: string,
+    :param data_dir: string,
+    :param drop_cols: list, cols not saved
+    :return:
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    utils.save_data(df.drop(drop_cols or [], axis=1), file_name=file_name, data_dir=data_dir)
+
+
+def export_sets(df_train, df_test, feature_name, data_dir, fmt, drop_cols=None):
+    """
+    :param df_train: DataFrame,
+    :param df_test: DataFrame,
+    :param feature_name: string, name of feature version
+    :param data_dir: string,
+    :param fmt: string, npy or arrow
+    :param drop_cols: tuple, cols dropped from train and test as when saving
+    :return:
+    """
+    train_drop, test_drop = drop_cols or ([], [])
+    fe.export_feats(df_train.drop(train_drop, axis=1), df_test.drop(test_drop, axis=1), feature_name,
+                    data_dir=data_dir, fmt=fmt)
+
+
+def build_feature_nodes(config=None):
+    """
+    nodes of a feature version from reading raw files to saving train and test sets
+    relation families are aggregated from the train set and joined to both sets, test rows have no consume date
+    :param config: dict, overrides of CONFIG
+    :return: list of Node
+    """
+    config = dict(CONFIG, **(config or {}))
+    version = config['version']
+    if version not in VERSIONS:
+        raise ValueError('version {0} is not supported.'.format(version))
+    origin_dir = config['origin_data_dir']
+    feat_dir = config['feat_data_dir']
+    read = functools.partial(read_offline, data_dir=origin_dir, is_sample=config['is_sample'],
+                             sample_by=config['sample_by'])
+
+    nodes = [
+        # preprocess
+        Node('read_train', functools.partial(read, TRAIN_FILE, is_train=True), [], ['raw_train'],
+             deps=[FileStamp(os.path.join(origin_dir, TRAIN_FILE)), utils.read_data], checkpoint=False),
+        Node('read_test', functools.partial(read, TEST_FILE, is_train=False), [], ['raw_test'],
+             deps=[FileStamp(os.path.join(origin_dir, TEST_FILE)), utils.read_data], checkpoint=False),
+        Node('prep_train', backends.get_new_feats, ['raw_train'], ['feats_train'],
+             deps=[prep.get_new_feats, backends.settings]),
+        Node('prep_test', backends.get_new_feats, ['raw_test'], ['feats_test'],
+             deps=[prep.get_new_feats, backends.settings]),
+    ]
+
+    if version == 'basic_feature_version':
+        drop_cols = (['date', 'merchant_id'], ['merchant_id'])
+        nodes += [
+            Node('label_train', label_rows, ['feats_train'], ['train_set'], deps=[prep.get_new_label]),
+            Node('dedup_test', drop_duplicates, ['feats_test'], ['test_set']),
+        ]
+    else:
+        drop_cols = None
+        family_deps = [fe.FAMILY_DEPS, fe.get_day_gap]
+        join_inputs = ['merchant_feats', 'user_feats', 'user_merchant_feats']
+        nodes += [
+            # feature families, independent of each other
+            Node('receipt_train', fe.get_receipt_feats, ['feats_train'], ['receipt_train'], deps=[fe.RECEIPT_FEATS]),
+            Node('receipt_test', fe.get_receipt_feats, ['feats_test'], ['receipt_test'], deps=[fe.RECEIPT_FEATS]),
+            Node('merchant_feats', fe.get_merchant_feats, ['feats_train'], ['merchant_feats'],
+                 deps=family_deps + [fe.add_merchant_rate_feats]),
+            Node('user_feats', fe.get_user_feats, ['feats_train'], ['user_feats'],
+                 deps=family_deps + [fe.add_user_rate_feats]),
+            Node('user_merchant_feats', fe.get_user_merchant_feats, ['feats_train'], ['user_merchant_feats'],
+                 deps=family_deps + [fe.add_user_merchant_rate_feats]),
+        ]
+        if config['use_online']:
+            nodes.append(Node('online_feats', functools.partial(read_online_feats, origin_dir), [], ['online_feats'],
+                              deps=[FileStamp(os.path.join(origin_dir, ONLINE_FILE)), fe.ONLINE_FEATS,
+                                    fe.add_online_rate_feats]))
+            join_inputs.append('online_feats')
+        nodes += [
+            Node('join_train', join_relation_feats, ['feats_train', 'receipt_train'] + join_inputs, ['joined_train']),
+            Node('join_test', join_relation_feats, ['feats_test', 'receipt_test'] + join_inputs, ['test_set']),
+            # labeling
+            Node('label_train', label_rows, ['joined_train'], ['train_set'], deps=[prep.get_new_label]),
+        ]
+
+    # save
+    train_drop, test_drop = drop_cols or ([], [])
+    nodes += [
+        # files written are not checkpointed, these nodes rerun from the checkpointed sets
+        Node('save_train', functools.partial(save_set, file_name='train_{0}'.format(version), data_dir=feat_dir,
+                                             drop_cols=train_drop), ['train_set'], [], checkpoint=False),
+        Node('save_test', functools.partial(save_set, file_name='test_{0}'.format(version), data_dir=feat_dir,
+                                            drop_cols=test_drop), ['test_set'], [], checkpoint=False),
+    ]
+    if config['export_fmt']:
+        nodes.append(Node('export', functools.partial(export_sets, feature_name=version, data_dir=feat_dir,
+                                                      fmt=config['export_fmt'], drop_cols=drop_cols),
+                          ['train_set', 'test_set'], [], deps=[fe.export_feats, fe.export], checkpoint=False))
+
+    return nodes
+
+
+@traced()
+def main(config=None):
+    """
+    run the feature pipeline, rerun after a failure to resume from checkpoints
+    :param config: dict, overrides of CONFIG
+    :return: dict, report of run_pipeline
+    """
+    config = dict(CONFIG, **(config or {}))
+
+    return run_pipeline(build_feature_nodes(config), n_workers=config['n_workers'],
+                        checkpoint_dir=config['checkpoint_dir'], resume=config['resume'])
+
+
+if __name__ == '__main__':
+
+    stage_cache.configure('data/cache')
+    main({'is_sample': True, 'sample_by': ['user_id'], 'use_online': True, 'export_fmt': 'npy'})
@@ -0,0 +1,118 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 13:00
+# @author: agent
+# @contact: agent@local
+# @file: receipt.py
+# @desc: per receipt window counts and gaps over receipts sorted by key and day
+
+# packages
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import date_utils
+from logs.instrument import traced
+
+
+# one per receipt feature
+# name: string, name of new feature
+# keys: list, cols receipts are grouped by, like ['user_id'] or ['user_id', 'merchant_id']
+# window: tuple, first and last day relative to the receipt day, None is unbounded, used by count
+# op: string, count of receipts in window, prev_gap or next_gap days to the receipt of another day
+ReceiptFeat = namedtuple('ReceiptFeat', ['name', 'keys', 'window', 'op'])
+
+RECEIPT_OPS = ('count', 'prev_gap', 'next_gap')
+# packed key is group * DAY_SPAN + day, days of the data are far less than DAY_SPAN apart
+DAY_SPAN = 1 << 20
+
+
+def get_packed_days(df, keys):
+    """
+    pack group and receipt day of receipts into one int64
+    :param df: DataFrame, with date_received and key cols
+    :param keys: list,
+    :return: tuple, positions of receipts in df, order sorting them by packed key, sorted packed keys
+    """
+    days = date_utils.to_day_number(df['date_received'])
+    valid = ~np.isnan(days)
+    for key in keys:
+        valid &= df[key].notna().to_numpy()
+    pos = np.flatnonzero(valid)
+
+    days = days[pos]
+    if len(days) and days.max() - days.min() >= DAY_SPAN // 2:
+        raise ValueError('receipt days span more than {0} days.'.format(DAY_SPAN // 2))
+    # days start from DAY_SPAN // 4, so windows reaching before the first day stay in the group
+    days = (days - (days.min() if len(days) else 0)).astype(np.int64) + DAY_SPAN // 4
+    groups = df.iloc[pos].groupby(keys, sort=False).ngroup().to_numpy().astype(np.int64)
+    packed = groups * DAY_SPAN + days
+    order = np.argsort(packed, kind='stable')
+
+    return pos, order, packed[order]
+
+
+def get_window_counts(packed, window):
+    """
+    receipts of the same group within the window around each receipt, the receipt itself included
+    queries are sorted like the searched keys, so consecutive binary searches stay in cache
+    :param packed: ndarray, sorted packed keys of receipts
+    :param window: tuple, first and last relative day, None is unbounded
+    :return: ndarray, int64
+    """
+    lo, hi = window
+    if lo is not None and hi is not None and lo > hi:
+        raise ValueError('window must be ordered, got {0}.'.format(window))
+
+    base = packed - packed % DAY_SPAN
+    first = base if lo is None else np.maximum(packed + lo, base)
+    last = base + DAY_SPAN - 1 if hi is None else np.minimum(packed + hi, base + DAY_SPAN - 1)
+
+    return np.searchsorted(packed, last, side='right') - np.searchsorted(packed, first, side='left')
+
+
+def get_gaps(packed, op):
+    """
+    days to the last receipt of an earlier day or the first receipt of a later day of the same group
+    :param packed: ndarray, sorted packed keys of receipts
+    :param op: string, prev_gap or next_gap
+    :return: ndarray, float64, NaN if there is none
+    """
+    if op == 'prev_gap':
+        idx = np.searchsorted(packed, packed, side='left') - 1
+    else:
+        idx = np.searchsorted(packed, packed, side='right')
+    found = (idx >= 0) & (idx < len(packed))
+    other = packed[np.clip(idx, 0, max(len(packed) - 1, 0))]
+    found &= other // DAY_SPAN == packed // DAY_SPAN
+
+    return np.where(found, np.abs(packed - other), np.nan)
+
+
+@traced()
+def compute(df, feats):
+    """
+    per receipt features, rows sharing keys share one sort
+    every feature is binary searches on the sorted packed keys, there is no self join
+    :param df: DataFrame, with date_received and key cols
+    :param feats: list of ReceiptFeat
+    :return: DataFrame, index of df, NaN for rows without receipt or keys, counts are int if none is missing
+    """
+    res = {}
+    sorted_keys = {}
+    for feat in feats:
+        if feat.op not in RECEIPT_OPS:
+            raise ValueError('unknown op {0}.'.format(feat.op))
+        if tuple(feat.keys) not in sorted_keys:
+            sorted_keys[tuple(feat.keys)] = get_packed_days(df, list(feat.keys))
+        pos, order, packed = sorted_keys[tuple(feat.keys)]
+
+        if feat.op == 'count':
+            values = get_window_counts(packed, feat.window)
+        else:
+            values = get_gaps(packed, feat.op)
+        # back to row order
+        col = np.full(len(df), np.nan) if len(pos) < len(df) else np.empty(len(df), dtype=values.dtype)
+        col[pos[order]] = values
+        res[feat.name] = col
+
+    return pd.DataFrame(res, index=df.index)
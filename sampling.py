@@ -0,0 +1,128 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 12:48
+# @author: agent
+# @contact: agent@local
+# @file: sampling.py
+# @desc: streaming, key-consistent and stratified sampling
+
+# packages
+import numpy as np
+import pandas as pd
+
+
+# multipliers of splitmix64
+MIX_MULTIPLIERS = (np.uint64(0xBF58476D1CE4E5B9), np.uint64(0x94D049BB133111EB))
+GOLDEN_GAMMA = np.uint64(0x9E3779B97F4A7C15)
+
+
+def mix64(x):
+    """
+    splitmix64 finalizer, a well distributed 64-bit hash of 64-bit ints
+    :param x: ndarray, uint64
+    :return: ndarray, uint64
+    """
+    x = x ^ (x >> np.uint64(30))
+    x = x * MIX_MULTIPLIERS[0]
+    x = x ^ (x >> np.uint64(27))
+    x = x * MIX_MULTIPLIERS[1]
+
+    return x ^ (x >> np.uint64(31))
+
+
+def hash_ids(df, keys, seed=10):
+    """
+    hash of key cols of each row, the same id gets the same hash in every file and chunk
+    :param df: DataFrame,
+    :param keys: list, id cols like ['user_id'] or ['user_id', 'merchant_id']
+    :param seed: int,
+    :return: tuple, ndarray of uint64 hashes and boolean mask of rows with all keys present
+    """
+    valid = np.ones(len(df), dtype=bool)
+    with np.errstate(over='ignore'):
+        h = np.full(len(df), np.uint64(seed) * GOLDEN_GAMMA, dtype=np.uint64)
+        for key in keys:
+            values = df[key].astype('float64').to_numpy()
+            valid &= ~np.isnan(values)
+            h = mix64(h + np.where(np.isnan(values), 0, values).astype(np.int64).astype(np.uint64))
+
+    return h, valid
+
+
+def hash_sample(df, keys, frac, seed=10):
+    """
+    keep every row of a hashed fraction of entities
+    the same seed picks the same entities in train and test files, so user-merchant relations are not broken
+    :param df: DataFrame,
+    :param keys: list, id cols
+    :param frac: float, expected fraction of entities kept, in (0, 1]
+    :param seed: int,
+    :return: DataFrame, rows in original order
+    """
+    if not 0 < frac <= 1:
+        raise ValueError('frac must be in (0, 1], got {0}.'.format(frac))
+    h, valid = hash_ids(df, keys, seed)
+    # top 53 bits as a uniform number in [0, 1)
+    keep = valid & ((h >> np.uint64(11)).astype(np.float64) / float(1 << 53) < frac)
+
+    return df[keep]
+
+
+def hash_sample_chunks(chunks, keys, frac, seed=10):
+    """
+    streaming version of hash_sample
+    :param chunks: iterable of DataFrame
+    :param keys: list,
+    :param frac: float,
+    :param seed: int,
+    :return: generator of DataFrame
+    """
+    for df in chunks:
+        yield hash_sample(df, keys, frac, seed)
+
+
+def reservoir_sample(chunks, n, seed=10, columns=None):
+    """
+    uniform sample of n rows without replacement while streaming chunks
+    every row gets a random priority and the n smallest are kept, which is reservoir sampling done a chunk at a time
+    :param chunks: iterable of DataFrame
+    :param n: int, rows to keep
+    :param seed: int,
+    :param columns: list, cols of the empty frame returned if there are no chunks
+    :return: DataFrame, rows in original order, all rows if there are fewer than n
+    """
+    rng = np.random.default_rng(seed)
+    reservoir = None
+    priority = np.array([])
+    for df in chunks:
+        chunk_priority = rng.random(len(df))
+        if reservoir is not None:
+            df = pd.concat([reservoir, df])
+            chunk_priority = np.concatenate([priority, chunk_priority])
+        if len(df) > n:
+            # keep original order among the kept rows
+            kept = np.sort(np.argpartition(chunk_priority, n - 1)[:n])
+            df, chunk_priority = df.iloc[kept], chunk_priority[kept]
+        reservoir, priority = df, chunk_priority
+
+    return pd.DataFrame(columns=columns) if reservoir is None else reservoir
+
+
+def stratified_sample(df, frac=None, n=None, label_col='label', seed=10):
+    """
+    sample within each label so that label ratios are kept
+    :param df: DataFrame, preprocessed data with label
+    :param frac: float, fraction of rows kept
+    :param n: int, rows kept in total if frac is None
+    :param label_col: string,
+    :param seed: int,
+    :return: DataFrame, rows in original order
+    """
+    if frac is None:
+        if n is None:
+            raise ValueError('one of frac and n is required.')
+        frac = min(n / max(len(df), 1), 1.0)
+
+    sampled = df.groupby(label_col, group_keys=False, dropna=False).sample(frac=frac, random_state=seed)
+
+    return df.loc[df.index.isin(sampled.index)] if df.index.is_unique else sampled.sort_index()
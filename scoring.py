@@ -0,0 +1,198 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 13:04
+# @author: agent
+# @contact: agent@local
+# @file: scoring.py
+# @desc: chunked batch scoring of offline test set into submission file
+
+# packages
+import os
+import time
+import uuid
+import pickle
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import utilities as utils
+import feature_engineering as fe
+import backends
+import export
+from logs import logger
+from logs.instrument import traced, get_rss
+
+
+# set global args
+origin_data_dir = 'data/origin'
+feat_data_dir = 'data/features'
+model_path = 'data/model/model.pkl'
+submission_dir = 'data/submission'
+
+TEST_FILE = 'ccf_offline_stage1_test_revised.csv'
+TEST_COLS = ['user_id', 'merchant_id', 'coupon_id', 'discount_rate', 'distance', 'date_received']
+SUBMISSION_COLS = ['user_id', 'coupon_id', 'date_received', 'prob']
+# prefix of online feature cols, see feature_engineering.ONLINE_FEATS
+ONLINE_PREFIX = 'on_u_'
+
+
+@traced()
+def get_lookup_feats(df_train, id_index=None, df_online_feat=None):
+    """
+    relation features aggregated from the offline train history, looked up by key when scoring
+    :param df_train: DataFrame, offline train data with renamed cols
+    :param id_index: IdIndex, aggregate and join on dense id codes
+    :param df_online_feat: DataFrame, output of feature_engineering.get_online_feats
+    :return: list, (features DataFrame, key cols) of each family
+    """
+    return fe.get_family_feats(backends.get_new_feats(df_train), id_index=id_index, df_online_feat=df_online_feat)
+
+
+def get_proba(model, X):
+    """
+    probability of the positive class
+    :param model: object with predict_proba(X), like sklearn or lightgbm classifiers
+    :param X: ndarray, float32
+    :return: ndarray, float64
+    """
+    prob = np.asarray(model.predict_proba(X))
+
+    return prob[:, -1] if prob.ndim == 2 else prob
+
+
+def score_chunk(df, model, feature_cols, family_feats, df_receipt_feat=None):
+    """
+    features and probability of one chunk of test data
+    :param df: DataFrame, chunk of test data, index is the row number in the file
+    :param model: object with predict_proba(X)
+    :param feature_cols: list, model input cols in order
+    :param family_feats: list, from get_lookup_feats
+    :param df_receipt_feat: DataFrame, receipt features of the whole test data in row order
+    :return: DataFrame, submission rows of the chunk
+    """
+    df_res = backends.get_new_feats(df)
+    if df_receipt_feat is not None:
+        rows = df_receipt_feat.iloc[np.asarray(df.index)]
+        for col in rows.columns:
+            df_res[col] = rows[col].to_numpy()
+    # merge rather than code joins, joins on codes extend the IdIndex which is not shared across threads
+    for df_feat, keys in family_feats:
+        df_res = df_res.merge(df_feat, on=keys, how='left')
+
+    missing = [col for col in feature_cols if col not in df_res.columns]
+    if missing:
+        raise ValueError('feature cols {0} are not available when scoring.'.format(missing))
+    X = np.column_stack([export.get_col_values(df_res[col], np.float32) for col in feature_cols])
+
+    df_sub = df_res[SUBMISSION_COLS[:-1]].copy()
+    df_sub['prob'] = get_proba(model, X)
+
+    return df_sub
+
+
+def write_chunk(df_sub, f):
+    """
+    append submission rows without header
+    :param df_sub: DataFrame,
+    :param f: file object
+    :return: int, rows written
+    """
+    df_sub.to_csv(f, index=False, header=False, float_format='%.6f')
+
+    return len(df_sub)
+
+
+@traced()
+def batch_score(model, feature_cols, family_feats, file_name=TEST_FILE, data_dir=None, out_path=None,
+                chunksize=100000, n_threads=1, with_receipt=True):
+    """
+    stream test data in chunks through features and model, submission is appended chunk by chunk in file order
+    rows of the submission are user_id, coupon_id, date_received and prob without header
+    :param model: object with predict_proba(X)
+    :param feature_cols: list, model input cols in order, e.g. features of the export manifest of train matrix
+    :param family_feats: list, from get_lookup_feats
+    :param file_name: string,
+    :param data_dir: string, default is origin_data_dir
+    :param out_path: string, submission csv, written to a temp file then renamed
+    :param chunksize: int, rows of each chunk
+    :param n_threads: int, chunks scored concurrently, at most 2 * n_threads chunks are in memory
+    :param with_receipt: boolean, add receipt features, computed once from the key cols of the whole test data
+    :return: dict, report of rows, seconds, throughput and peak memory
+    """
+    data_dir = origin_data_dir if data_dir is None else data_dir
+    out_path = os.path.join(submission_dir, 'submission.csv') if out_path is None else out_path
+    t0 = time.time()
+    peak_rss = get_rss()
+
+    df_receipt_feat = None
+    if with_receipt:
+        # only key cols of the whole file are read
+        df_keys = utils.read_data(file_name=file_name, rename_col=TEST_COLS, data_dir=data_dir,
+                                  usecols=['user_id', 'merchant_id', 'coupon_id', 'date_received'])
+        df_receipt_feat = fe.get_receipt_feats(df_feats=df_keys)
+        del df_keys
+
+    chunks = utils.read_data(file_name=file_name, rename_col=TEST_COLS, data_dir=data_dir, chunksize=chunksize)
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    tmp_path = '{0}.tmp-{1}'.format(out_path, uuid.uuid4().hex)
+    n_rows = 0
+    n_chunks = 0
+    try:
+        with ThreadPoolExecutor(max_workers=max(n_threads, 1)) as pool, open(tmp_path, 'w') as f:
+            pending = []
+            for df in chunks:
+                pending.append(pool.submit(score_chunk, df, model, feature_cols, family_feats, df_receipt_feat))
+                # bounded in-flight chunks, results are written in submission order
+                while len(pending) >= 2 * max(n_threads, 1):
+                    n_rows += write_chunk(pending.pop(0).result(), f)
+                    n_chunks += 1
+                    peak_rss = max(peak_rss, get_rss())
+            for future in pending:
+                n_rows += write_chunk(future.result(), f)
+                n_chunks += 1
+                peak_rss = max(peak_rss, get_rss())
+        utils.replace_path(tmp_path, out_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    seconds = time.time() - t0
+    report = {'rows': n_rows, 'chunks': n_chunks, 'seconds': round(seconds, 3),
+              'rows_per_sec': round(n_rows / seconds, 1) if seconds > 0 else None,
+              'peak_rss_mb': round(peak_rss / 2 ** 20, 3), 'path': out_path}
+    logger.info('scoring report: {0}'.format(report))
+
+    return report
+
+
+@traced()
+def main():
+    """
+    score offline test set with the pickled model and the features of the train matrix manifest
+    the manifest is exported to feat_data_dir by feature_engineering.relation_feature_generator or pipeline.main
+    with export_fmt set, online features are looked up if the model uses them
+    :return:
+    """
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+    matrix_path = os.path.join(feat_data_dir, 'train_relation_feature_version_matrix')
+    if not os.path.exists(os.path.join(matrix_path, 'manifest.json')):
+        raise FileNotFoundError('{0} is not exported, run feature_engineering.relation_feature_generator '
+                                'or pipeline.main with export_fmt first.'.format(matrix_path))
+    feature_cols = export.load_manifest(matrix_path)['features']
+
+    df_online_feat = None
+    if any(col.startswith(ONLINE_PREFIX) for col in feature_cols):
+        df_online_feat = fe.get_online_feats(utils.read_data(
+            file_name='ccf_online_stage1_train.csv', rename_col=utils.ONLINE_COLS, data_dir=origin_data_dir,
+            chunksize=fe.ONLINE_CHUNK_SZ, usecols=fe.ONLINE_USECOLS))
+    df_train = utils.read_data(file_name='ccf_offline_stage1_train.csv', data_dir=origin_data_dir)
+    df_train = df_train[(~df_train['coupon_id'].isna()) & (~df_train['date_received'].isna())]
+    family_feats = get_lookup_feats(df_train, df_online_feat=df_online_feat)
+    del df_train
+
+    batch_score(model, feature_cols, family_feats, n_threads=4)
+
+
+if __name__ == '__main__':
+
+    main()
@@ -0,0 +1,273 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 12:35
+# @author: agent
+# @contact: agent@local
+# @file: serving.py
+# @desc: online feature serving of coupon receipt events
+
+# packages
+import json
+import numpy as np
+import pandas as pd
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import utilities as utils
+import data_preprocess as prep
+import feature_engineering as fe
+from logs import logger
+from logs.instrument import traced
+
+
+# set global args
+origin_data_dir = 'data/origin'
+host = '127.0.0.1'
+port = 8080
+
+# cols of one event
+EVENT_COLS = ['user_id', 'merchant_id', 'coupon_id', 'discount_rate', 'distance', 'date_received']
+ID_COLS = ['user_id', 'merchant_id', 'coupon_id']
+# event features in the order of prep.get_new_feats
+PARSED_COLS = ['is_full_reduction', 'full_cond', 'full_save', 'discount_rate']
+EVENT_FEATS = ['discount_rate', 'distance', 'date_received', 'is_full_reduction', 'full_cond', 'full_save']
+
+
+def get_lookup_keys(df, keys):
+    """
+    one int64 key per row, user and merchant ids are packed into 64 bits
+    :param df: DataFrame,
+    :param keys: list, [entity] or ['user_id', 'merchant_id']
+    :return: ndarray, int64, -1 for missing ids
+    """
+    ids = [df[key].astype('float64').fillna(-1).to_numpy().astype(np.int64) for key in keys]
+    if len(ids) == 1:
+        return ids[0]
+
+    return np.where((ids[0] < 0) | (ids[1] < 0), -1, (ids[0] << 32) | ids[1])
+
+
+def get_event_id(value):
+    """
+    id of one event, same as get_lookup_keys
+    :param value: int, None or NaN if missing
+    :return: int, -1 for missing id
+    """
+    return -1 if pd.isna(value) else int(value)
+
+
+class FeatureTable(object):
+    """
+    features of one family as a float64 matrix, the last row is all NaN for unknown keys
+    """
+
+    def __init__(self, df_feats, keys):
+        """
+        :param df_feats: DataFrame, unique keys, output of fe.get_*_feats
+        :param keys: list, key cols
+        """
+        self.keys = list(keys)
+        self.names = [col for col in df_feats.columns if col not in self.keys]
+        values = df_feats[self.names].to_numpy(dtype='float64')
+        self.values = np.vstack([values, np.full((1, len(self.names)), np.nan)])
+
+        key_values = get_lookup_keys(df_feats, self.keys)
+        self.index = pd.Index(key_values)
+        self.rows = dict(zip(key_values.tolist(), range(len(key_values))))
+
+    def __len__(self):
+        return len(self.values) - 1
+
+    def get_row(self, key):
+        """
+        :param key: int, raw id or packed user-merchant key
+        :return: ndarray, one row of features
+        """
+        return self.values[self.rows.get(key, -1)]
+
+    def get_rows(self, df):
+        """
+        vectorized lookup
+        :param df: DataFrame, with key cols
+        :return: ndarray, (len(df), number of features)
+        """
+        return self.values[self.index.get_indexer(get_lookup_keys(df, self.keys))]
+
+
+class FeatureServer(object):
+    """
+    look up precomputed relation features and parse discount per event
+    """
+
+    def __init__(self, df_merchant_feats, df_user_feats, df_user_merchant_feats):
+        """
+        :param df_merchant_feats: DataFrame, output of fe.get_merchant_feats
+        :param df_user_feats: DataFrame, output of fe.get_user_feats
+        :param df_user_merchant_feats: DataFrame, output of fe.get_user_merchant_feats
+        """
+        self.merchant = FeatureTable(df_merchant_feats, ['merchant_id'])
+        self.user = FeatureTable(df_user_feats, ['user_id'])
+        self.user_merchant = FeatureTable(df_user_merchant_feats, ['user_id', 'merchant_id'])
+        self.feature_names = EVENT_FEATS + self.merchant.names + self.user.names + self.user_merchant.names
+        # parsed discount by raw string, there are only a few dozen distinct values
+        self.discounts = {}
+
+    @classmethod
+    @traced()
+    def from_data(cls, df, id_index=None):
+        """
+        compute feature tables from offline data
+        :param df: DataFrame, offline data with renamed cols
+        :param id_index: IdIndex, aggregate on dense id codes
+        :return: FeatureServer
+        """
+        df_feats = prep.get_new_feats(df.copy())
+
+        return cls(fe.get_merchant_feats(df_feats, id_index=id_index),
+                   fe.get_user_feats(df_feats, id_index=id_index),
+                   fe.get_user_merchant_feats(df_feats, id_index=id_index))
+
+    def parse_discount(self, discount_rate):
+        """
+        :param discount_rate: string, like 0.95 or 100:10, None or NaN if missing
+        :return: tuple, discount_rate, is_full_reduction, full_cond, full_save
+        """
+        # missing values are parsed as NaN, same as prep.parse_discount_rate on a column
+        key = None if pd.isna(discount_rate) else discount_rate
+        parsed = self.discounts.get(key)
+        if parsed is None:
+            value = np.nan if key is None else key
+            parsed = (prep.get_discount_rate(value), prep.is_full_reduction(value),
+                      prep.get_full_reduction_cond(value), prep.get_full_reduction_save(value))
+            self.discounts[key] = parsed
+
+        return parsed
+
+    def get_event_feats(self, event):
+        """
+        feature vector of one event
+        :param event: dict, with EVENT_COLS, missing fields or values of None or NaN are treated as in batch
+        :return: ndarray, float64, in the order of feature_names
+        """
+        user_id = get_event_id(event.get('user_id'))
+        merchant_id = get_event_id(event.get('merchant_id'))
+        discount_rate, is_full, full_cond, full_save = self.parse_discount(event.get('discount_rate'))
+        distance = event.get('distance')
+        distance = -1 if pd.isna(distance) else int(distance)
+        date_received = event.get('date_received')
+        date_received = np.nan if pd.isna(date_received) else date_received
+
+        return np.concatenate([
+            (discount_rate, distance, date_received, is_full, full_cond, full_save),
+            self.merchant.get_row(merchant_id),
+            self.user.get_row(user_id),
+            self.user_merchant.get_row(-1 if user_id < 0 or merchant_id < 0 else (user_id << 32) | merchant_id),
+        ])
+
+    @traced()
+    def get_batch_feats(self, df_events):
+        """
+        features of a batch of events, same values as get_event_feats
+        cols are those of fe.relation_feature_version except the receipt (r_*), online (on_u_*) and label cols,
+        which need the receipt history of the user and the online data
+        :param df_events: DataFrame, with EVENT_COLS
+        :return: DataFrame, id cols and feature_names, rows keep the order of df_events
+        """
+        df_parsed = prep.parse_discount_rate(df_events['discount_rate'])
+        df_res = df_events[ID_COLS].reset_index(drop=True)
+        df_res['discount_rate'] = df_parsed['discount_rate'].to_numpy()
+        df_res['distance'] = df_events['distance'].astype('float64').fillna(-1).astype(int).to_numpy()
+        df_res['date_received'] = df_events['date_received'].to_numpy()
+        for col in PARSED_COLS[:-1]:
+            df_res[col] = df_parsed[col].to_numpy()
+
+        for table in [self.merchant, self.user, self.user_merchant]:
+            df_feats = pd.DataFrame(table.get_rows(df_events), columns=table.names)
+            df_res = pd.concat([df_res, df_feats], axis=1)
+
+        return df_res
+
+
+def to_json_value(value):
+    """
+    NaN is not valid json
+    :param value: float
+    :return: float or None
+    """
+    return None if value != value else float(value)
+
+
+def make_handler(server):
+    """
+    :param server: FeatureServer
+    :return: BaseHTTPRequestHandler class
+    """
+
+    class FeatureHandler(BaseHTTPRequestHandler):
+
+        def send_json(self, code, obj):
+            body = json.dumps(obj).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/health':
+                self.send_json(200, {'status': 'ok', 'features': len(server.feature_names)})
+            else:
+                self.send_json(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/features':
+                self.send_json(404, {'error': 'not found'})
+                return
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                if isinstance(payload, list):
+                    values = server.get_batch_feats(pd.DataFrame(payload, columns=EVENT_COLS))[
+                        server.feature_names].to_numpy()
+                    features = [[to_json_value(v) for v in row] for row in values]
+                else:
+                    features = [to_json_value(v) for v in server.get_event_feats(payload)]
+            except (ValueError, KeyError, TypeError) as e:
+                self.send_json(400, {'error': '{0}: {1}'.format(type(e).__name__, e)})
+                return
+            self.send_json(200, {'names': server.feature_names, 'features': features})
+
+        def log_message(self, fmt, *args):
+            logger.debug(fmt % args)
+
+    return FeatureHandler
+
+
+def serve(server, host_name=None, port_num=None):
+    """
+    blocking local http server, POST /features takes one event or a list of events as json, GET /health
+    :param server: FeatureServer
+    :param host_name: string, default is global host
+    :param port_num: int, default is global port
+    :return:
+    """
+    address = (host_name or host, port_num or port)
+    httpd = ThreadingHTTPServer(address, make_handler(server))
+    logger.info('serving {0} features on http://{1}:{2}'.format(len(server.feature_names), *address))
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+
+
+@traced()
+def main():
+    """
+    build feature tables from offline train set and serve them
+    :return:
+    """
+    df = utils.read_data(file_name='ccf_offline_stage1_train.csv', data_dir=origin_data_dir)
+    df = df[(~df['coupon_id'].isna()) & (~df['date_received'].isna())]
+    serve(FeatureServer.from_data(df))
+
+
+if __name__ == '__main__':
+
+    main()
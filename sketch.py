@@ -0,0 +1,124 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 12:37
+# @author: agent
+# @contact: agent@local
+# @file: sketch.py
+# @desc: exact and sketched per-key quantiles from mergeable value histograms
+
+import numpy as np
+import pandas as pd
+
+
+# quantile ops of aggregation.AggFeat and their levels
+QUANTILE_OPS = {'median': 0.5, 'p25': 0.25, 'p75': 0.75, 'p90': 0.9}
+# exact: histogram of raw values
+# sketch: histogram of log buckets, each quantile is within relative accuracy of the exact one
+# settings are part of the stage cache key of feature families
+settings = {'mode': 'exact', 'accuracy': 0.01}
+
+
+def configure(mode='exact', accuracy=0.01):
+    """
+    :param mode: string, exact or sketch
+    :param accuracy: float, relative accuracy of sketch, in (0, 1)
+    :return:
+    """
+    if mode not in ('exact', 'sketch'):
+        raise ValueError('mode must be exact or sketch, got {0}.'.format(mode))
+    if not 0 < accuracy < 1:
+        raise ValueError('accuracy must be in (0, 1), got {0}.'.format(accuracy))
+    settings.update(mode=mode, accuracy=accuracy)
+
+
+def is_sketched():
+    """
+    :return: boolean
+    """
+    return settings['mode'] == 'sketch'
+
+
+def quantize(values, accuracy=None):
+    """
+    map values to the representative value of their logarithmic bucket, like DDSketch
+    bucket i holds (gamma^(i-1), gamma^i] with gamma = (1+a)/(1-a), its representative is within
+    relative error a of every value in it; zero and NaN are kept, negative values are mirrored
+    :param values: ndarray, float
+    :param accuracy: float, default is settings
+    :return: ndarray, float
+    """
+    accuracy = settings['accuracy'] if accuracy is None else accuracy
+    gamma = (1 + accuracy) / (1 - accuracy)
+    values = np.asarray(values, dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        buckets = np.ceil(np.log(np.abs(values)) / np.log(gamma))
+        represent = 2 * np.power(gamma, buckets) / (gamma + 1)
+
+    return np.where((values == 0) | np.isnan(values), values, np.sign(values) * represent)
+
+
+def get_hist(df_keys, values):
+    """
+    histogram of valid values per key, quantized in sketch mode
+    :param df_keys: DataFrame, key cols aligned with values
+    :param values: ndarray, float, NaN is skipped
+    :return: DataFrame, keys, value and count
+    """
+    valid = ~np.isnan(values)
+    df_val = pd.DataFrame({key: df_keys[key].values[valid] for key in df_keys.columns})
+    df_val['value'] = quantize(values[valid]) if is_sketched() else values[valid]
+
+    return df_val.groupby(list(df_keys.columns) + ['value'], sort=False, dropna=False) \
+        .size().rename('count').reset_index()
+
+
+def merge_hists(df_hists, keys):
+    """
+    :param df_hists: list of DataFrame, from get_hist
+    :param keys: list,
+    :return: DataFrame
+    """
+    return pd.concat(df_hists, ignore_index=True) \
+        .groupby(keys + ['value'], sort=False, dropna=False)['count'].sum().reset_index()
+
+
+def get_quantiles(df_hist, keys, levels):
+    """
+    quantiles of each key from value histogram, linear interpolation between closest ranks like pandas
+    :param df_hist: DataFrame, keys, value and count of the value
+    :param keys: list,
+    :param levels: dict, name -> quantile level in [0, 1]
+    :return: DataFrame, indexed by keys, one col per level
+    """
+    df_hist = df_hist.sort_values(keys + ['value'])
+    grouped = df_hist.groupby(keys, sort=False, dropna=False)['count']
+    cum = grouped.cumsum()
+    total = grouped.transform('sum')
+
+    res = {}
+    for name, level in levels.items():
+        rank = (total - 1) * level
+        # values at rank floor and ceil, weighted by the fraction of rank
+        lo = df_hist[cum > np.floor(rank)].groupby(keys, sort=False, dropna=False)['value'].first()
+        hi = df_hist[cum > np.ceil(rank)].groupby(keys, sort=False, dropna=False)['value'].first()
+        frac = (rank - np.floor(rank)).groupby([df_hist[key] for key in keys], sort=False, dropna=False).first()
+        res[name] = lo * (1 - frac) + hi.reindex(lo.index) * frac
+
+    return pd.DataFrame(res)
+
+
+def get_sorted_quantiles(values, starts, sizes, level):
+    """
+    quantile of each group of values sorted within groups, same interpolation as get_quantiles
+    :param values: ndarray, sorted by group then value
+    :param starts: ndarray, first position of each group
+    :param sizes: ndarray, size of each group
+    :param level: float,
+    :return: ndarray
+    """
+    rank = (sizes - 1) * level
+    lo = np.floor(rank).astype(np.int64)
+    hi = np.ceil(rank).astype(np.int64)
+    frac = rank - lo
+
+    return values[starts + lo] * (1 - frac) + values[starts + hi] * frac
@@ -0,0 +1,499 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 12:50
+# @author: agent
+# @contact: agent@local
+# @file: spill.py
+# @desc: out-of-core aggregation of pair features over hash buckets spilled to disk
+
+# packages
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from aggregation import SORTED_OPS, check_keys, get_masked_cols, get_frame_cols, get_sorted_stats, get_code_stat, \
+    finalize_counts
+from id_index import as_id_array, get_pair_key, split_pair_key
+from sampling import mix64
+import receipt
+from logs import logger
+from logs.instrument import traced
+
+
+# spilled aggregation is disabled until configure() is called
+# dir: directory of bucket files, n_buckets: buckets per aggregation, chunksize: rows spilled at a time
+settings = {'dir': None, 'n_buckets': 64, 'chunksize': 500000}
+
+
+def configure(dir_path=None, n_buckets=64, chunksize=500000):
+    """
+    once enabled, user-merchant features of feature_engineering and streaming are aggregated on disk
+    :param dir_path: string, directory of bucket files, None to disable
+    :param n_buckets: int, more buckets for less memory per bucket
+    :param chunksize: int, rows of an in-memory frame spilled at a time
+    :return:
+    """
+    if n_buckets < 1 or chunksize < 1:
+        raise ValueError('n_buckets and chunksize must be positive, got {0} and {1}.'.format(n_buckets, chunksize))
+    settings.update(dir=dir_path, n_buckets=n_buckets, chunksize=chunksize)
+    if dir_path is not None:
+        os.makedirs(dir_path, exist_ok=True)
+
+
+def is_enabled():
+    """
+    :return: boolean
+    """
+    return settings['dir'] is not None
+
+
+def get_keys(df, keys):
+    """
+    one int64 key per row of one id col or of user and merchant
+    :param df: DataFrame,
+    :param keys: list, one or two id cols
+    :return: ndarray, int64
+    """
+    ids = []
+    for key in keys:
+        values, valid = as_id_array(df[key])
+        if not valid.all():
+            raise ValueError('missing {0} is not supported by spilled aggregation.'.format(key))
+        if len(values) and (values.min() < 0 or values.max() > np.iinfo(np.int32).max):
+            raise ValueError('{0} out of int32 range is not supported by spilled aggregation.'.format(key))
+        ids.append(values)
+
+    if len(keys) == 1:
+        return ids[0]
+    if len(keys) == 2:
+        return get_pair_key(*ids)
+
+    raise ValueError('spilled aggregation supports one or two key cols, got {0}.'.format(keys))
+
+
+def get_buckets(keys, n_buckets):
+    """
+    :param keys: ndarray, int64 or uint64 keys
+    :param n_buckets: int,
+    :return: ndarray, int64, bucket of each key
+    """
+    with np.errstate(over='ignore'):
+        return (mix64(keys.astype(np.uint64)) % np.uint64(n_buckets)).astype(np.int64)
+
+
+def append_buckets(records, buckets, n_buckets, get_path):
+    """
+    append records to the file of their bucket
+    :param records: ndarray, structured
+    :param buckets: ndarray, int64, bucket of each record
+    :param n_buckets: int,
+    :param get_path: callable(bucket) -> string, bucket file
+    :return:
+    """
+    # stable sort keeps rows of each bucket in row order
+    records = records[np.argsort(buckets, kind='stable')]
+    bounds = np.r_[0, np.cumsum(np.bincount(buckets, minlength=n_buckets))]
+    for bucket in np.flatnonzero(np.diff(bounds)):
+        with open(get_path(bucket), 'ab') as f:
+            records[bounds[bucket]:bounds[bucket + 1]].tofile(f)
+
+
+class SpilledAggregator(object):
+    """
+    aggregate features declared as aggregation.AggFeat chunk by chunk with bounded memory
+    rows are appended to the bucket file of their key, finalize() aggregates one memory-mapped bucket at a time
+    gives the same result as aggregation.aggregate on the concatenated chunks, keys in order of first appearance
+    """
+
+    def __init__(self, feats, dir_path=None, n_buckets=None):
+        """
+        :param feats: list of AggFeat, all with the same one or two id cols as keys
+        :param dir_path: string, parent directory of bucket files, default is settings
+        :param n_buckets: int, default is settings
+        """
+        self.feats = feats
+        self.keys = check_keys(feats)
+        self.n_buckets = settings['n_buckets'] if n_buckets is None else n_buckets
+        dir_path = settings['dir'] if dir_path is None else dir_path
+        if dir_path is not None:
+            os.makedirs(dir_path, exist_ok=True)
+        self.dir_path = tempfile.mkdtemp(prefix='spill_', dir=dir_path)
+        self.dtype = None
+        self.col_names = None
+        self.key_dtypes = None
+        self.n_rows = 0
+
+    def get_path(self, bucket):
+        """
+        :param bucket: int,
+        :return: string, bucket file
+        """
+        return os.path.join(self.dir_path, 'bucket_{0}.bin'.format(bucket))
+
+    def update(self, df):
+        """
+        spill one chunk into bucket files
+        :param df: DataFrame,
+        :return:
+        """
+        frame_cols, col_names = get_frame_cols(get_masked_cols(df, self.feats))
+        if self.dtype is None:
+            # record of key, global row number and one field per distinct masked col
+            self.dtype = np.dtype([('#key', np.int64), ('#row', np.int64)] +
+                                  [(name, values.dtype) for name, values in frame_cols.items()])
+            self.col_names = col_names
+            self.key_dtypes = {key: df[key].dtype for key in self.keys}
+
+        keys = get_keys(df, self.keys)
+        records = np.empty(len(df), dtype=self.dtype)
+        records['#key'] = keys
+        records['#row'] = np.arange(self.n_rows, self.n_rows + len(df))
+        for name, values in frame_cols.items():
+            records[name] = values
+        self.n_rows += len(df)
+
+        append_buckets(records, get_buckets(keys, self.n_buckets), self.n_buckets, self.get_path)
+
+    def aggregate_bucket(self, bucket):
+        """
+        :param bucket: int,
+        :return: DataFrame, first row, keys and features of each key in the bucket, None if the bucket is empty
+        """
+        path = self.get_path(bucket)
+        if not os.path.exists(path):
+            return None
+        records = np.memmap(path, dtype=self.dtype, mode='r')
+
+        uniques, first, groups = np.unique(records['#key'], return_index=True, return_inverse=True)
+        groups = groups.reshape(-1)
+        n_groups = len(uniques)
+        if len(self.keys) == 1:
+            ids = {self.keys[0]: uniques}
+        else:
+            ids = dict(zip(self.keys, split_pair_key(uniques)))
+
+        res = {'#row': np.asarray(records['#row'][first])}
+        res.update({key: pd.Series(values).astype(self.key_dtypes[key]) for key, values in ids.items()})
+        sorted_stats = {}
+        for feat in self.feats:
+            name = self.col_names[feat.name]
+            if feat.op in SORTED_OPS:
+                if name not in sorted_stats:
+                    sorted_stats[name] = get_sorted_stats(groups, np.asarray(records[name], dtype=np.float64), n_groups)
+                res[feat.name] = sorted_stats[name][feat.op]
+            else:
+                res[feat.name] = get_code_stat(feat.op, groups, np.asarray(records[name], dtype=np.float64), n_groups)
+        del records
+
+        return pd.DataFrame(res)
+
+    def finalize(self):
+        """
+        aggregate bucket by bucket, bucket files are removed afterwards
+        :return: DataFrame, group cols and one col per feature
+        """
+        try:
+            df_buckets = [df for df in (self.aggregate_bucket(bucket) for bucket in range(self.n_buckets))
+                          if df is not None]
+        finally:
+            self.close()
+
+        if not df_buckets:
+            return pd.DataFrame({name: [] for name in self.keys + [feat.name for feat in self.feats]})
+
+        df_agg = pd.concat(df_buckets, ignore_index=True)
+        df_agg = df_agg.iloc[np.argsort(df_agg['#row'].to_numpy(), kind='stable')].reset_index(drop=True)
+        logger.debug('{0} rows spilled into {1} buckets, {2} keys aggregated'.format(
+            self.n_rows, len(df_buckets), len(df_agg)))
+
+        return finalize_counts(df_agg[self.keys + [feat.name for feat in self.feats]].copy(), self.feats)
+
+    def close(self):
+        """
+        remove bucket files
+        :return:
+        """
+        shutil.rmtree(self.dir_path, ignore_errors=True)
+
+
+@traced()
+def aggregate_chunks(chunks, feats, dir_path=None, n_buckets=None):
+    """
+    spilled aggregation of a stream of chunks
+    :param chunks: iterable of DataFrame
+    :param feats: list of AggFeat, all with the same one or two id cols as keys
+    :param dir_path: string, default is settings
+    :param n_buckets: int, default is settings
+    :return: DataFrame, group cols and one col per feature
+    """
+    aggregator = SpilledAggregator(feats, dir_path=dir_path, n_buckets=n_buckets)
+    try:
+        for df in chunks:
+            aggregator.update(df)
+    except BaseException:
+        aggregator.close()
+        raise
+
+    return aggregator.finalize()
+
+
+@traced()
+def aggregate(df, feats, dir_path=None, n_buckets=None):
+    """
+    spilled version of aggregation.aggregate, the frame is spilled settings['chunksize'] rows at a time
+    :param df: DataFrame,
+    :param feats: list of AggFeat, all with the same one or two id cols as keys
+    :param dir_path: string, default is settings
+    :param n_buckets: int, default is settings
+    :return: DataFrame, group cols and one col per feature
+    """
+    chunksize = settings['chunksize']
+    chunks = (df.iloc[start:start + chunksize] for start in range(0, len(df), chunksize))
+
+    return aggregate_chunks(chunks, feats, dir_path=dir_path, n_buckets=n_buckets)
+
+
+def get_row_hashes(df):
+    """
+    :param df: DataFrame,
+    :return: ndarray, uint64 hash of the values of each row, -0.0 hashes like 0.0 as they are equal
+    """
+    float_cols = [col for col in df.columns if pd.api.types.is_float_dtype(df[col])]
+    if float_cols:
+        df = df.assign(**{col: df[col] + 0.0 for col in float_cols})
+
+    return pd.util.hash_pandas_object(df, index=False).values
+
+
+class SpilledFirstRows(object):
+    """
+    first occurrence of each distinct row over a stream of chunks, for drop_duplicates across chunks
+    row hashes and row values are appended to bucket files, finalize() marks the first row of each distinct row
+    bucket by bucket into a memory-mapped mask, so memory is bounded by a chunk or a bucket instead of the number
+    of rows; rows with equal hashes are told apart by their values, so the result equals DataFrame.duplicated
+    values of non numeric cols are spilled as codes of a dictionary kept in memory
+    """
+
+    def __init__(self, dir_path=None, n_buckets=None):
+        """
+        :param dir_path: string, parent directory of bucket files, default is settings
+        :param n_buckets: int, default is settings
+        """
+        self.n_buckets = settings['n_buckets'] if n_buckets is None else n_buckets
+        dir_path = settings['dir'] if dir_path is None else dir_path
+        if dir_path is not None:
+            os.makedirs(dir_path, exist_ok=True)
+        self.dir_path = tempfile.mkdtemp(prefix='spill_rows_', dir=dir_path)
+        self.n_rows = 0
+        self.mask = None
+        self.dtype = None
+        self.uniques = {}
+
+    def get_path(self, bucket):
+        """
+        :param bucket: int,
+        :return: string, bucket file
+        """
+        return os.path.join(self.dir_path, 'bucket_{0}.bin'.format(bucket))
+
+    def get_codes(self, col, values):
+        """
+        codes of non numeric values, new values are added to the dictionary of the col
+        :param col: string,
+        :param values: ndarray, object, no missing value
+        :return: ndarray, int64
+        """
+        index = self.uniques.get(col, pd.Index([], dtype=object))
+        codes = index.get_indexer(values)
+        if (codes < 0).any():
+            index = index.append(pd.Index(pd.unique(values[codes < 0]), dtype=object))
+            self.uniques[col] = index
+            codes = index.get_indexer(values)
+
+        return codes.astype(np.int64)
+
+    def get_row_values(self, df):
+        """
+        exact value of every col as int64, missing values are flagged and stored as 0
+        :param df: DataFrame,
+        :return: list, (values, missing) of each col
+        """
+        res = []
+        for col in df.columns:
+            s = df[col]
+            if pd.api.types.is_bool_dtype(s) or pd.api.types.is_integer_dtype(s):
+                missing = s.isna().to_numpy()
+                values = s.to_numpy(dtype=np.int64, na_value=0)
+            elif pd.api.types.is_float_dtype(s):
+                # -0.0 equals 0.0 and all NaN are the same missing value
+                values = s.to_numpy(dtype=np.float64, na_value=np.nan) + 0.0
+                missing = np.isnan(values)
+                values = np.where(missing, 0.0, values).view(np.int64)
+            else:
+                values = s.astype(object).to_numpy()
+                missing = pd.isna(values)
+                codes = np.zeros(len(values), dtype=np.int64)
+                codes[~missing] = self.get_codes(col, values[~missing])
+                values = codes
+            res.append((values, missing))
+
+        return res
+
+    def update(self, df):
+        """
+        spill row hashes and values of one chunk, rows are numbered across chunks
+        :param df: DataFrame, every chunk with the same cols
+        :return:
+        """
+        if self.dtype is None:
+            self.dtype = np.dtype([('#hash', np.uint64), ('#row', np.int64)] +
+                                  [(field, dtype) for i in range(df.shape[1])
+                                   for field, dtype in [('v{0}'.format(i), np.int64), ('m{0}'.format(i), np.bool_)]])
+        records = np.empty(len(df), dtype=self.dtype)
+        records['#hash'] = get_row_hashes(df)
+        records['#row'] = np.arange(self.n_rows, self.n_rows + len(df))
+        for i, (values, missing) in enumerate(self.get_row_values(df)):
+            records['v{0}'.format(i)] = values
+            records['m{0}'.format(i)] = missing
+        self.n_rows += len(df)
+
+        append_buckets(records, get_buckets(records['#hash'], self.n_buckets), self.n_buckets, self.get_path)
+
+    def finalize(self):
+        """
+        mark the first row of every distinct row
+        :return:
+        """
+        self.mask = np.memmap(os.path.join(self.dir_path, 'first.bin'), dtype=np.bool_, mode='w+',
+                              shape=(max(self.n_rows, 1),))
+        fields = [name for name in (self.dtype.names if self.dtype is not None else ()) if name != '#row']
+        for bucket in range(self.n_buckets):
+            path = self.get_path(bucket)
+            if not os.path.exists(path):
+                continue
+            records = np.memmap(path, dtype=self.dtype, mode='r')
+            # equal rows are adjacent after sorting by hash then values, the first row number comes first
+            order = np.lexsort([records['#row']] + [records[name] for name in reversed(fields)])
+            first = np.ones(len(order), dtype=bool)
+            first[1:] = False
+            for name in fields:
+                values = records[name][order]
+                first[1:] |= values[1:] != values[:-1]
+            self.mask[records['#row'][order][first]] = True
+            del records
+            os.remove(path)
+        self.mask.flush()
+        logger.debug('{0} rows spilled, {1} distinct'.format(self.n_rows, int(self.mask[:self.n_rows].sum())))
+
+    def take(self, start, stop):
+        """
+        :param start: int, first row number
+        :param stop: int, row number after the last
+        :return: ndarray, boolean, rows that are the first occurrence
+        """
+        return np.array(self.mask[start:stop])
+
+    def close(self):
+        """
+        remove bucket and mask files
+        :return:
+        """
+        self.mask = None
+        shutil.rmtree(self.dir_path, ignore_errors=True)
+
+
+class SpilledReceipts(object):
+    """
+    per receipt features of receipt.compute over a stream of chunks
+    keys and receipt day of every row are appended to bucket files by the key shared by all features, e.g. user_id,
+    so all receipts of a group are in one bucket; finalize() computes bucket by bucket into a memory-mapped matrix
+    indexed by row number, gives the same result as receipt.compute on the concatenated chunks
+    """
+
+    def __init__(self, feats, dir_path=None, n_buckets=None):
+        """
+        :param feats: list of ReceiptFeat, with a key col in common
+        :param dir_path: string, parent directory of bucket files, default is settings
+        :param n_buckets: int, default is settings
+        """
+        common = set(feats[0].keys).intersection(*[feat.keys for feat in feats])
+        if not common:
+            raise ValueError('receipt features share no key col to partition by.')
+        self.feats = feats
+        self.part_key = [key for key in feats[0].keys if key in common][0]
+        self.cols = sorted({key for feat in feats for key in feat.keys}) + ['date_received']
+        self.dtype = np.dtype([('#row', np.int64)] + [(col, np.float64) for col in self.cols])
+        self.n_buckets = settings['n_buckets'] if n_buckets is None else n_buckets
+        dir_path = settings['dir'] if dir_path is None else dir_path
+        if dir_path is not None:
+            os.makedirs(dir_path, exist_ok=True)
+        self.dir_path = tempfile.mkdtemp(prefix='spill_receipts_', dir=dir_path)
+        self.n_rows = 0
+        self.values = None
+        self.has_nan = None
+
+    def get_path(self, bucket):
+        """
+        :param bucket: int,
+        :return: string, bucket file
+        """
+        return os.path.join(self.dir_path, 'bucket_{0}.bin'.format(bucket))
+
+    def update(self, df):
+        """
+        spill keys and receipt day of one chunk
+        :param df: DataFrame,
+        :return:
+        """
+        records = np.empty(len(df), dtype=self.dtype)
+        records['#row'] = np.arange(self.n_rows, self.n_rows + len(df))
+        for col in self.cols:
+            records[col] = pd.Series(df[col], copy=False).astype('float64').to_numpy()
+        self.n_rows += len(df)
+
+        keys = np.nan_to_num(records[self.part_key], nan=-1).astype(np.int64)
+        append_buckets(records, get_buckets(keys, self.n_buckets), self.n_buckets, self.get_path)
+
+    def finalize(self):
+        """
+        compute features bucket by bucket
+        :return:
+        """
+        self.values = np.memmap(os.path.join(self.dir_path, 'values.bin'), dtype=np.float64, mode='w+',
+                                shape=(max(self.n_rows, 1), len(self.feats)))
+        self.has_nan = np.zeros(len(self.feats), dtype=bool)
+        for bucket in range(self.n_buckets):
+            path = self.get_path(bucket)
+            if not os.path.exists(path):
+                continue
+            records = np.memmap(path, dtype=self.dtype, mode='r')
+            df = pd.DataFrame({col: np.asarray(records[col]) for col in self.cols})
+            res = receipt.compute(df, self.feats).to_numpy(dtype=np.float64)
+            self.values[np.asarray(records['#row'])] = res
+            self.has_nan |= np.isnan(res).any(axis=0)
+            del records
+            os.remove(path)
+        self.values.flush()
+
+    def take(self, start, stop, index=None):
+        """
+        :param start: int, first row number
+        :param stop: int, row number after the last
+        :param index: Index, index of the result, default is the row numbers
+        :return: DataFrame, one col per feature, counts are int if no row of the stream misses them
+        """
+        values = np.array(self.values[start:stop])
+        cols = {}
+        for i, feat in enumerate(self.feats):
+            cols[feat.name] = values[:, i] if self.has_nan[i] or feat.op != 'count' else values[:, i].astype(np.int64)
+
+        return pd.DataFrame(cols, index=pd.RangeIndex(start, stop) if index is None else index)
+
+    def close(self):
+        """
+        remove bucket and value files
+        :return:
+        """
+        self.values = None
+        shutil.rmtree(self.dir_path, ignore_errors=True)
@@ -0,0 +1,174 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 12:26
+# @author: agent
+# @contact: agent@local
+# @file: stage_cache.py
+# @desc: content-addressed caching of pipeline stages
+
+import os
+import glob
+import hashlib
+import inspect
+import functools
+import pandas as pd
+from logs import logger
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # results are pickled without pyarrow
+    pa = None
+    feather = None
+
+
+# cache is disabled until configure() is called, e.g. in __main__
+cache_dir = None
+max_bytes = 4 << 30
+
+
+def configure(dir_path, max_sz=4 << 30):
+    """
+    enable stage cache
+    :param dir_path: string, directory of cached results, None to disable
+    :param max_sz: int, max total bytes of cached results, least recently used are evicted first
+    :return:
+    """
+    global cache_dir, max_bytes
+
+    cache_dir = dir_path
+    max_bytes = max_sz
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+
+
+def get_source(obj):
+    """
+    source text of code a stage depends on
+    :param obj: module, function, list/tuple of them or any other object
+    :return: string
+    """
+    if isinstance(obj, (list, tuple)):
+        return '\n'.join(get_source(item) for item in obj)
+    if inspect.ismodule(obj) or callable(obj):
+        try:
+            return inspect.getsource(obj)
+        except (OSError, TypeError):
+            return getattr(obj, '__qualname__', repr(obj))
+
+    return repr(obj)
+
+
+def get_fingerprint(obj):
+    """
+    fingerprint of a stage argument, DataFrame is hashed by content, also inside lists and tuples
+    :param obj: object
+    :return: string
+    """
+    if isinstance(obj, pd.DataFrame):
+        md5 = hashlib.md5(pd.util.hash_pandas_object(obj, index=True).values.tobytes())
+        md5.update(repr(list(zip(obj.columns, obj.dtypes.astype(str)))).encode('utf-8'))
+        return md5.hexdigest()
+    if isinstance(obj, (list, tuple)):
+        return '[{0}]'.format(', '.join(get_fingerprint(item) for item in obj))
+
+    return get_source(obj)
+
+
+def save_result(res, path):
+    """
+    save result of a stage, DataFrame as feather with its index
+    :param res: object
+    :param path: string, without extension
+    :return: string, path of saved file
+    """
+    if isinstance(res, pd.DataFrame) and feather is not None:
+        feather.write_feather(pa.Table.from_pandas(res, preserve_index=True), path + '.feather')
+        return path + '.feather'
+
+    pd.to_pickle(res, path + '.pkl')
+
+    return path + '.pkl'
+
+
+def load_result(path):
+    """
+    :param path: string, path of saved file
+    :return: object
+    """
+    if path.endswith('.feather'):
+        return feather.read_table(path, memory_map=True).to_pandas()
+
+    return pd.read_pickle(path)
+
+
+def evict():
+    """
+    remove least recently used results until total size is under max_bytes
+    :return:
+    """
+    stats = []
+    for path in glob.glob(os.path.join(cache_dir, '*')):
+        try:
+            stats.append((path, os.stat(path)))
+        except FileNotFoundError:  # evicted by a stage running concurrently
+            continue
+    stats.sort(key=lambda item: item[1].st_mtime)
+    total = sum(stat.st_size for _, stat in stats)
+    for path, stat in stats:
+        if total <= max_bytes:
+            break
+        total -= stat.st_size
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            continue
+        logger.info('stage cache {0} is evicted'.format(path))
+
+
+def cached_stage(deps=None, ignore=None):
+    """
+    decorator caching result of a stage
+    key is hash of function source, sources of deps and fingerprints of all arguments,
+    so a stage is only recomputed if its input data, parameters or code changed
+    only pure stages should be cached: the stage does not run when the result is loaded from cache,
+    so its side effects, e.g. saving files, are skipped and input frames are not modified in place as on a miss,
+    callers must use the returned result only
+    :param deps: list, functions or declarations the stage depends on besides its own source
+    :param ignore: list, names of arguments not changing the result, e.g. n_jobs
+    :return: decorator
+    """
+    ignore = set(ignore or [])
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if cache_dir is None:
+                return func(*args, **kwargs)
+
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            md5 = hashlib.md5(get_source(func).encode('utf-8'))
+            md5.update(get_source(deps).encode('utf-8'))
+            for name, value in bound.arguments.items():
+                if name not in ignore:
+                    md5.update('{0}={1}'.format(name, get_fingerprint(value)).encode('utf-8'))
+            path = os.path.join(cache_dir, '{0}-{1}'.format(func.__name__, md5.hexdigest()))
+
+            for cached_path in (path + '.feather', path + '.pkl'):
+                if os.path.exists(cached_path):
+                    os.utime(cached_path)  # mark as recently used
+                    logger.info('stage {0} is loaded from cache {1}'.format(func.__name__, cached_path))
+                    return load_result(cached_path)
+
+            res = func(*args, **kwargs)
+            save_result(res, path)
+            evict()
+
+            return res
+
+        return wrapper
+
+    return decorator
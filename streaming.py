@@ -0,0 +1,395 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 12:19
+# @author: agent
+# @contact: agent@local
+# @file: streaming.py
+# @desc: streaming feature generation with mergeable partial aggregation states
+
+import time
+import numpy as np
+import pandas as pd
+import utilities as utils
+import data_preprocess as prep
+import feature_engineering as fe
+import sketch
+import spill
+from aggregation import check_keys, get_masked_cols, get_frame_cols, finalize_counts
+from logs import logger
+from logs.instrument import traced
+
+
+# reducer of each partial column when merging states
+MERGE_OPS = {'count': 'sum', 'sum': 'sum', 'max': 'max', 'min': 'min'}
+# partial states of chunks buffered before they are merged into the state in one grouped pass
+MERGE_EVERY = 16
+TRAIN_FILE = 'ccf_offline_stage1_train.csv'
+TEST_FILE = 'ccf_offline_stage1_test_revised.csv'
+TEST_COLS = ['user_id', 'merchant_id', 'coupon_id', 'discount_rate', 'distance', 'date_received']
+
+
+def hash_keys(df_keys):
+    """
+    hash each row of key cols, faster than isin on MultiIndex
+    :param df_keys: DataFrame, key cols
+    :return: ndarray, uint64
+    """
+    return pd.util.hash_pandas_object(df_keys, index=False).values
+
+
+class StreamingAggregator(object):
+    """
+    aggregate features declared as aggregation.AggFeat chunk by chunk
+    partial states are mergeable: counts, sums, min/max, sum and count for mean,
+    value histogram for quantiles (quantized in sketch mode) and distinct values for nunique
+    partial states of chunks are buffered and merged into the state every MERGE_EVERY chunks, so the state is not
+    regrouped for every chunk
+    finalize() gives the same result as aggregation.aggregate on the concatenated chunks
+    """
+
+    def __init__(self, feats):
+        """
+        :param feats: list of AggFeat, all with the same group cols
+        """
+        self.feats = feats
+        self.keys = check_keys(feats)
+        self.scalar = None
+        self.hists = {feat.name: None for feat in feats if feat.op in sketch.QUANTILE_OPS}
+        self.distinct = {feat.name: None for feat in feats if feat.op == 'nunique'}
+        self.pending = []
+
+    def get_partial(self, df):
+        """
+        partial states of one chunk
+        :param df: DataFrame,
+        :return: tuple, scalar states indexed by keys, value histograms and distinct values
+        """
+        cols = get_masked_cols(df, self.feats)
+        frame_cols, col_names = get_frame_cols(cols)
+        key_cols = [df[key] for key in self.keys]
+
+        ops = {}
+        for feat in self.feats:
+            if feat.op in ('count', 'sum', 'max', 'min'):
+                ops[feat.name] = (col_names[feat.name], 'sum' if feat.op == 'count' else feat.op)
+            elif feat.op == 'mean':
+                ops[feat.name + '#sum'] = (col_names[feat.name], 'sum')
+                ops[feat.name + '#n'] = (col_names[feat.name], 'count')
+        # ops is never empty since keys of all rows are kept
+        ops['#rows'] = ('#rows', 'sum')
+        frame_cols['#rows'] = np.ones(len(df), dtype=np.int64)
+        scalar = pd.DataFrame(frame_cols, index=df.index).groupby(key_cols, sort=False, dropna=False).agg(**ops)
+
+        hists = {}
+        distinct = {}
+        for feat in self.feats:
+            if feat.op in sketch.QUANTILE_OPS:
+                hists[feat.name] = sketch.get_hist(df[self.keys], cols[feat.name])
+            elif feat.op == 'nunique':
+                values = cols[feat.name]
+                valid = ~np.isnan(values)
+                df_val = pd.DataFrame({key: df[key].values[valid] for key in self.keys})
+                df_val['value'] = values[valid]
+                distinct[feat.name] = df_val.drop_duplicates()
+
+        return scalar, hists, distinct
+
+    def merge(self, scalar, hists, distinct):
+        """
+        buffer partial states, they are merged into current states once MERGE_EVERY are buffered
+        :param scalar: DataFrame,
+        :param hists: dict,
+        :param distinct: dict,
+        :return:
+        """
+        self.pending.append((scalar, hists, distinct))
+        if len(self.pending) >= MERGE_EVERY:
+            self.flush()
+
+    def flush(self):
+        """
+        merge buffered partial states and current states, one grouped pass for each kind of state
+        :return:
+        """
+        if not self.pending:
+            return
+        partials = ([(self.scalar, self.hists, self.distinct)] if self.scalar is not None else []) + self.pending
+        self.pending = []
+
+        scalars = [scalar for scalar, _, _ in partials]
+        if len(scalars) > 1:
+            ops = {col: 'sum' for col in scalars[0].columns}
+            ops.update({feat.name: MERGE_OPS[feat.op] for feat in self.feats if feat.op in MERGE_OPS})
+            # concat keeps keys in order of first appearance across chunks
+            self.scalar = pd.concat(scalars) \
+                .groupby(level=list(range(len(self.keys))), sort=False, dropna=False).agg(ops)
+        else:
+            self.scalar = scalars[0]
+
+        hists = {}
+        for name in self.hists:
+            df_hists = [partial[name] for _, partial, _ in partials]
+            hists[name] = sketch.merge_hists(df_hists, self.keys) if len(df_hists) > 1 else df_hists[0]
+        self.hists = hists
+
+        distinct = {}
+        for name in self.distinct:
+            df_vals = [partial[name] for _, _, partial in partials]
+            distinct[name] = pd.concat(df_vals, ignore_index=True).drop_duplicates() if len(df_vals) > 1 \
+                else df_vals[0]
+        self.distinct = distinct
+
+    def is_empty(self):
+        """
+        :return: boolean, True if no chunk is applied
+        """
+        return self.scalar is None and not self.pending
+
+    def get_state(self):
+        """
+        partial states, can be persisted and merged later
+        :return: dict
+        """
+        self.flush()
+
+        return {'scalar': self.scalar, 'hists': self.hists, 'distinct': self.distinct}
+
+    def set_state(self, state):
+        """
+        restore partial states from get_state
+        :param state: dict
+        :return:
+        """
+        self.scalar = state['scalar']
+        self.hists = state['hists']
+        self.distinct = state['distinct']
+        self.pending = []
+
+    def merge_state(self, state):
+        """
+        merge partial states of another aggregator with the same features
+        :param state: dict, from get_state
+        :return:
+        """
+        if state['scalar'] is not None:
+            self.merge(state['scalar'], state['hists'], state['distinct'])
+
+    def select(self, index):
+        """
+        aggregator restricted to some keys, so that only their features are finalized
+        :param index: Index or MultiIndex, keys to keep
+        :return: StreamingAggregator
+        """
+        self.flush()
+        selected = hash_keys(index.to_frame(index=False))
+
+        def select_rows(df):
+            return df[np.isin(hash_keys(df[self.keys]), selected)]
+
+        aggregator = StreamingAggregator(self.feats)
+        aggregator.scalar = self.scalar[np.isin(hash_keys(self.scalar.index.to_frame(index=False)), selected)]
+        aggregator.hists = {name: select_rows(df) for name, df in self.hists.items()}
+        aggregator.distinct = {name: select_rows(df) for name, df in self.distinct.items()}
+
+        return aggregator
+
+    def update(self, df):
+        """
+        apply one chunk
+        :param df: DataFrame,
+        :return:
+        """
+        self.merge(*self.get_partial(df))
+
+    def finalize(self):
+        """
+        finalize states into features
+        :return: DataFrame, group cols and one col per feature
+        """
+        self.flush()
+        index = self.scalar.index
+        df_agg = pd.DataFrame(index=index)
+        for feat in self.feats:
+            if feat.op in MERGE_OPS:
+                df_agg[feat.name] = self.scalar[feat.name]
+            elif feat.op == 'mean':
+                n = self.scalar[feat.name + '#n']
+                df_agg[feat.name] = self.scalar[feat.name + '#sum'] / n.where(n > 0)
+            elif feat.op in sketch.QUANTILE_OPS:
+                df_quantile = sketch.get_quantiles(self.hists[feat.name], self.keys,
+                                                   {feat.name: sketch.QUANTILE_OPS[feat.op]})
+                df_agg[feat.name] = df_quantile[feat.name].reindex(index)
+            elif feat.op == 'nunique':
+                df_val = self.distinct[feat.name]
+                counts = df_val.groupby(self.keys, sort=False, dropna=False).size()
+                df_agg[feat.name] = counts.reindex(index).fillna(0).astype(np.int64)
+            else:
+                raise ValueError('op {0} is not supported in streaming mode.'.format(feat.op))
+
+        df_agg = df_agg.reset_index()
+        df_agg.columns = self.keys + [feat.name for feat in self.feats]
+
+        return finalize_counts(df_agg, self.feats)
+
+
+def get_stream_relation_feats(chunks, consumers=None):
+    """
+    aggregate merchant, user and user-merchant features over a stream of chunks
+    chunks are expected to be processed by prep.get_new_feats, same as relation_feature_version
+    user-merchant states are spilled to disk buckets once spill is configured
+    :param chunks: iterable of DataFrame
+    :param consumers: list, other objects with update(df) fed with every chunk of the same pass
+    :return: tuple of DataFrame, merchant, user and user-merchant features
+    """
+    aggregators = [StreamingAggregator(fe.MERCHANT_FEATS),
+                   StreamingAggregator(fe.USER_FEATS),
+                   spill.SpilledAggregator(fe.USER_MERCHANT_FEATS) if spill.is_enabled()
+                   else StreamingAggregator(fe.USER_MERCHANT_FEATS)]
+    for df in chunks:
+        for aggregator in aggregators + list(consumers or []):
+            aggregator.update(df)
+
+    df_merchant_feat, df_user_feat, df_user_merchant_feat = [aggregator.finalize() for aggregator in aggregators]
+
+    return (fe.add_merchant_rate_feats(df_merchant_feat),
+            fe.add_user_rate_feats(df_user_feat),
+            fe.add_user_merchant_rate_feats(df_user_merchant_feat))
+
+
+def get_stream_family_feats(chunks, consumers=None, df_online_feat=None):
+    """
+    streaming version of feature_engineering.get_family_feats
+    :param chunks: iterable of DataFrame, processed by prep.get_new_feats
+    :param consumers: list, other objects with update(df) fed with every chunk of the same pass
+    :param df_online_feat: DataFrame, output of fe.get_online_feats
+    :return: list, (features DataFrame, key cols) of each family
+    """
+    df_merchant_feat, df_user_feat, df_user_merchant_feat = get_stream_relation_feats(chunks, consumers=consumers)
+    family_feats = [(df_merchant_feat, ['merchant_id']), (df_user_feat, ['user_id']),
+                    (df_user_merchant_feat, ['user_id', 'merchant_id'])]
+    if df_online_feat is not None:
+        family_feats.append((df_online_feat, ['user_id']))
+
+    return family_feats
+
+
+def iter_prep_chunks(file_name, data_dir, chunksize, rename_col=None, row_filter=None):
+    """
+    read data chunk by chunk, filter rows and add basic features
+    :param file_name: string,
+    :param data_dir: string,
+    :param chunksize: int,
+    :param rename_col: list,
+    :param row_filter: callable(DataFrame) -> boolean Series, rows to keep
+    :return: generator of DataFrame
+    """
+    for df in utils.read_data(file_name=file_name, rename_col=rename_col, data_dir=data_dir, chunksize=chunksize):
+        if row_filter is not None:
+            df = df[row_filter(df)].copy()
+        yield prep.get_new_feats(df)
+
+
+@traced()
+def relation_feature_stream(file_name, data_dir, is_train, chunksize=200000, rename_col=None, row_filter=None,
+                            drop_duplicates=True, df_online_feat=None, family_feats=None):
+    """
+    streaming version of feature_engineering.relation_feature_version, gives the same rows and cols
+    pass 1 aggregates features over chunks, spills receipts and row hashes to disk buckets,
+    pass 2 joins features back chunk by chunk,
+    so peak memory is bounded by chunksize, the size of the feature tables and one bucket of spill.settings
+    :param file_name: string,
+    :param data_dir: string,
+    :param is_train: boolean,
+    :param chunksize: int, rows of each chunk, smaller chunk for lower peak memory
+    :param rename_col: list,
+    :param row_filter: callable(DataFrame) -> boolean Series, rows to keep
+    :param drop_duplicates: boolean, drop duplicated rows across chunks, the first occurrence is kept
+    :param df_online_feat: DataFrame, output of fe.get_online_feats, joined by user if given
+    :param family_feats: list, output of get_stream_family_feats joined as it is, e.g. families of the train set
+        for test rows, which have no consume date; families are aggregated in pass 1 if None
+    :return: generator of DataFrame
+    """
+    logger.info('======== STREAMING RELATION VERSION FEATURE PREPROCESS START ========')
+    t0 = time.time()
+
+    receipts = spill.SpilledReceipts(fe.RECEIPT_FEATS)
+    first_rows = spill.SpilledFirstRows() if drop_duplicates else None
+    consumers = [receipts] + ([first_rows] if drop_duplicates else [])
+    try:
+        chunks = iter_prep_chunks(file_name, data_dir, chunksize, rename_col=rename_col, row_filter=row_filter)
+        if family_feats is None:
+            family_feats = get_stream_family_feats(chunks, consumers=consumers, df_online_feat=df_online_feat)
+        else:
+            for df in chunks:
+                for consumer in consumers:
+                    consumer.update(df)
+        receipts.finalize()
+        if drop_duplicates:
+            first_rows.finalize()
+        logger.info('features aggregated in {0}s.'.format(round(time.time() - t0, 3)))
+
+        start = 0
+        n_rows = 0
+        for df_res in iter_prep_chunks(file_name, data_dir, chunksize, rename_col=rename_col, row_filter=row_filter):
+            stop = start + len(df_res)
+            df_receipt_feat = receipts.take(start, stop, index=df_res.index)
+            for col in df_receipt_feat.columns:
+                df_res[col] = df_receipt_feat[col]
+            if drop_duplicates:
+                # rows are deduplicated before the joins, features only depend on the cols compared
+                df_res = df_res[first_rows.take(start, stop)]
+            start = stop
+
+            for df_feat, keys in family_feats:
+                df_res = df_res.merge(df_feat, on=keys, how='left')
+            if is_train:
+                df_res = prep.get_new_label(df_res)
+
+            n_rows += len(df_res)
+            yield df_res
+    finally:
+        receipts.close()
+        if drop_duplicates:
+            first_rows.close()
+
+    logger.info('process used time {0}s with {1} rows.'.format(round(time.time() - t0, 3), n_rows))
+    logger.info('======== STREAMING RELATION VERSION FEATURE PREPROCESS END ========')
+
+
+def relation_feature_stream_generator(origin_data_dir, feat_data_dir, chunksize=200000, use_online=False):
+    """
+    streaming version of feature_engineering.relation_feature_generator for files larger than RAM
+    families are aggregated from the train stream once and joined to both sets, as in relation_feature_generator
+    :param origin_data_dir: string,
+    :param feat_data_dir: string,
+    :param chunksize: int,
+    :param use_online: boolean, join online features streamed from the online data
+    :return:
+    """
+    df_online_feat = None
+    if use_online:
+        df_online_feat = fe.get_online_feats(utils.read_data(
+            file_name='ccf_online_stage1_train.csv', rename_col=utils.ONLINE_COLS, data_dir=origin_data_dir,
+            chunksize=fe.ONLINE_CHUNK_SZ, usecols=fe.ONLINE_USECOLS))
+
+    def is_received(df):
+        return (~df['coupon_id'].isna()) & (~df['date_received'].isna())
+
+    family_feats = get_stream_family_feats(
+        iter_prep_chunks(TRAIN_FILE, origin_data_dir, chunksize, row_filter=is_received),
+        df_online_feat=df_online_feat)
+
+    # train features
+    chunks = relation_feature_stream(TRAIN_FILE, data_dir=origin_data_dir, is_train=True, chunksize=chunksize,
+                                     row_filter=is_received, family_feats=family_feats)
+    utils.save_data_chunks(chunks, file_name='train_relation_feature_stream', data_dir=feat_data_dir)
+
+    # test features
+    chunks = relation_feature_stream(TEST_FILE, data_dir=origin_data_dir, is_train=False, chunksize=chunksize,
+                                     rename_col=TEST_COLS, family_feats=family_feats)
+    utils.save_data_chunks(chunks, file_name='test_relation_feature_stream', data_dir=feat_data_dir)
+
+
+if __name__ == '__main__':
+
+    relation_feature_stream_generator(origin_data_dir='data/origin', feat_data_dir='data/features', use_online=True)
@@ -0,0 +1,66 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 13:15
+# @author: agent
+# @contact: agent@local
+# @file: conftest.py
+# @desc: shared synthetic data of the tests
+
+import os
+import sys
+import logging
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import utilities as utils  # noqa: E402
+from benchmarks.synthetic import gen_offline_data  # noqa: E402
+from tests import reference  # noqa: E402
+from logs import logger, file_handler  # noqa: E402
+
+
+# tests do not append to the log file of real runs
+logger.removeHandler(file_handler)
+file_handler.close()
+logger.addHandler(logging.NullHandler())
+
+
+TRAIN_FILE = 'ccf_offline_stage1_train.csv'
+TEST_FILE = 'ccf_offline_stage1_test_revised.csv'
+TEST_COLS = ['user_id', 'merchant_id', 'coupon_id', 'discount_rate', 'distance', 'date_received']
+N_ROWS = 20000
+
+
+@pytest.fixture(scope='session')
+def data_dir(tmp_path_factory):
+    """
+    synthetic offline train and test files, with 'null' discount rates, distances and dates
+    """
+    path = str(tmp_path_factory.mktemp('origin'))
+    gen_offline_data(path, N_ROWS, seed=10)
+
+    return path
+
+
+@pytest.fixture
+def df_raw(data_dir):
+    """
+    offline train data read as the baseline did, default dtypes
+    """
+    return reference.read_data(TRAIN_FILE, data_dir)
+
+
+@pytest.fixture
+def df_train(data_dir):
+    """
+    offline train data read with compact dtypes
+    """
+    return utils.read_data(TRAIN_FILE, data_dir=data_dir, use_cache=False)
+
+
+@pytest.fixture
+def df_test(data_dir):
+    """
+    offline test data read with compact dtypes
+    """
+    return utils.read_data(TEST_FILE, rename_col=TEST_COLS, data_dir=data_dir, use_cache=False)
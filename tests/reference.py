@@ -0,0 +1,205 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 13:15
+# @author: agent
+# @contact: agent@local
+# @file: reference.py
+# @desc: row-wise baseline of data_preprocess and feature_engineering, prints removed, expected values of tests
+
+# packages
+import numpy as np
+import pandas as pd
+import utilities as utils
+import data_preprocess as prep
+
+
+RAW_COLS = ['user_id', 'merchant_id', 'coupon_id', 'discount_rate', 'distance', 'date_received', 'date']
+
+
+def read_data(file_name, data_dir, rename_col=None):
+    """
+    read csv with default dtypes
+    :param file_name: string,
+    :param data_dir: string,
+    :param rename_col: list
+    :return: DataFrame
+    """
+    df = pd.read_csv('{0}/{1}'.format(data_dir, file_name), keep_default_na=True)
+    df.columns = rename_col if rename_col else RAW_COLS
+
+    return df
+
+
+def get_new_feats(df):
+    """
+    :param df: DataFrame
+    :return: DataFrame
+    """
+    df['is_full_reduction'] = df['discount_rate'].apply(prep.is_full_reduction)
+    df['full_cond'] = df['discount_rate'].apply(prep.get_full_reduction_cond)
+    df['full_save'] = df['discount_rate'].apply(prep.get_full_reduction_save)
+    df['discount_rate'] = df['discount_rate'].apply(prep.get_discount_rate)
+    df['distance'] = df['distance'].replace(np.nan, -1).astype(int)
+
+    return df
+
+
+def get_new_label(df):
+    """
+    :param df: DataFrame
+    :return: DataFrame
+    """
+    df['days_gap'] = df.apply(lambda row: utils.get_diff_btw_dates(row['date_received'], row['date']), axis=1)
+    df['label'] = df.apply(lambda row: prep.get_label(row['date_received'], row['date']), axis=1)
+
+    return df
+
+
+def get_merchant_feats(df_feats):
+    """
+    :param df_feats: DataFrame
+    :return: DataFrame
+    """
+    related_cols = ['merchant_id', 'coupon_id', 'distance', 'date_received', 'date']
+    df_merchant = df_feats[related_cols].copy()
+    ids = df_merchant[['merchant_id']].copy()
+    ids.drop_duplicates(inplace=True)
+
+    f1 = df_merchant[~df_merchant.date.isna()][['merchant_id']].copy()
+    df_merchant_feats = utils.add_count_new_feats(df=ids, df_grp=f1, grp_cols='merchant_id',
+                                                  new_feat_name='m_total_sales')
+    f2 = df_merchant[(~df_merchant.date.isna()) & (~df_merchant.coupon_id.isna())][['merchant_id']].copy()
+    df_merchant_feats = utils.add_count_new_feats(df=df_merchant_feats, df_grp=f2, grp_cols='merchant_id',
+                                                  new_feat_name='m_sales_with_coupon')
+    f3 = df_merchant[~df_merchant.coupon_id.isna()][['merchant_id']].copy()
+    df_merchant_feats = utils.add_count_new_feats(df=df_merchant_feats, df_grp=f3, grp_cols='merchant_id',
+                                                  new_feat_name='m_total_coupon')
+    f4 = df_merchant[(~df_merchant.date.isna()) & (~df_merchant.coupon_id.isna())
+                     & (~df_merchant.distance.isna())][['merchant_id', 'distance']].copy()
+    f4.distance = f4.distance.astype('int')
+    agg_opts = ['max', 'min', 'mean', 'median']
+    df_merchant_feats = utils.add_agg_feats(df=df_merchant_feats, df_grp=f4, grp_cols=['merchant_id'],
+                                            val_col='distance', agg_ops=agg_opts, kws='m')
+
+    df_merchant_feats['m_sales_with_coupon'].fillna(0, inplace=True)
+    df_merchant_feats['m_coupon_used_rate'] = \
+        df_merchant_feats.m_sales_with_coupon.astype('float') / df_merchant_feats.m_total_coupon
+    df_merchant_feats['m_sales_with_coupon_rate'] = \
+        df_merchant_feats.m_sales_with_coupon.astype('float') / df_merchant_feats.m_total_sales
+    df_merchant_feats['m_total_coupon'].fillna(0, inplace=True)
+
+    return df_merchant_feats
+
+
+def get_user_feats(df_feats):
+    """
+    :param df_feats: DataFrame
+    :return: DataFrame
+    """
+    related_cols = ['user_id', 'merchant_id', 'coupon_id', 'discount_rate', 'distance', 'date_received', 'date']
+    df_user = df_feats[related_cols].copy()
+    ids = df_user[['user_id']].copy()
+    ids.drop_duplicates(inplace=True)
+
+    f1 = df_user[~(df_user.date.isna())][['user_id', 'merchant_id']].copy()
+    f1.drop_duplicates(inplace=True)
+    df_user_feats = utils.add_count_new_feats(df=ids, df_grp=f1[['user_id']], grp_cols='user_id',
+                                              new_feat_name='u_pay_merchant')
+    f2 = df_user[(~df_user.date.isna()) & (~df_user.coupon_id.isna())
+                 & (~df_user.distance.isna())][['user_id', 'distance']].copy()
+    f2.distance = f2.distance.astype('int')
+    agg_opts = ['max', 'min', 'mean', 'median']
+    df_user_feats = utils.add_agg_feats(df=df_user_feats, df_grp=f2, grp_cols=['user_id'],
+                                        val_col='distance', agg_ops=agg_opts, kws='user')
+    f3 = df_user[(~df_user.date.isna()) & (~df_user.coupon_id.isna())][['user_id']].copy()
+    df_user_feats = utils.add_count_new_feats(df=df_user_feats, df_grp=f3, grp_cols='user_id',
+                                              new_feat_name='u_pay_with_coupon')
+    f4 = df_user[~df_user.date.isna()][['user_id']].copy()
+    df_user_feats = utils.add_count_new_feats(df=df_user_feats, df_grp=f4, grp_cols='user_id',
+                                              new_feat_name='u_pay_total')
+    f5 = df_user[~df_user.coupon_id.isna()][['user_id']].copy()
+    df_user_feats = utils.add_count_new_feats(df=df_user_feats, df_grp=f5, grp_cols='user_id',
+                                              new_feat_name='u_received_coupon')
+    f6 = df_user[(~df_user.date.isna()) & (~df_user.date_received.isna())
+                 & (~df_user.coupon_id.isna())][['user_id', 'date', 'date_received']].copy()
+    f6['day_gap'] = f6.apply(lambda row: utils.get_diff_btw_dates(row.date_received, row.date), axis=1)
+    df_user_feats = utils.add_agg_feats(df=df_user_feats, df_grp=f6, grp_cols=['user_id'],
+                                        val_col='day_gap', agg_ops=agg_opts, kws='u')
+
+    df_user_feats['u_pay_merchant'].fillna(0, inplace=True)
+    df_user_feats['u_pay_with_coupon'].fillna(0, inplace=True)
+    df_user_feats['u_pay_with_coupon_rate'] = \
+        df_user_feats.u_pay_with_coupon.astype('float') / df_user_feats.u_pay_total
+    df_user_feats['u_coupon_used_rate'] = \
+        df_user_feats.u_pay_with_coupon.astype('float') / df_user_feats.u_received_coupon.astype('float')
+    df_user_feats['u_pay_total'].fillna(0, inplace=True)
+    df_user_feats['u_received_coupon'].fillna(0, inplace=True)
+
+    return df_user_feats
+
+
+def get_user_merchant_feats(df_feats):
+    """
+    :param df_feats: DataFrame
+    :return: DataFrame
+    """
+    ids = df_feats[['user_id', 'merchant_id']].copy()
+    ids.drop_duplicates(inplace=True)
+
+    f1 = df_feats[['user_id', 'merchant_id', 'date']].copy()
+    f1 = f1[~f1['date'].isna()][['user_id', 'merchant_id']]
+    df_user_merchant = utils.add_count_new_feats(df=ids, df_grp=f1, grp_cols=['user_id', 'merchant_id'],
+                                                 new_feat_name='um_pay_count')
+    f2 = df_feats[['user_id', 'merchant_id', 'coupon_id']].copy()
+    f2 = f2[~f2['coupon_id'].isna()][['user_id', 'merchant_id']]
+    df_user_merchant = utils.add_count_new_feats(df=df_user_merchant, df_grp=f2, grp_cols=['user_id', 'merchant_id'],
+                                                 new_feat_name='um_received_coupon')
+    f3 = df_feats[['user_id', 'merchant_id', 'date', 'date_received']].copy()
+    f3 = f3[(~f3['date'].isna()) & (~f3['date_received'].isna())][['user_id', 'merchant_id']]
+    df_user_merchant = utils.add_count_new_feats(df=df_user_merchant, df_grp=f3, grp_cols=['user_id', 'merchant_id'],
+                                                 new_feat_name='um_used_coupon')
+    f4 = df_feats[['user_id', 'merchant_id']].copy()
+    df_user_merchant = utils.add_count_new_feats(df=df_user_merchant, df_grp=f4, grp_cols=['user_id', 'merchant_id'],
+                                                 new_feat_name='um_interact_count')
+    f5 = df_feats[['user_id', 'merchant_id', 'date', 'coupon_id']].copy()
+    f5 = f5[(f5['date'].isna()) & (f5['coupon_id'].isna())][['user_id', 'merchant_id']]
+    df_user_merchant = utils.add_count_new_feats(df=df_user_merchant, df_grp=f5, grp_cols=['user_id', 'merchant_id'],
+                                                 new_feat_name='um_not_used_coupon')
+
+    df_user_merchant['um_used_coupon'].fillna(0, inplace=True)
+    df_user_merchant['um_not_used_coupon'].fillna(0, inplace=True)
+    df_user_merchant['um_coupon_used_rate'] = \
+        df_user_merchant.um_used_coupon.astype('float') / df_user_merchant.um_received_coupon.astype('float')
+    df_user_merchant['um_pay_with_coupon_rate'] = \
+        df_user_merchant.um_used_coupon.astype('float') / df_user_merchant.um_pay_count.astype('float')
+    df_user_merchant['um_pay_prob'] = \
+        df_user_merchant.um_pay_count.astype('float') / df_user_merchant.um_interact_count
+    df_user_merchant['um_pay_without_coupon_rate'] = \
+        df_user_merchant.um_not_used_coupon.astype('float') / df_user_merchant.um_pay_count
+
+    return df_user_merchant
+
+
+def assert_frame_close(df, df_expected, keys=None, cols=None, rtol=1e-7, atol=0.0):
+    """
+    compare values as float64, rows are aligned by keys, dtypes and row order are not compared
+    :param df: DataFrame,
+    :param df_expected: DataFrame,
+    :param keys: list, cols rows are sorted by
+    :param cols: list, cols compared, default is all cols of df_expected
+    :param rtol: float,
+    :param atol: float,
+    :return:
+    """
+    cols = list(df_expected.columns) if cols is None else list(cols)
+    missing = [col for col in cols if col not in df.columns]
+    assert not missing, 'cols {0} are missing'.format(missing)
+    assert len(df) == len(df_expected)
+
+    def prepare(frame):
+        frame = frame[cols].astype('float64')
+        if keys:
+            frame = frame.sort_values(keys, kind='mergesort')
+        return frame.reset_index(drop=True)
+
+    pd.testing.assert_frame_equal(prepare(df), prepare(df_expected), check_dtype=False, rtol=rtol, atol=atol)
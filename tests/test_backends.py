@@ -0,0 +1,40 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 14:05
+# @author: agent
+# @contact: agent@local
+# @file: test_backends.py
+# @desc: parity of every backend with pandas on synthetic data with null discount rates and distances
+
+import pytest
+import utilities as utils
+import feature_engineering as fe
+import backends
+from tests.conftest import TEST_FILE, TEST_COLS
+
+
+@pytest.fixture(params=[backend for backend in backends.BACKENDS[1:]])
+def backend(request):
+    if request.param == 'polars':
+        pytest.importorskip('polars')
+    return request.param
+
+
+def test_synthetic_data_has_nulls(df_train):
+    assert df_train['discount_rate'].isna().any()
+    assert df_train['distance'].isna().any()
+
+
+def test_train_parity(df_train, backend):
+    res = backends.check_parity(df_train, backend)
+
+    assert set(res) == {'get_new_feats'} | {post_func.__name__ for _, post_func, _ in fe.FAMILIES}
+    assert res == {stage: None for stage in res}
+
+
+def test_test_set_parity(data_dir, backend):
+    df_test = utils.read_data(TEST_FILE, rename_col=TEST_COLS, data_dir=data_dir, use_cache=False)
+
+    res = backends.check_parity(df_test, backend, families=[])
+
+    assert res == {'get_new_feats': None}
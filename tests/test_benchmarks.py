@@ -0,0 +1,57 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 14:10
+# @author: agent
+# @contact: agent@local
+# @file: test_benchmarks.py
+# @desc: benchmark cases cover every public function and failures fail the run
+
+import sys
+import pytest
+import data_preprocess as prep
+import feature_engineering as fe
+from benchmarks import run_benchmarks as rb
+
+
+@pytest.fixture(autouse=True)
+def restore_globals(monkeypatch):
+    """
+    run_benchmarks points module globals at its temp dirs
+    """
+    for module, name in [(prep, 'original_data_dir'), (prep, 'prep_data_dir'), (fe, 'origin_data_dir'),
+                         (fe, 'feat_data_fir')]:
+        monkeypatch.setattr(module, name, getattr(module, name, None), raising=False)
+
+
+def test_cases_cover_public_funcs():
+    covered = set(case.name.split('[')[0] for case in rb.get_cases())
+
+    assert sorted(set(rb.get_public_funcs()) - covered) == []
+
+
+def fail(*args, **kwargs):
+    raise ValueError('broken case')
+
+
+@pytest.mark.parametrize('public_funcs, cases', [
+    ([], [rb.BenchCase('utilities.fail', fail, lambda c: ((), {}))]),
+    (['utilities.get_engine'], []),
+])
+def test_main_exits_non_zero(tmp_path, monkeypatch, public_funcs, cases):
+    monkeypatch.setattr(rb, 'get_public_funcs', lambda: public_funcs)
+    monkeypatch.setattr(rb, 'get_cases', lambda: cases)
+    monkeypatch.setattr(sys, 'argv', ['run_benchmarks.py', '--rows', '2000', '--output', str(tmp_path / 'res.json')])
+
+    with pytest.raises(SystemExit) as e:
+        rb.main()
+
+    assert e.value.code == 1
+
+
+def test_main_passes_without_failures(tmp_path, monkeypatch):
+    cases = [case for case in rb.get_cases() if case.name == 'utilities.get_engine']
+    monkeypatch.setattr(rb, 'get_public_funcs', lambda: ['utilities.get_engine'])
+    monkeypatch.setattr(rb, 'get_cases', lambda: cases)
+    monkeypatch.setattr(sys, 'argv', ['run_benchmarks.py', '--rows', '2000', '--output', str(tmp_path / 'res.json')])
+
+    rb.main()
@@ -0,0 +1,50 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 13:15
+# @author: agent
+# @contact: agent@local
+# @file: test_data_preprocess.py
+# @desc: bulk discount parsing against the baseline row-wise parsers
+
+import numpy as np
+import pandas as pd
+import data_preprocess as prep
+from tests import reference
+
+
+NEW_COLS = ['is_full_reduction', 'full_cond', 'full_save', 'discount_rate', 'distance']
+
+
+def test_parse_discount_rate_matches_scalar_parsers():
+    s = pd.Series(['0.95', '100:10', 'null', np.nan, '20:1', '0.95', '100:10', np.nan])
+    df_parsed = prep.parse_discount_rate(s)
+
+    expected = pd.DataFrame({
+        'is_full_reduction': s.apply(prep.is_full_reduction),
+        'full_cond': s.apply(prep.get_full_reduction_cond),
+        'full_save': s.apply(prep.get_full_reduction_save),
+        'discount_rate': s.apply(prep.get_discount_rate),
+    })
+    pd.testing.assert_frame_equal(df_parsed, expected, check_dtype=False)
+    assert df_parsed.loc[2, 'discount_rate'] == -1
+
+
+def test_parse_discount_rate_empty():
+    df_parsed = prep.parse_discount_rate(pd.Series([], dtype=object))
+
+    assert len(df_parsed) == 0
+    assert list(df_parsed.columns) == ['is_full_reduction', 'full_cond', 'full_save', 'discount_rate']
+
+
+def test_get_new_feats_matches_baseline(df_raw, df_train):
+    df_expected = reference.get_new_feats(df_raw.copy())
+    df_res = prep.get_new_feats(df_train.copy())
+
+    reference.assert_frame_close(df_res, df_expected, cols=NEW_COLS + ['user_id', 'merchant_id'])
+
+
+def test_get_new_feats_on_raw_dtypes_matches_baseline(df_raw):
+    df_expected = reference.get_new_feats(df_raw.copy())
+    df_res = prep.get_new_feats(df_raw.copy())
+
+    pd.testing.assert_frame_equal(df_res, df_expected, check_dtype=False)
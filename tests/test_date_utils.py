@@ -0,0 +1,52 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 13:20
+# @author: agent
+# @contact: agent@local
+# @file: test_date_utils.py
+# @desc: vectorized date helpers against the baseline row-wise date functions
+
+import numpy as np
+import pandas as pd
+import utilities as utils
+import data_preprocess as prep
+import date_utils
+from tests import reference
+
+
+RECEIVED = pd.Series([20160101, 20160215, 20160228, 20160301, np.nan, 20161231, 20160616, np.nan])
+USED = pd.Series([20160116, 20160301, 20160301, np.nan, 20160110, 20170101, 20160702, np.nan])
+
+
+def test_get_days_gap_matches_baseline():
+    expected = [utils.get_diff_btw_dates(x, y) for x, y in zip(RECEIVED, USED)]
+
+    np.testing.assert_array_equal(date_utils.get_days_gap(RECEIVED, USED), expected)
+
+
+def test_get_label_matches_baseline():
+    expected = [prep.get_label(x, y) for x, y in zip(RECEIVED, USED)]
+
+    np.testing.assert_array_equal(date_utils.get_label(RECEIVED, USED), expected)
+
+
+def test_month_and_day_match_baseline():
+    dates = RECEIVED.astype('float64')
+
+    np.testing.assert_array_equal(date_utils.get_month(dates), [utils.get_month(x) for x in dates])
+    np.testing.assert_array_equal(date_utils.get_day(dates), [utils.get_day(x) for x in dates])
+
+
+def test_nullable_int_dates():
+    received = RECEIVED.astype('Int32')
+    used = USED.astype('Int32')
+
+    np.testing.assert_array_equal(date_utils.get_days_gap(received, used), date_utils.get_days_gap(RECEIVED, USED))
+    np.testing.assert_array_equal(date_utils.get_label(received, used), date_utils.get_label(RECEIVED, USED))
+
+
+def test_get_new_label_matches_baseline(df_raw, df_train):
+    df_expected = reference.get_new_label(reference.get_new_feats(df_raw.copy()))
+    df_res = prep.get_new_label(prep.get_new_feats(df_train.copy()))
+
+    reference.assert_frame_close(df_res, df_expected, cols=['days_gap', 'label'])
@@ -0,0 +1,168 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 13:30
+# @author: agent
+# @contact: agent@local
+# @file: test_feature_engineering.py
+# @desc: feature families of the aggregation engine against the baseline groupby and merge chains
+
+import os
+import gc
+import shutil
+import tracemalloc
+import numpy as np
+import pandas as pd
+import pytest
+import utilities as utils
+import data_preprocess as prep
+import feature_engineering as fe
+import export
+from benchmarks.synthetic import gen_online_data
+from tests import reference
+from tests.conftest import TRAIN_FILE, TEST_FILE, N_ROWS
+
+
+FAMILIES = [
+    (fe.get_merchant_feats, reference.get_merchant_feats, ['merchant_id']),
+    (fe.get_user_feats, reference.get_user_feats, ['user_id']),
+    (fe.get_user_merchant_feats, reference.get_user_merchant_feats, ['user_id', 'merchant_id']),
+]
+
+
+@pytest.fixture
+def df_prep(df_train):
+    return prep.get_new_feats(df_train.copy())
+
+
+@pytest.fixture
+def df_prep_expected(df_raw):
+    return reference.get_new_feats(df_raw.copy())
+
+
+@pytest.mark.parametrize('get_feats, get_expected, keys', FAMILIES)
+def test_family_matches_baseline(df_prep, df_prep_expected, get_feats, get_expected, keys):
+    df_expected = get_expected(df_prep_expected)
+    df_feats = get_feats(df_feats=df_prep)
+
+    assert list(df_feats.columns[:len(df_expected.columns)]) == list(df_expected.columns)
+    reference.assert_frame_close(df_feats, df_expected, keys=keys)
+
+
+@pytest.mark.parametrize('get_feats, get_expected, keys', FAMILIES)
+def test_family_keeps_key_order_of_first_appearance(df_prep, df_prep_expected, get_feats, get_expected, keys):
+    df_expected = get_expected(df_prep_expected)
+    df_feats = get_feats(df_feats=df_prep)
+
+    reference.assert_frame_close(df_feats, df_expected, cols=keys)
+
+
+def test_relation_feature_version_matches_baseline_joins(df_train, df_raw):
+    df_expected = reference.get_new_feats(df_raw.copy())
+    for get_expected, keys in [(reference.get_merchant_feats, ['merchant_id']),
+                               (reference.get_user_feats, ['user_id']),
+                               (reference.get_user_merchant_feats, ['user_id', 'merchant_id'])]:
+        df_expected = df_expected.merge(get_expected(df_expected), on=keys, how='left')
+    df_expected = reference.get_new_label(df_expected.drop_duplicates().copy())
+
+    df_res = fe.relation_feature_version(df_train.copy(), is_train=True)
+
+    assert len(df_res) == len(df_expected)
+    reference.assert_frame_close(df_res, df_expected, keys=list(reference.RAW_COLS))
+
+
+def test_test_rows_join_families_of_train(df_train, df_test):
+    df_train_feats = prep.get_new_feats(df_train.copy())
+    family_feats = fe.get_family_feats(df_train_feats)
+    df_expected = prep.get_new_feats(df_test.copy())
+    for df_feat, keys in family_feats:
+        df_expected = df_expected.merge(df_feat, on=keys, how='left')
+
+    df_res = fe.relation_feature_version(df_test.copy(), is_train=False, family_feats=family_feats)
+
+    assert 'label' not in df_res.columns
+    reference.assert_frame_close(df_res.drop_duplicates(reference.RAW_COLS[:-1]),
+                                 df_expected.drop_duplicates(reference.RAW_COLS[:-1]),
+                                 keys=reference.RAW_COLS[:-1])
+
+
+@pytest.mark.parametrize('is_lean', [False, True])
+def test_relation_feature_generator_exports_both_sets(data_dir, tmp_path, monkeypatch, is_lean):
+    origin_dir = tmp_path / 'origin'
+    feat_dir = tmp_path / 'features'
+    feat_dir.mkdir()
+    origin_dir.mkdir()
+    for file_name in (TRAIN_FILE, TEST_FILE):
+        shutil.copy(os.path.join(data_dir, file_name), str(origin_dir))
+    gen_online_data(str(origin_dir), N_ROWS)
+    monkeypatch.setattr(fe, 'origin_data_dir', str(origin_dir))
+    monkeypatch.setattr(fe, 'feat_data_fir', str(feat_dir))
+
+    fe.relation_feature_generator(fe.relation_feature_version, is_lean=is_lean, use_online=True, export_fmt='npy')
+
+    assert (feat_dir / 'id_index.npz').exists()
+    df_test_ = utils.load_data('test_relation_feature_version', str(feat_dir), fmt='csv')
+    assert {'r_u_receive_day', 'm_total_sales', 'on_u_action'} <= set(df_test_.columns)
+    train_manifest = export.load_manifest(str(feat_dir / 'train_relation_feature_version_matrix'))
+    test_manifest = export.load_manifest(str(feat_dir / 'test_relation_feature_version_matrix'))
+    assert train_manifest['features'] == test_manifest['features']
+
+
+def get_int_cols(family_feats):
+    return {col for df_feat, _ in family_feats or [] for col in df_feat.columns
+            if pd.api.types.is_integer_dtype(df_feat[col])}
+
+
+@pytest.mark.parametrize('version, is_train', [(fe.basic_feature_version, True), (fe.basic_feature_version, False),
+                                               (fe.relation_feature_version, True),
+                                               (fe.relation_feature_version, False)])
+def test_lean_matches_default(df_train, df_test, version, is_train):
+    kwargs = {}
+    if version is fe.relation_feature_version:
+        # families of train joined to test rows leave counts of unseen keys missing
+        kwargs['family_feats'] = fe.get_family_feats(prep.get_new_feats(df_train.copy()))
+    df = df_train if is_train else df_test
+
+    df_default = version(df.copy(), is_train=is_train, **kwargs)
+    df_lean = version(df.copy(), is_train=is_train, lean=True, **kwargs)
+
+    assert list(df_lean.columns) == list(df_default.columns)
+    int_cols = get_int_cols(kwargs.get('family_feats'))
+    for col in df_default.columns:
+        is_int = pd.api.types.is_integer_dtype(df_default[col]) or col in int_cols
+        # ints keep exact values, nullable where rows have no features; floats are float32
+        assert pd.api.types.is_integer_dtype(df_lean[col]) == is_int, col
+        if not is_int:
+            assert df_lean[col].dtype == np.float32, col
+    if version is fe.relation_feature_version and not is_train:
+        assert any(isinstance(df_lean[col].dtype, pd.Int16Dtype) and df_lean[col].isna().any() for col in int_cols)
+    df_default = df_default.drop_duplicates().reset_index(drop=True)
+    pd.testing.assert_frame_equal(df_lean.reset_index(drop=True).astype('float64'), df_default.astype('float64'),
+                                  rtol=1e-6)
+
+
+def test_take_feats_keeps_large_counts_exact():
+    df_feat = pd.DataFrame({'count': np.array([2 ** 24 + 1, 3], dtype=np.int32), 'rate': [0.5, 0.25],
+                            'flag': [True, False]})
+
+    cols = fe.take_feats(df_feat, np.array([0, -1, 1]))
+
+    pd.testing.assert_extension_array_equal(cols['count'], pd.array([2 ** 24 + 1, None, 3], dtype='Int32'))
+    pd.testing.assert_extension_array_equal(cols['flag'], pd.array([True, None, False], dtype='boolean'))
+    np.testing.assert_array_equal(cols['rate'], [0.5, np.nan, 0.25])
+
+
+def get_peak(func, *args, **kwargs):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func(*args, **kwargs)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_lean_lowers_peak_memory(df_train):
+    peak = get_peak(fe.relation_feature_version, df_train.copy(), is_train=True)
+    lean_peak = get_peak(fe.relation_feature_version, df_train.copy(), is_train=True, lean=True)
+
+    assert lean_peak < 0.5 * peak
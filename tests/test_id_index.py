@@ -0,0 +1,62 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 14:15
+# @author: agent
+# @contact: agent@local
+# @file: test_id_index.py
+# @desc: aggregation and joins on dense id codes against the baseline groupby and merge chains
+
+import numpy as np
+import pandas as pd
+import pytest
+import data_preprocess as prep
+import feature_engineering as fe
+from id_index import IdIndex
+from tests import reference
+
+
+FAMILIES = [
+    (fe.get_merchant_feats, reference.get_merchant_feats, ['merchant_id']),
+    (fe.get_user_feats, reference.get_user_feats, ['user_id']),
+    (fe.get_user_merchant_feats, reference.get_user_merchant_feats, ['user_id', 'merchant_id']),
+]
+
+
+@pytest.mark.parametrize('get_feats, get_expected, keys', FAMILIES)
+def test_family_on_codes_matches_baseline(df_train, df_raw, get_feats, get_expected, keys):
+    df_expected = get_expected(reference.get_new_feats(df_raw.copy()))
+    # codes of a shuffled frame, so code order differs from order of appearance
+    id_index = IdIndex().update(df_train.sample(frac=1, random_state=0))
+
+    df_feats = get_feats(df_feats=prep.get_new_feats(df_train.copy()), id_index=id_index)
+
+    reference.assert_frame_close(df_feats, df_expected, keys=keys)
+
+
+@pytest.mark.parametrize('lean', [False, True])
+def test_relation_feature_version_on_codes_matches_baseline(df_train, df_raw, lean):
+    df_expected = reference.get_new_feats(df_raw.copy())
+    for get_expected, keys in [(reference.get_merchant_feats, ['merchant_id']),
+                               (reference.get_user_feats, ['user_id']),
+                               (reference.get_user_merchant_feats, ['user_id', 'merchant_id'])]:
+        df_expected = df_expected.merge(get_expected(df_expected), on=keys, how='left')
+    df_expected = reference.get_new_label(df_expected.drop_duplicates().copy())
+
+    df_res = fe.relation_feature_version(df_train.copy(), is_train=True, id_index=IdIndex(), lean=lean)
+
+    reference.assert_frame_close(df_res, df_expected, keys=list(reference.RAW_COLS), rtol=1e-6 if lean else 1e-7)
+
+
+def test_codes_are_stable_across_updates_and_saves(df_train, tmp_path):
+    id_index = IdIndex().update(df_train.iloc[:5000])
+    codes = id_index.encode('user_id', df_train['user_id'].iloc[:5000])
+    path = str(tmp_path / 'index' / 'id_index.npz')
+    id_index.save(path)
+
+    id_index = IdIndex.load(path).update(df_train)
+
+    np.testing.assert_array_equal(id_index.encode('user_id', df_train['user_id'].iloc[:5000]), codes)
+    np.testing.assert_array_equal(id_index.decode('user_id', codes[codes >= 0]),
+                                  df_train['user_id'].iloc[:5000].dropna().to_numpy(dtype=np.int64))
+    assert id_index.size('user_id') == df_train['user_id'].nunique()
+    assert (id_index.encode('user_id', pd.Series([np.nan, 10 ** 9])) == -1).all()
@@ -0,0 +1,104 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 13:45
+# @author: agent
+# @contact: agent@local
+# @file: test_incremental.py
+# @desc: incremental feature store against features of the whole data and of windows
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import utilities as utils
+import data_preprocess as prep
+import feature_engineering as fe
+import incremental
+from tests import reference
+from tests.conftest import TRAIN_FILE
+
+
+FAMILY_KEYS = {'merchant': ['merchant_id'], 'user': ['user_id'], 'user_merchant': ['user_id', 'merchant_id']}
+
+
+@pytest.fixture(scope='module')
+def df_prep(data_dir):
+    return prep.get_new_feats(utils.read_data(TRAIN_FILE, data_dir=data_dir, use_cache=False))
+
+
+@pytest.fixture(scope='module')
+def store(df_prep, tmp_path_factory):
+    store = incremental.IncrementalFeatureStore(str(tmp_path_factory.mktemp('state')))
+    part_days = incremental.get_partition_day(df_prep)
+    # two batches, the second one replaces a day of the first
+    store.apply_partition(df_prep[part_days <= 20160401])
+    store.apply_partition(df_prep[part_days >= 20160401])
+
+    return store
+
+
+def get_expected(df, name):
+    feats, post_func, _ = dict(zip(incremental.FAMILY_NAMES, fe.FAMILIES))[name]
+    return post_func(fe.aggregate(df, feats))
+
+
+@pytest.mark.parametrize('name', incremental.FAMILY_NAMES)
+def test_features_match_whole_data(store, df_prep, name):
+    df_expected = get_expected(df_prep, name)
+
+    reference.assert_frame_close(store.get_feats(name), df_expected, keys=FAMILY_KEYS[name])
+
+
+@pytest.mark.parametrize('name', incremental.FAMILY_NAMES)
+def test_window_hides_usage_after_end(store, df_prep, name):
+    start, end = 20160201, 20160315
+    part_days = incremental.get_partition_day(df_prep)
+    df_win = df_prep[(part_days >= start) & (part_days <= end)]
+    used = df_win['date'].astype('float64')
+    assert (used > end).any()
+    df_expected = get_expected(df_win.assign(date=df_win['date'].mask(used > end)), name)
+
+    reference.assert_frame_close(store.get_feats(name, start, end), df_expected, keys=FAMILY_KEYS[name])
+
+
+def test_update_feature_store_applies_new_days(data_dir, df_prep, tmp_path):
+    store = incremental.update_feature_store(str(tmp_path), TRAIN_FILE, data_dir)
+    assert store.days[-1] == incremental.get_partition_day(df_prep).max()
+
+    before = pd.read_pickle(store.get_path('user', 'features'))
+    store = incremental.update_feature_store(str(tmp_path), TRAIN_FILE, data_dir)
+    pd.testing.assert_frame_equal(pd.read_pickle(store.get_path('user', 'features')), before)
+    assert np.array_equal(sorted(store.days), store.days)
+
+
+def test_update_feature_store_applies_late_usage(data_dir, tmp_path, monkeypatch):
+    df_raw = pd.read_csv(os.path.join(data_dir, TRAIN_FILE), dtype=str, keep_default_na=False)
+    date_received, date = df_raw.columns[5], df_raw.columns[6]
+    # coupons received in january and not used yet when the store is first updated
+    used = df_raw.index[(df_raw[date_received] < '20160201') & (df_raw[date] == 'null')][:10]
+    assert len(used) == 10
+    (tmp_path / 'data').mkdir()
+    df_raw.to_csv(str(tmp_path / 'data' / TRAIN_FILE), index=False)
+    store = incremental.update_feature_store(str(tmp_path / 'state'), TRAIN_FILE, str(tmp_path / 'data'))
+    days = list(store.days)
+
+    # they are used later, after their day partition was applied
+    df_raw.loc[used, date] = (pd.to_datetime(df_raw.loc[used, date_received]) + pd.Timedelta(days=20)) \
+        .dt.strftime('%Y%m%d')
+    df_raw.to_csv(str(tmp_path / 'data' / TRAIN_FILE), index=False)
+    applied = []
+    apply_partition = incremental.IncrementalFeatureStore.apply_partition
+
+    def record_partition(self, df, digests=None):
+        applied.extend(sorted(digests))
+        return apply_partition(self, df, digests)
+
+    monkeypatch.setattr(incremental.IncrementalFeatureStore, 'apply_partition', record_partition)
+    store = incremental.update_feature_store(str(tmp_path / 'state'), TRAIN_FILE, str(tmp_path / 'data'))
+
+    # only the days of the changed rows are applied again
+    assert applied == sorted(set(df_raw.loc[used, date_received].astype(int)))
+    assert store.days == days
+    df_prep = prep.get_new_feats(utils.read_data(TRAIN_FILE, data_dir=str(tmp_path / 'data'), use_cache=False))
+    for name in incremental.FAMILY_NAMES:
+        reference.assert_frame_close(store.get_feats(name), get_expected(df_prep, name), keys=FAMILY_KEYS[name])
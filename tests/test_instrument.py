@@ -0,0 +1,207 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 15:10
+# @author: agent
+# @contact: agent@local
+# @file: test_instrument.py
+# @desc: span records of traced stages, sinks, disabled mode and the env-var config
+
+import os
+import sys
+import json
+import time
+import subprocess
+import pandas as pd
+import pytest
+import utilities as utils
+from logs import instrument
+from logs.instrument import traced, span
+from tests.conftest import TRAIN_FILE, N_ROWS
+
+
+@pytest.fixture
+def records(monkeypatch):
+    records = []
+    monkeypatch.setattr(instrument, 'enabled', True)
+    monkeypatch.setattr(instrument, 'sinks', [records.append])
+
+    return records
+
+
+@traced('test.inner')
+def inner(df):
+    with span('test.block', rows_in=len(df)) as sp:
+        sp.set(note='block')
+    return df.iloc[:2]
+
+
+@traced('test.outer')
+def outer(df):
+    return inner(df)
+
+
+@traced('test.chunks')
+def iter_chunks(df, chunksize):
+    for start in range(0, len(df), chunksize):
+        time.sleep(0.01)
+        yield df.iloc[start:start + chunksize]
+
+
+@traced('test.fail')
+def fail(df):
+    raise ValueError('broken')
+
+
+@pytest.fixture
+def df():
+    return pd.DataFrame({'a': range(10), 'b': [0.5] * 10})
+
+
+def test_nested_spans_record_parent_and_shapes(records, df):
+    outer(df)
+
+    assert [record['name'] for record in records] == ['test.block', 'test.inner', 'test.outer']
+    block, inner_record, outer_record = records
+    assert (block['parent'], inner_record['parent'], outer_record['parent']) == ('test.inner', 'test.outer', None)
+    assert block['note'] == 'block'
+    assert inner_record['rows_in'] == 10 and inner_record['shape_in'] == [10, 2]
+    assert inner_record['rows_out'] == 2 and inner_record['shape_out'] == [2, 2]
+    assert inner_record['mem_out_mb'] >= 0
+    for record in records:
+        assert record['event'] == 'span'
+        assert record['seconds'] >= 0
+        assert {'start', 'rss_before_mb', 'rss_after_mb', 'rss_delta_mb'} <= set(record)
+
+
+def test_error_is_recorded_and_raised(records, df):
+    with pytest.raises(ValueError):
+        fail(df)
+
+    assert records[0]['error'] == 'ValueError: broken'
+
+
+def test_generator_span_ends_with_iteration(records, df):
+    chunks = iter_chunks(df, 3)
+    assert records == []
+
+    with span('test.consumer'):
+        for _ in chunks:
+            with span('test.step'):
+                pass
+
+    by_name = {}
+    for record in records:
+        by_name.setdefault(record['name'], []).append(record)
+    record = by_name['test.chunks'][0]
+    assert record['chunks_out'] == 4 and record['rows_out'] == 10
+    assert record['seconds'] >= record['seconds_inside'] >= 0.04
+    # the paused generator is not the parent of spans of its consumer
+    assert all(step['parent'] == 'test.consumer' for step in by_name['test.step'])
+    assert 'closed' not in record
+
+
+def test_generator_closed_early(records, df):
+    chunks = iter_chunks(df, 3)
+    next(chunks)
+    chunks.close()
+
+    assert records[0]['closed'] is True
+    assert records[0]['chunks_out'] == 1
+    assert instrument.get_stack() == []
+
+
+def test_read_data_chunks_are_traced(records, data_dir):
+    chunks = utils.read_data(TRAIN_FILE, data_dir=data_dir, chunksize=3000, use_cache=False)
+    n_rows = sum(len(chunk) for chunk in chunks)
+
+    record = [record for record in records if record['name'] == 'utilities.read_data'][0]
+    assert record['rows_out'] == n_rows == N_ROWS
+    assert record['chunks_out'] == -(-N_ROWS // 3000)
+
+
+def test_disabled_mode_emits_nothing(monkeypatch, df):
+    records = []
+    monkeypatch.setattr(instrument, 'enabled', False)
+    monkeypatch.setattr(instrument, 'sinks', [records.append])
+
+    assert len(outer(df)) == 2
+    assert sum(len(chunk) for chunk in iter_chunks(df, 4)) == 10
+    assert isinstance(span('test.block'), instrument.NullSpan)
+    assert records == []
+
+
+def test_logger_sink(monkeypatch, caplog, df):
+    monkeypatch.setattr(instrument, 'enabled', True)
+    monkeypatch.setattr(instrument, 'sinks', [instrument.LoggerSink()])
+
+    with caplog.at_level('INFO', logger='logs'):
+        inner(df)
+
+    messages = [json.loads(record.getMessage()) for record in caplog.records]
+    assert [message['name'] for message in messages] == ['test.block', 'test.inner']
+
+
+def test_json_lines_sink(monkeypatch, tmp_path, df):
+    path = str(tmp_path / 'spans.jsonl')
+    monkeypatch.setattr(instrument, 'enabled', True)
+    monkeypatch.setattr(instrument, 'sinks', [instrument.JsonLinesSink(path)])
+
+    outer(df)
+    outer(df)
+
+    with open(path) as f:
+        lines = f.read().splitlines()
+    records = [json.loads(line) for line in lines]
+    assert len(records) == 6
+    assert [record['name'] for record in records[:3]] == ['test.block', 'test.inner', 'test.outer']
+
+
+def test_memory_report(monkeypatch, df):
+    report = instrument.MemoryReport()
+    monkeypatch.setattr(instrument, 'enabled', True)
+    monkeypatch.setattr(instrument, 'sinks', [report])
+
+    outer(df)
+    inner(df)
+
+    summary = {stage['name']: stage for stage in report.summary()}
+    assert summary['test.inner']['calls'] == 2 and summary['test.outer']['calls'] == 1
+    deltas = [stage['rss_delta_mb'] for stage in report.summary()]
+    assert deltas == sorted(deltas, reverse=True)
+    lines = report.format().splitlines()
+    assert lines[0].split() == ['stage', 'calls', 'seconds', 'rss_delta_mb', 'rss_after_mb', 'mem_out_mb']
+    assert len(lines) == 4
+
+
+def test_configure(monkeypatch):
+    monkeypatch.setattr(instrument, 'enabled', False)
+    monkeypatch.setattr(instrument, 'sinks', [])
+
+    instrument.configure()
+
+    assert instrument.enabled
+    assert len(instrument.sinks) == 1 and isinstance(instrument.sinks[0], instrument.LoggerSink)
+
+
+@pytest.mark.parametrize('env, expected', [
+    ({'O2O_INSTRUMENT_PATH': 'spans.jsonl'}, "True ['JsonLinesSink']"),
+    ({'O2O_INSTRUMENT': '1'}, "True ['LoggerSink']"),
+    ({'O2O_INSTRUMENT': '0'}, 'False []'),
+])
+def test_env_var_config(tmp_path, env, expected):
+    env = dict({key: value for key, value in os.environ.items() if not key.startswith('O2O_INSTRUMENT')}, **env)
+    if 'O2O_INSTRUMENT_PATH' in env:
+        env['O2O_INSTRUMENT_PATH'] = str(tmp_path / env['O2O_INSTRUMENT_PATH'])
+    code = ('from logs import instrument; '
+            'print(instrument.enabled, [type(sink).__name__ for sink in instrument.sinks])')
+    if 'O2O_INSTRUMENT_PATH' in env:
+        code += '; instrument.emit({"name": "test"})'
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    out = subprocess.run([sys.executable, '-c', code], cwd=root, env=env, capture_output=True, text=True,
+                         check=True).stdout
+
+    assert out.splitlines()[0] == expected
+    if 'O2O_INSTRUMENT_PATH' in env:
+        with open(env['O2O_INSTRUMENT_PATH']) as f:
+            assert [json.loads(line) for line in f] == [{'name': 'test'}]
@@ -0,0 +1,26 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 13:40
+# @author: agent
+# @contact: agent@local
+# @file: test_parallel.py
+# @desc: sharded feature families in a process pool against the serial path
+
+import multiprocessing as mp
+import pandas as pd
+import pytest
+import data_preprocess as prep
+import feature_engineering as fe
+import parallel
+
+
+@pytest.mark.parametrize('start_method', [method for method in ('fork', 'spawn')
+                                          if method in mp.get_all_start_methods()])
+def test_run_families_matches_serial(df_train, start_method):
+    df = prep.get_new_feats(df_train.copy())
+    expected = parallel.run_families(df, fe.FAMILIES, fe.FAMILY_COLS, n_jobs=1)
+
+    res = parallel.run_families(df, fe.FAMILIES, fe.FAMILY_COLS, n_jobs=3, start_method=start_method)
+
+    for df_res, df_expected in zip(res, expected):
+        pd.testing.assert_frame_equal(df_res, df_expected)
@@ -0,0 +1,124 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 14:45
+# @author: agent
+# @contact: agent@local
+# @file: test_pipeline.py
+# @desc: pipeline output against the feature generators, node order and resuming from checkpoints
+
+import os
+import shutil
+import pandas as pd
+import pytest
+import feature_engineering as fe
+import pipeline
+from pipeline import Node
+from tests import reference
+from tests.conftest import TRAIN_FILE, TEST_FILE
+
+
+@pytest.fixture
+def dirs(data_dir, tmp_path, monkeypatch):
+    origin_dir = str(tmp_path / 'origin')
+    os.makedirs(origin_dir)
+    for file_name in (TRAIN_FILE, TEST_FILE):
+        shutil.copy(os.path.join(data_dir, file_name), origin_dir)
+    monkeypatch.setattr(fe, 'origin_data_dir', origin_dir)
+    monkeypatch.setattr(fe, 'feat_data_fir', str(tmp_path / 'generator'))
+    os.makedirs(fe.feat_data_fir)
+
+    return {'origin_data_dir': origin_dir, 'feat_data_dir': str(tmp_path / 'pipeline'),
+            'checkpoint_dir': str(tmp_path / 'checkpoints')}
+
+
+@pytest.mark.parametrize('version', pipeline.VERSIONS)
+def test_main_matches_generator(dirs, version):
+    if version == 'basic_feature_version':
+        fe.basic_feature_generator(fe.basic_feature_version)
+    else:
+        fe.relation_feature_generator(fe.relation_feature_version)
+
+    report = pipeline.main(dict(dirs, version=version))
+
+    assert report['resumed'] == []
+    for file_name in ('train_{0}.csv'.format(version), 'test_{0}.csv'.format(version)):
+        df_expected = pd.read_csv(os.path.join(fe.feat_data_fir, file_name))
+        df_res = pd.read_csv(os.path.join(dirs['feat_data_dir'], file_name))
+        assert sorted(df_res.columns) == sorted(df_expected.columns)
+        reference.assert_frame_close(df_res, df_expected, keys=list(df_expected.columns))
+
+
+def test_main_resumes_from_checkpoints(dirs):
+    pipeline.main(dirs)
+
+    report = pipeline.main(dirs)
+
+    assert sorted(report['ran']) == ['save_test', 'save_train']
+    assert report['resumed'] == ['join_test', 'label_train']
+
+
+def test_resume_rewrites_deleted_files(dirs):
+    pipeline.main(dirs)
+    file_path = os.path.join(dirs['feat_data_dir'], 'train_relation_feature_version.csv')
+    df_expected = pd.read_csv(file_path)
+    os.remove(file_path)
+
+    report = pipeline.main(dirs)
+
+    assert 'save_train' in report['ran']
+    reference.assert_frame_close(pd.read_csv(file_path), df_expected, keys=list(df_expected.columns))
+
+
+def test_input_files_are_stamped_when_run(dirs, tmp_path):
+    config = dict(dirs, origin_data_dir=str(tmp_path / 'later'))
+    nodes = pipeline.build_feature_nodes(config)
+
+    with pytest.raises(FileNotFoundError):
+        pipeline.run_pipeline(nodes, checkpoint_dir=config['checkpoint_dir'])
+
+    shutil.copytree(dirs['origin_data_dir'], config['origin_data_dir'])
+    order, producers = pipeline.sort_nodes(nodes)
+    keys = pipeline.get_keys(order, producers)
+    with open(os.path.join(config['origin_data_dir'], TEST_FILE), 'a') as f:
+        f.write('\n')
+
+    assert pipeline.get_keys(order, producers)['read_test'] != keys['read_test']
+    pipeline.run_pipeline(nodes, checkpoint_dir=config['checkpoint_dir'])
+    assert os.path.exists(os.path.join(dirs['feat_data_dir'], 'test_relation_feature_version.csv'))
+
+
+def test_failed_run_resumes_finished_nodes(tmp_path):
+    calls = []
+    broken = {'c'}
+
+    def make(name):
+        def func(*args):
+            calls.append(name)
+            if name in broken:
+                raise RuntimeError('failed ' + name)
+            return sum(args) + 1
+        return func
+
+    nodes = [
+        Node('c', make('c'), ['a', 'b'], ['c']),
+        Node('a', make('a'), [], ['a']),
+        Node('b', make('b'), ['a'], ['b']),
+    ]
+    checkpoint_dir = str(tmp_path / 'checkpoints')
+
+    with pytest.raises(RuntimeError, match='failed c'):
+        pipeline.run_pipeline(nodes, checkpoint_dir=checkpoint_dir)
+    assert calls == ['a', 'b', 'c']
+
+    broken.clear()
+    report = pipeline.run_pipeline(nodes, checkpoint_dir=checkpoint_dir)
+
+    assert report['ran'] == ['c']
+    assert report['outputs'] == {'c': 4}
+
+
+def test_sort_nodes_rejects_cycles_and_missing_inputs():
+    with pytest.raises(ValueError):
+        pipeline.sort_nodes([Node('a', None, ['b'], ['a']), Node('b', None, ['a'], ['b'])])
+    with pytest.raises(ValueError):
+        pipeline.sort_nodes([Node('a', None, ['x'], ['a'])])
@@ -0,0 +1,61 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 14:40
+# @author: agent
+# @contact: agent@local
+# @file: test_receipt.py
+# @desc: sorted receipt window features against a row by row loop over receipts
+
+import numpy as np
+import pandas as pd
+import pytest
+import feature_engineering as fe
+import receipt
+
+
+def get_expected(df, feat):
+    """
+    compare the receipt day of every row with every receipt of the same keys
+    """
+    days = (pd.to_datetime(df['date_received'].astype('float64'), format='%Y%m%d') -
+            pd.Timestamp('2016-01-01')).dt.days.to_numpy(dtype='float64')
+    keys = df[feat.keys].astype('float64').to_numpy()
+    valid = ~np.isnan(days) & ~np.isnan(keys).any(axis=1)
+
+    values = np.full(len(df), np.nan)
+    for i in np.flatnonzero(valid):
+        same = valid & (keys == keys[i]).all(axis=1)
+        diffs = days[same] - days[i]
+        if feat.op == 'count':
+            lo, hi = feat.window
+            values[i] = ((diffs >= (-np.inf if lo is None else lo)) & (diffs <= (np.inf if hi is None else hi))).sum()
+        elif feat.op == 'prev_gap':
+            values[i] = -diffs[diffs < 0].max() if (diffs < 0).any() else np.nan
+        else:
+            values[i] = diffs[diffs > 0].min() if (diffs > 0).any() else np.nan
+
+    return values
+
+
+@pytest.fixture
+def df_sample(df_train, df_test):
+    # rows without receipt or with missing keys are part of the sample
+    df = pd.concat([df_train.iloc[:3000], df_test.iloc[:1000]], ignore_index=True)
+    df.loc[[5, 17], 'merchant_id'] = np.nan
+
+    return df.set_index(np.arange(len(df)) * 3)
+
+
+@pytest.mark.parametrize('feat', fe.RECEIPT_FEATS, ids=[feat.name for feat in fe.RECEIPT_FEATS])
+def test_compute_matches_row_loop(df_sample, feat):
+    df_res = receipt.compute(df_sample, [feat])
+
+    assert df_res.index.equals(df_sample.index)
+    np.testing.assert_array_equal(df_res[feat.name].astype('float64').to_numpy(), get_expected(df_sample, feat))
+
+
+def test_compute_rejects_bad_feats(df_sample):
+    with pytest.raises(ValueError, match='unknown op'):
+        receipt.compute(df_sample, [receipt.ReceiptFeat('bad', ['user_id'], None, 'mean')])
+    with pytest.raises(ValueError, match='ordered'):
+        receipt.compute(df_sample, [receipt.ReceiptFeat('bad', ['user_id'], (3, 1), 'count')])
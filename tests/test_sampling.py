@@ -0,0 +1,75 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 14:25
+# @author: agent
+# @contact: agent@local
+# @file: test_sampling.py
+# @desc: key-consistent, reservoir and stratified samples against their definitions
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import utilities as utils
+import data_preprocess as prep
+import sampling
+from tests.conftest import TRAIN_FILE
+
+
+def get_chunks(df, n_chunks):
+    return [df.iloc[part] for part in np.array_split(np.arange(len(df)), n_chunks)]
+
+
+@pytest.mark.parametrize('keys', [['user_id'], ['user_id', 'merchant_id']])
+def test_hash_sample_keeps_whole_entities(df_train, df_test, keys):
+    df_res = sampling.hash_sample(df_train, keys, 0.3)
+
+    # every row of a kept entity is kept, in original order
+    kept = df_train[keys].merge(df_res[keys].drop_duplicates(), on=keys, how='left', indicator=True)['_merge']
+    assert df_res.index.equals(df_train.index[(kept == 'both').to_numpy()])
+    ratio = len(df_res[keys].drop_duplicates()) / len(df_train[keys].dropna().drop_duplicates())
+    assert abs(ratio - 0.3) < 0.05
+    # the same entities are kept in another file and in chunks
+    df_test_res = sampling.hash_sample(df_test, keys, 0.3)
+    df_shared = df_test[keys].merge(df_train[keys].drop_duplicates(), on=keys)
+    pd.testing.assert_frame_equal(
+        df_shared.merge(df_res[keys].drop_duplicates(), on=keys),
+        df_shared.merge(df_test_res[keys].drop_duplicates(), on=keys))
+    pd.testing.assert_frame_equal(pd.concat(sampling.hash_sample_chunks(get_chunks(df_train, 4), keys, 0.3)), df_res)
+
+
+def test_reservoir_sample_does_not_depend_on_chunks(df_train):
+    df_res = sampling.reservoir_sample(get_chunks(df_train, 1), 1000)
+
+    assert len(df_res) == 1000
+    assert df_res.index.is_monotonic_increasing
+    pd.testing.assert_frame_equal(sampling.reservoir_sample(get_chunks(df_train, 7), 1000), df_res)
+    pd.testing.assert_frame_equal(sampling.reservoir_sample(get_chunks(df_train, 3), len(df_train) + 1), df_train)
+
+
+@pytest.mark.parametrize('engine', ['pyarrow', 'c'])
+@pytest.mark.parametrize('kwargs', [{}, {'sample_by': ['user_id']}, {'usecols': ['user_id', 'coupon_id']}])
+def test_sample_of_empty_file_is_empty_typed_frame(data_dir, tmp_path, engine, kwargs):
+    with open(os.path.join(data_dir, TRAIN_FILE)) as f:
+        header = f.readline()
+    (tmp_path / TRAIN_FILE).write_text(header)
+    df_expected = utils.read_data(TRAIN_FILE, data_dir=data_dir, use_cache=False, usecols=kwargs.get('usecols'),
+                                  engine=engine).iloc[:0]
+
+    df_res = utils.read_data(TRAIN_FILE, data_dir=str(tmp_path), is_sample=True, use_cache=False, engine=engine,
+                             **kwargs)
+
+    pd.testing.assert_frame_equal(df_res, df_expected, check_index_type=False, check_categorical=False)
+    assert sampling.reservoir_sample([], 10, columns=['user_id']).columns.tolist() == ['user_id']
+
+
+def test_stratified_sample_keeps_label_ratio(df_train):
+    df = prep.get_new_label(prep.get_new_feats(df_train.copy()))
+
+    df_res = sampling.stratified_sample(df, frac=0.2)
+
+    expected = df['label'].value_counts() * 0.2
+    pd.testing.assert_series_equal(df_res['label'].value_counts().astype('float64'), expected.round(), check_names=False)
+    assert df_res.index.is_monotonic_increasing
+    with pytest.raises(ValueError):
+        sampling.stratified_sample(df)
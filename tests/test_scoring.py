@@ -0,0 +1,68 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 13:55
+# @author: agent
+# @contact: agent@local
+# @file: test_scoring.py
+# @desc: batch scoring from the features exported by the relation feature generator
+
+import os
+import shutil
+import pickle
+import numpy as np
+import pandas as pd
+import pytest
+import feature_engineering as fe
+import scoring
+from benchmarks.synthetic import gen_online_data
+from tests.conftest import TRAIN_FILE, TEST_FILE, N_ROWS
+
+
+class MeanModel(object):
+    """
+    probability from the mean of the features, enough to check rows and feature cols reach the model
+    """
+
+    def predict_proba(self, X):
+        prob = 1 / (1 + np.exp(-np.nan_to_num(X).mean(axis=1)))
+        return np.column_stack([1 - prob, prob])
+
+
+@pytest.fixture
+def dirs(data_dir, tmp_path, monkeypatch):
+    origin_dir = str(tmp_path / 'origin')
+    feat_dir = str(tmp_path / 'features')
+    os.makedirs(origin_dir)
+    os.makedirs(feat_dir)
+    for file_name in (TRAIN_FILE, TEST_FILE):
+        shutil.copy(os.path.join(data_dir, file_name), origin_dir)
+    gen_online_data(origin_dir, N_ROWS)
+    model_path = str(tmp_path / 'model.pkl')
+    with open(model_path, 'wb') as f:
+        pickle.dump(MeanModel(), f)
+
+    monkeypatch.setattr(fe, 'origin_data_dir', origin_dir)
+    monkeypatch.setattr(fe, 'feat_data_fir', feat_dir)
+    monkeypatch.setattr(scoring, 'origin_data_dir', origin_dir)
+    monkeypatch.setattr(scoring, 'feat_data_dir', feat_dir)
+    monkeypatch.setattr(scoring, 'model_path', model_path)
+    monkeypatch.setattr(scoring, 'submission_dir', str(tmp_path / 'submission'))
+
+    return origin_dir, feat_dir
+
+
+def test_main_requires_export(dirs):
+    with pytest.raises(FileNotFoundError, match='relation_feature_generator'):
+        scoring.main()
+
+
+def test_main_scores_generator_export(dirs):
+    fe.relation_feature_generator(fe.relation_feature_version, use_online=True, export_fmt='npy')
+
+    scoring.main()
+
+    df_sub = pd.read_csv(os.path.join(scoring.submission_dir, 'submission.csv'), header=None,
+                         names=scoring.SUBMISSION_COLS)
+    df_test = pd.read_csv(os.path.join(dirs[0], TEST_FILE))
+    assert len(df_sub) == len(df_test)
+    assert df_sub['prob'].between(0, 1).all()
@@ -0,0 +1,66 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 14:00
+# @author: agent
+# @contact: agent@local
+# @file: test_serving.py
+# @desc: event and batch feature serving against each other and the batch feature version
+
+import numpy as np
+import pandas as pd
+import pytest
+import data_preprocess as prep
+import feature_engineering as fe
+import serving
+
+
+@pytest.fixture
+def server(df_train):
+    return serving.FeatureServer.from_data(df_train)
+
+
+def get_events(df_test):
+    """
+    test rows as json-like events, plus events with missing fields
+    """
+    events = df_test[serving.EVENT_COLS].iloc[:200].astype(object).where(df_test.iloc[:200].notna(), None) \
+        .to_dict('records')
+    event = events[0]
+    events += [
+        dict(event, discount_rate=None),
+        dict(event, discount_rate=np.nan),
+        dict(event, distance=None),
+        dict(event, date_received=None),
+        dict(event, merchant_id=None),
+        dict(event, user_id=np.nan),
+        dict(event, user_id=10 ** 8),
+        {key: value for key, value in event.items() if key not in ('discount_rate', 'distance')},
+    ]
+
+    return events
+
+
+def test_event_matches_batch_with_missing_fields(server, df_test):
+    events = get_events(df_test)
+
+    values = np.vstack([server.get_event_feats(event) for event in events])
+    df_batch = server.get_batch_feats(pd.DataFrame(events, columns=serving.EVENT_COLS))
+
+    np.testing.assert_allclose(values, df_batch[server.feature_names].astype('float64').to_numpy(), equal_nan=True)
+    assert np.isnan(values[-4:-1, -len(server.user_merchant.names):]).all()
+
+
+def test_batch_matches_relation_feature_version(server, df_train, df_test):
+    family_feats = fe.get_family_feats(prep.get_new_feats(df_train.copy()))
+    df_expected = fe.relation_feature_version(df_test.copy(), is_train=False, family_feats=family_feats)
+
+    df_res = server.get_batch_feats(df_test).drop_duplicates(serving.EVENT_COLS)
+    df_expected = df_expected.drop_duplicates(serving.EVENT_COLS)
+
+    assert set(server.feature_names) <= set(df_expected.columns)
+    cols = serving.EVENT_COLS + server.feature_names[3:]
+    df_res = df_res[serving.ID_COLS + server.feature_names].astype('float64').sort_values(serving.EVENT_COLS) \
+        .reset_index(drop=True)
+    df_expected = df_expected[serving.ID_COLS + server.feature_names].astype('float64') \
+        .sort_values(serving.EVENT_COLS).reset_index(drop=True)
+    pd.testing.assert_frame_equal(df_res[cols], df_expected[cols])
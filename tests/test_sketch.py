@@ -0,0 +1,88 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 14:20
+# @author: agent
+# @contact: agent@local
+# @file: test_sketch.py
+# @desc: exact and sketched per-key quantiles against pandas quantiles of the raw values
+
+import numpy as np
+import pandas as pd
+import pytest
+import data_preprocess as prep
+import aggregation
+import sketch
+from id_index import IdIndex
+
+
+KEYS = ['user_id']
+
+
+@pytest.fixture
+def df_prep(df_train):
+    return prep.get_new_feats(df_train.copy())
+
+
+@pytest.fixture
+def sketch_mode():
+    yield sketch.configure
+    sketch.configure()
+
+
+def get_feats(col):
+    return [aggregation.AggFeat('{0}_{1}'.format(col, op), KEYS, None, col, op) for op in sketch.QUANTILE_OPS]
+
+
+def get_expected(df, col):
+    grouped = df.groupby(KEYS, sort=False)[col]
+    return pd.DataFrame({'{0}_{1}'.format(col, op): grouped.quantile(level)
+                         for op, level in sketch.QUANTILE_OPS.items()})
+
+
+def get_values(df_res, col):
+    return df_res.set_index(KEYS)[['{0}_{1}'.format(col, op) for op in sketch.QUANTILE_OPS]]
+
+
+@pytest.mark.parametrize('id_index', [None, IdIndex()])
+@pytest.mark.parametrize('col', ['distance', 'discount_rate'])
+def test_exact_quantiles_match_pandas(df_prep, id_index, col):
+    df_expected = get_expected(df_prep, col)
+
+    df_res = get_values(aggregation.aggregate(df_prep, get_feats(col), id_index=id_index), col)
+
+    pd.testing.assert_frame_equal(df_res.astype('float64'), df_expected.reindex(df_res.index), check_names=False)
+
+
+def test_merged_hists_match_whole_hist(df_prep):
+    values = df_prep['distance'].to_numpy(dtype='float64')
+    parts = np.array_split(np.arange(len(df_prep)), 3)
+    df_hist = sketch.merge_hists([sketch.get_hist(df_prep[KEYS].iloc[part], values[part]) for part in parts], KEYS)
+
+    df_res = sketch.get_quantiles(df_hist, KEYS, {'distance_' + op: level for op, level in sketch.QUANTILE_OPS.items()})
+
+    df_expected = get_expected(df_prep, 'distance').dropna(how='all')
+    pd.testing.assert_frame_equal(df_res.sort_index(), df_expected.sort_index(), check_names=False)
+
+
+@pytest.mark.parametrize('id_index', [None, IdIndex()])
+@pytest.mark.parametrize('accuracy', [0.01, 0.05])
+def test_sketched_quantiles_within_accuracy(df_prep, sketch_mode, id_index, accuracy):
+    sketch_mode('sketch', accuracy)
+    df_expected = get_expected(df_prep, 'discount_rate')
+
+    df_res = get_values(aggregation.aggregate(df_prep, get_feats('discount_rate'), id_index=id_index),
+                        'discount_rate').astype('float64')
+
+    df_expected = df_expected.reindex(df_res.index)
+    assert (df_res.isna() == df_expected.isna()).all().all()
+    # interpolation between two quantized values keeps the relative error bound
+    np.testing.assert_array_less(np.abs(df_res - df_expected).fillna(0).to_numpy(),
+                                 accuracy * np.abs(df_expected).fillna(0).to_numpy() + 1e-12)
+    assert not np.allclose(df_res.fillna(0), df_expected.fillna(0), rtol=1e-12, atol=0)
+
+
+def test_configure_rejects_bad_settings():
+    with pytest.raises(ValueError):
+        sketch.configure('approx')
+    with pytest.raises(ValueError):
+        sketch.configure('sketch', 1)
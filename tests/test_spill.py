@@ -0,0 +1,72 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 14:30
+# @author: agent
+# @contact: agent@local
+# @file: test_spill.py
+# @desc: spilled bucket aggregation against the in-memory grouped aggregation and the baseline
+
+import os
+import numpy as np
+import pandas as pd
+import pytest
+import data_preprocess as prep
+import feature_engineering as fe
+import aggregation
+import sketch
+import spill
+from tests import reference
+
+
+@pytest.fixture
+def df_prep(df_train):
+    return prep.get_new_feats(df_train.copy())
+
+
+@pytest.fixture
+def spill_dir(tmp_path):
+    spill.configure(str(tmp_path), n_buckets=7, chunksize=3000)
+    yield str(tmp_path)
+    spill.configure()
+
+
+@pytest.mark.parametrize('mode', ['exact', 'sketch'])
+@pytest.mark.parametrize('feats', [fe.MERCHANT_FEATS, fe.USER_FEATS, fe.USER_MERCHANT_FEATS],
+                         ids=['merchant', 'user', 'user_merchant'])
+def test_spilled_matches_in_memory(df_prep, spill_dir, feats, mode):
+    sketch.configure(mode)
+    try:
+        df_expected = aggregation.aggregate(df_prep, feats)
+        df_res = spill.aggregate(df_prep, feats)
+    finally:
+        sketch.configure()
+
+    # same keys in the same order of first appearance
+    pd.testing.assert_frame_equal(df_res, df_expected, check_dtype=False)
+    assert os.listdir(spill_dir) == []
+
+
+def test_chunks_and_buckets_do_not_change_result(df_prep, spill_dir):
+    chunks = [df_prep.iloc[part] for part in np.array_split(np.arange(len(df_prep)), 5)]
+    df_expected = spill.aggregate(df_prep, fe.USER_MERCHANT_FEATS, n_buckets=1)
+
+    df_res = spill.aggregate_chunks(chunks, fe.USER_MERCHANT_FEATS, n_buckets=13)
+
+    pd.testing.assert_frame_equal(df_res, df_expected)
+
+
+def test_user_merchant_feats_with_spill_match_baseline(df_prep, df_raw, spill_dir):
+    df_expected = reference.get_user_merchant_feats(reference.get_new_feats(df_raw.copy()))
+
+    df_res = fe.get_user_merchant_feats(df_feats=df_prep)
+
+    reference.assert_frame_close(df_res, df_expected, keys=['user_id', 'merchant_id'])
+
+
+def test_missing_keys_are_rejected(df_prep, spill_dir):
+    df = df_prep.copy()
+    df.loc[df.index[0], 'merchant_id'] = np.nan
+
+    with pytest.raises(ValueError, match='missing merchant_id'):
+        spill.aggregate(df, fe.USER_MERCHANT_FEATS)
+    assert os.listdir(spill_dir) == []
@@ -0,0 +1,51 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 13:50
+# @author: agent
+# @contact: agent@local
+# @file: test_stage_cache.py
+# @desc: cached stages give the same result on a hit and keys cover every argument
+
+import os
+import pandas as pd
+import pytest
+import feature_engineering as fe
+import stage_cache
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    stage_cache.configure(str(tmp_path))
+    yield str(tmp_path)
+    stage_cache.configure(None)
+
+
+def get_cached(cache_dir, name):
+    return [file_name for file_name in os.listdir(cache_dir) if file_name.startswith(name + '-')]
+
+
+def test_hit_equals_miss(cache_dir, df_train):
+    df_miss = fe.basic_feature_version(df_train.copy(), is_train=True)
+    assert len(get_cached(cache_dir, 'basic_feature_version')) == 1
+
+    df_input = df_train.copy()
+    df_hit = fe.basic_feature_version(df_input, is_train=True)
+
+    pd.testing.assert_frame_equal(df_hit, df_miss)
+    # the stage does not run on a hit, the input frame is left as it is
+    pd.testing.assert_frame_equal(df_input, df_train)
+
+
+def test_key_covers_arguments(cache_dir, df_train):
+    fe.basic_feature_version(df_train.copy(), is_train=True)
+    fe.basic_feature_version(df_train.copy(), is_train=True, lean=True)
+    fe.basic_feature_version(df_train.iloc[1:].copy(), is_train=True)
+
+    assert len(get_cached(cache_dir, 'basic_feature_version')) == 3
+
+
+def test_fingerprint_hashes_frames_in_lists(df_train):
+    fingerprint = stage_cache.get_fingerprint([df_train, 1])
+
+    assert fingerprint == stage_cache.get_fingerprint([df_train.copy(), 1])
+    assert fingerprint != stage_cache.get_fingerprint([df_train.iloc[1:], 1])
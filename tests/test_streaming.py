@@ -0,0 +1,151 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 13:35
+# @author: agent
+# @contact: agent@local
+# @file: test_streaming.py
+# @desc: streaming relation features against relation_feature_version, spilled dedup and receipts
+
+import numpy as np
+import pandas as pd
+import pytest
+import utilities as utils
+import data_preprocess as prep
+import feature_engineering as fe
+import receipt
+import spill
+import streaming
+import aggregation
+from tests.conftest import TRAIN_FILE
+
+
+def is_received(df):
+    return (~df['coupon_id'].isna()) & (~df['date_received'].isna())
+
+
+def get_stream(data_dir, chunksize, **kwargs):
+    chunks = streaming.relation_feature_stream(TRAIN_FILE, data_dir=data_dir, is_train=True, chunksize=chunksize,
+                                               row_filter=is_received, **kwargs)
+
+    return pd.concat(list(chunks), ignore_index=True)
+
+
+@pytest.fixture
+def df_online_feat(df_train):
+    users = df_train['user_id'].dropna().unique()[::3]
+    return pd.DataFrame({'user_id': users, 'on_u_feat': np.arange(len(users), dtype=np.float64)})
+
+
+@pytest.mark.parametrize('n_buckets', [1, 7])
+def test_stream_matches_relation_feature_version(data_dir, df_train, df_online_feat, tmp_path, n_buckets,
+                                                 monkeypatch):
+    monkeypatch.setitem(spill.settings, 'n_buckets', n_buckets)
+    monkeypatch.setitem(spill.settings, 'dir', str(tmp_path))
+    df_expected = fe.relation_feature_version(df_train[is_received(df_train)].copy(), is_train=True,
+                                              df_online_feat=df_online_feat)
+
+    df_res = get_stream(data_dir, chunksize=3000, df_online_feat=df_online_feat)
+
+    assert list(df_res.columns) == list(df_expected.columns)
+    pd.testing.assert_frame_equal(df_res, df_expected.reset_index(drop=True), check_dtype=False)
+    # spill files are removed once the stream is consumed
+    assert not list(tmp_path.iterdir())
+
+
+def test_stream_drops_duplicates_across_chunks(df_train, tmp_path):
+    df = df_train[is_received(df_train)].iloc[:2000]
+    # every row again in later chunks, and some twice in the same chunk
+    df_dup = pd.concat([df, df.iloc[::5], df.iloc[::-1]], ignore_index=True)
+    df_dup.to_csv(str(tmp_path / TRAIN_FILE), index=False)
+    df_expected = fe.relation_feature_version(df_dup.copy(), is_train=True)
+
+    df_res = get_stream(str(tmp_path), chunksize=700)
+
+    assert len(df_res) == len(df_expected) == len(df.drop_duplicates())
+    pd.testing.assert_frame_equal(df_res, df_expected.reset_index(drop=True), check_dtype=False)
+
+
+@pytest.mark.parametrize('merge_every', [1, 4, 100])
+@pytest.mark.parametrize('feats', [fe.MERCHANT_FEATS, fe.USER_FEATS, fe.USER_MERCHANT_FEATS],
+                         ids=['merchant', 'user', 'user_merchant'])
+def test_aggregator_merges_buffered_chunks(df_train, monkeypatch, merge_every, feats):
+    monkeypatch.setattr(streaming, 'MERGE_EVERY', merge_every)
+    df = prep.get_new_feats(df_train.copy())
+    aggregator = streaming.StreamingAggregator(feats)
+    flushes = []
+    flush = aggregator.flush
+    monkeypatch.setattr(aggregator, 'flush', lambda: flushes.append(len(aggregator.pending)) or flush())
+
+    n_chunks = 0
+    for start in range(0, len(df), 1000):
+        aggregator.update(df.iloc[start:start + 1000])
+        n_chunks += 1
+
+    # the state is regrouped once every merge_every chunks, not once per chunk
+    assert len(flushes) == n_chunks // merge_every
+    pd.testing.assert_frame_equal(aggregator.finalize(), aggregation.aggregate(df, feats), check_dtype=False)
+
+
+def test_spilled_first_rows_matches_duplicated(tmp_path):
+    rng = np.random.RandomState(1)
+    df = pd.DataFrame({'a': rng.randint(0, 20, 5000), 'b': rng.choice([1.5, np.nan], 5000)})
+    first_rows = spill.SpilledFirstRows(dir_path=str(tmp_path), n_buckets=4)
+    for start in range(0, len(df), 900):
+        first_rows.update(df.iloc[start:start + 900])
+    first_rows.finalize()
+
+    np.testing.assert_array_equal(first_rows.take(0, len(df)), ~df.duplicated().values)
+    first_rows.close()
+
+
+@pytest.mark.parametrize('collide', [False, True])
+def test_spilled_first_rows_compares_values(tmp_path, monkeypatch, collide):
+    if collide:
+        # every row gets the same hash, rows are only told apart by their values
+        monkeypatch.setattr(spill, 'get_row_hashes', lambda df: np.zeros(len(df), dtype=np.uint64))
+    rng = np.random.RandomState(2)
+    n_rows = 3000
+    df = pd.DataFrame({'a': pd.array(rng.choice([1, 2, None], n_rows), dtype='Int32'),
+                       'b': rng.choice([0.5, -0.0, 0.0, np.nan], n_rows),
+                       'c': pd.Categorical(rng.choice(['x', 'y', None], n_rows)),
+                       'd': rng.choice(['20:1', 'fixed', None], n_rows).astype(object),
+                       'e': rng.choice([True, False], n_rows)})
+    first_rows = spill.SpilledFirstRows(dir_path=str(tmp_path), n_buckets=3)
+    for start in range(0, n_rows, 700):
+        first_rows.update(df.iloc[start:start + 700])
+    first_rows.finalize()
+
+    np.testing.assert_array_equal(first_rows.take(0, n_rows), ~df.duplicated().values)
+    first_rows.close()
+
+
+def test_spilled_receipts_match_compute(df_train, tmp_path):
+    df = prep.get_new_feats(df_train.copy())
+    df_expected = receipt.compute(df, fe.RECEIPT_FEATS)
+    receipts = spill.SpilledReceipts(fe.RECEIPT_FEATS, dir_path=str(tmp_path), n_buckets=5)
+    for start in range(0, len(df), 4000):
+        receipts.update(df.iloc[start:start + 4000])
+    receipts.finalize()
+
+    df_res = pd.concat([receipts.take(start, min(start + 3000, len(df)))
+                        for start in range(0, len(df), 3000)])
+
+    pd.testing.assert_frame_equal(df_res.set_axis(df_expected.index), df_expected, check_dtype=False)
+    receipts.close()
+    assert not list(tmp_path.iterdir())
+
+
+def test_stream_generator_writes_train_and_test(data_dir, df_train, df_test, tmp_path):
+    streaming.relation_feature_stream_generator(origin_data_dir=data_dir, feat_data_dir=str(tmp_path),
+                                                chunksize=5000)
+
+    # test rows join the families of the train set, as in relation_feature_generator
+    df_train = df_train[is_received(df_train)]
+    family_feats = fe.get_family_feats(prep.get_new_feats(df_train.copy()))
+    for name, df, is_train in [('train', df_train, True), ('test', df_test, False)]:
+        df_expected = fe.relation_feature_version(df.copy(), is_train=is_train, family_feats=family_feats)
+        df_res = utils.load_data('{0}_relation_feature_stream'.format(name), str(tmp_path), fmt='csv')
+        assert list(df_res.columns) == list(df_expected.columns)
+        assert ('label' in df_res.columns) == is_train
+        pd.testing.assert_frame_equal(df_res.astype('float64'),
+                                      df_expected.reset_index(drop=True).astype('float64'))
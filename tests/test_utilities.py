@@ -0,0 +1,159 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 13:25
+# @author: agent
+# @contact: agent@local
+# @file: test_utilities.py
+# @desc: typed reads, columnar cache, and save/load round trips
+
+import os
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+import utilities as utils
+import data_preprocess as prep
+from benchmarks import synthetic
+from tests import reference
+from tests.conftest import TRAIN_FILE, N_ROWS
+
+ONLINE_FILE = 'ccf_online_stage1_train.csv'
+
+
+def copy_train(data_dir, tmp_path):
+    """
+    train file in its own dir, so caches of one test are not seen by others
+    """
+    shutil.copy(os.path.join(data_dir, TRAIN_FILE), str(tmp_path))
+
+    return str(tmp_path)
+
+
+def test_typed_read_matches_baseline(df_raw, df_train):
+    assert str(df_train['user_id'].dtype) == 'Int32'
+    assert str(df_train['discount_rate'].dtype) == 'category'
+    reference.assert_frame_close(df_train, df_raw, cols=['user_id', 'merchant_id', 'coupon_id', 'distance',
+                                                         'date_received', 'date'])
+    pd.testing.assert_series_equal(df_train['discount_rate'].astype(object), df_raw['discount_rate'].astype(object),
+                                   check_dtype=False)
+
+
+def test_cache_reload_equals_parse(data_dir, tmp_path):
+    dir_path = copy_train(data_dir, tmp_path)
+    df_parsed = utils.read_data(TRAIN_FILE, data_dir=dir_path)
+    cache_path, _ = utils.get_cache_path(os.path.join(dir_path, TRAIN_FILE), utils.RAW_COLS, True)
+    assert os.path.exists(cache_path)
+
+    pd.testing.assert_frame_equal(utils.read_data(TRAIN_FILE, data_dir=dir_path), df_parsed)
+
+
+def test_cache_tag_covers_parse_settings(data_dir, tmp_path, monkeypatch):
+    file_path = os.path.join(data_dir, TRAIN_FILE)
+    cache_path, _ = utils.get_cache_path(file_path, utils.RAW_COLS, True)
+
+    assert utils.get_cache_path(file_path, utils.RAW_COLS, True, engine='c')[0] != \
+        utils.get_cache_path(file_path, utils.RAW_COLS, True, engine='pyarrow')[0]
+    monkeypatch.setattr(utils, 'EXTRA_NA', {'coupon_id': ['fixed', 'none']})
+    assert utils.get_cache_path(file_path, utils.RAW_COLS, True)[0] != cache_path
+    monkeypatch.undo()
+    monkeypatch.setattr(utils, 'CACHE_VERSION', utils.CACHE_VERSION + 1)
+    assert utils.get_cache_path(file_path, utils.RAW_COLS, True)[0] != cache_path
+
+
+def test_dtype_change_does_not_load_stale_cache(data_dir, tmp_path, monkeypatch):
+    dir_path = copy_train(data_dir, tmp_path)
+    assert str(utils.read_data(TRAIN_FILE, data_dir=dir_path)['distance'].dtype) == 'Int8'
+
+    monkeypatch.setitem(utils.RAW_DTYPES, 'distance', 'Int16')
+    assert str(utils.read_data(TRAIN_FILE, data_dir=dir_path)['distance'].dtype) == 'Int16'
+
+
+@pytest.mark.parametrize('partition_by', [None, 'month', 'user_id'])
+@pytest.mark.parametrize('fmt, compression', [('csv', None), ('csv', 'gzip'), ('csv', 'bz2'), ('csv', 'zip'),
+                                              ('csv', 'xz'), ('parquet', None), ('parquet', 'zstd'),
+                                              ('parquet', 'gzip'), ('feather', None), ('feather', 'lz4'),
+                                              ('feather', 'zstd')])
+def test_load_data_reads_what_save_data_writes(df_train, tmp_path, fmt, compression, partition_by):
+    df = prep.get_new_feats(df_train.copy())
+    utils.save_data(df, 'feats', str(tmp_path), fmt=fmt, compression=compression, partition_by=partition_by,
+                    n_buckets=4)
+
+    df_res = utils.load_data('feats', str(tmp_path), fmt=fmt, compression=compression)
+
+    cols = list(df.columns)
+    if partition_by:
+        name, parts = utils.get_partitions(df, partition_by, n_buckets=4)
+        df = df.assign(**{name: parts})
+        cols.append(name)
+    assert sorted(df_res.columns) == sorted(cols)
+    reference.assert_frame_close(df_res, df[cols], keys=cols)
+
+
+def test_load_data_reads_partition_cols(df_train, tmp_path):
+    df = prep.get_new_feats(df_train.copy())
+    utils.save_data(df, 'feats', str(tmp_path), compression='gzip', partition_by='user_id', n_buckets=4)
+
+    df_res = utils.load_data('feats', str(tmp_path), fmt='csv', columns=['user_id', 'user_id_bucket'],
+                             compression='gzip')
+
+    assert list(df_res.columns) == ['user_id', 'user_id_bucket']
+    assert len(df_res) == len(df)
+
+
+def test_downcast_keeps_values():
+    df = pd.DataFrame({'small': [1, 2, 3], 'large': [0, 40000, 5], 'neg': [-200, 0, 1], 'rate': [0.5, 0.25, 0.1],
+                       'nullable': pd.array([1, None, 3], dtype='Int64'), 'name': ['a', 'b', 'c']})
+    df_expected = df.copy()
+
+    df_res = utils.downcast(df)
+
+    assert df_res is df
+    assert [str(dtype) for dtype in df_res.dtypes] == ['int8', 'int32', 'int16', 'float32', 'Int64', 'object']
+    pd.testing.assert_frame_equal(df_res.astype({'small': 'int64', 'large': 'int64', 'neg': 'int64',
+                                                 'rate': 'float64'}), df_expected, rtol=1e-7)
+    assert utils.downcast(df_expected.copy(), ['small']).dtypes['large'] == np.int64
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'typed': True},
+    {'typed': False},
+    {'typed': True, 'usecols': ['date', 'user_id', 'discount_rate']},
+    {'typed': False, 'usecols': ['coupon_id', 'distance']},
+])
+def test_engines_read_the_same_frame(data_dir, kwargs):
+    df_c = utils.read_data(TRAIN_FILE, data_dir=data_dir, use_cache=False, engine='c', **kwargs)
+    df_arrow = utils.read_data(TRAIN_FILE, data_dir=data_dir, use_cache=False, engine='pyarrow', **kwargs)
+
+    pd.testing.assert_frame_equal(df_arrow, df_c)
+
+
+@pytest.mark.parametrize('typed', [True, False])
+@pytest.mark.parametrize('chunksize', [1000, 7777, N_ROWS + 1])
+def test_engines_read_the_same_chunks(data_dir, monkeypatch, typed, chunksize):
+    # small blocks, so chunks are regrouped across many pyarrow batches
+    monkeypatch.setattr(utils, 'ARROW_BLOCK_SZ', 1 << 14)
+    chunks_c = list(utils.read_data(TRAIN_FILE, data_dir=data_dir, use_cache=False, engine='c', typed=typed,
+                                    chunksize=chunksize))
+    chunks_arrow = list(utils.read_data(TRAIN_FILE, data_dir=data_dir, use_cache=False, engine='pyarrow',
+                                        typed=typed, chunksize=chunksize))
+
+    assert [len(df) for df in chunks_arrow] == [len(df) for df in chunks_c]
+    for df_arrow, df_c in zip(chunks_arrow, chunks_c):
+        pd.testing.assert_index_equal(df_arrow.index, df_c.index)
+        pd.testing.assert_frame_equal(df_arrow, df_c)
+
+
+@pytest.mark.parametrize('engine', ['pyarrow', 'c'])
+def test_fixed_coupon_of_online_data_is_missing(tmp_path, engine):
+    synthetic.gen_online_data(str(tmp_path), 5000)
+    df_raw = pd.read_csv(os.path.join(str(tmp_path), ONLINE_FILE), header=0, names=utils.ONLINE_COLS, dtype=str,
+                         keep_default_na=False)
+
+    df = utils.read_data(ONLINE_FILE, rename_col=utils.ONLINE_COLS, data_dir=str(tmp_path), use_cache=False,
+                         engine=engine)
+
+    is_fixed = (df_raw['coupon_id'] == 'fixed').values
+    assert is_fixed.any()
+    assert df['coupon_id'][is_fixed].isna().all()
+    assert (df['discount_rate'][is_fixed].astype(str) == 'fixed').all()
+    assert str(df['coupon_id'].dtype) == utils.RAW_DTYPES['coupon_id']
@@ -0,0 +1,86 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 14:35
+# @author: agent
+# @contact: agent@local
+# @file: test_windows.py
+# @desc: stacked window features against the baseline features computed window by window
+
+import numpy as np
+import pandas as pd
+import pytest
+import windows
+from tests import reference
+from tests.conftest import TEST_FILE, TEST_COLS
+
+
+# windows overlap and the unlabeled one takes its label rows from test data
+WINDOWS = [
+    windows.Window('train', (20160101, 20160315), (20160316, 20160415), True),
+    windows.Window('valid', (20160201, 20160415), (20160416, 20160515), True),
+    windows.Window('test', (20160301, 20160515), (20160516, 20160615), False),
+]
+FAMILIES = [
+    (reference.get_merchant_feats, ['merchant_id']),
+    (reference.get_user_feats, ['user_id']),
+    (reference.get_user_merchant_feats, ['user_id', 'merchant_id']),
+]
+
+
+def get_expected(df_prep, df_test_prep, window):
+    """
+    one window with the baseline functions, usage after the feature window is hidden
+    """
+    feat_start, feat_end = window.feat_window
+    day = df_prep['date_received'].fillna(df_prep['date'])
+    df_feat = df_prep[(day >= feat_start) & (day <= feat_end)].copy()
+    df_feat['date'] = df_feat['date'].mask(df_feat['date'] > feat_end)
+
+    df_label = df_prep if window.labeled else df_test_prep
+    label_start, label_end = window.label_window
+    df_label = df_label[df_label['coupon_id'].notna() & (df_label['date_received'] >= label_start) &
+                        (df_label['date_received'] <= label_end)].copy()
+    if window.labeled:
+        df_label = reference.get_new_label(df_label).drop(['date', 'days_gap'], axis=1)
+
+    for get_feats, keys in FAMILIES:
+        df_label = df_label.merge(get_feats(df_feat.copy()), on=keys, how='left')
+
+    return df_label.drop_duplicates()
+
+
+@pytest.fixture
+def df_test_raw(data_dir):
+    return reference.read_data(TEST_FILE, data_dir, rename_col=TEST_COLS)
+
+
+def test_build_windows_matches_window_by_window(df_train, df_test, df_raw, df_test_raw):
+    df_prep = reference.get_new_feats(df_raw.copy())
+    df_test_prep = reference.get_new_feats(df_test_raw.copy())
+
+    res = windows.build_windows(df_train, WINDOWS, df_test)
+
+    assert list(res) == [window.name for window in WINDOWS]
+    for window in WINDOWS:
+        df_expected = get_expected(df_prep, df_test_prep, window)
+        df_res = res[window.name]
+        assert len(df_expected) > 0
+        assert ('label' in df_res.columns) == window.labeled
+        assert set(df_res.columns) == set(df_expected.columns)
+        keys = list(df_expected.columns)
+        reference.assert_frame_close(df_res, df_expected, keys=keys)
+
+
+def test_unlabeled_windows_require_test_data(df_train):
+    with pytest.raises(ValueError, match='test'):
+        windows.build_windows(df_train, WINDOWS)
+
+
+def test_assign_windows_matches_day_loop():
+    days = np.array([0, 5, np.nan, 9, 10, 3], dtype=np.float64)
+    starts, ends = np.array([0, 3, 8], dtype=np.float64), np.array([5, 9, 20], dtype=np.float64)
+
+    ids, pos = windows.assign_windows(days, starts, ends)
+
+    expected = [(i, j) for i in range(len(starts)) for j, day in enumerate(days) if starts[i] <= day <= ends[i]]
+    assert list(zip(ids, pos)) == expected
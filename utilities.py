@@ -6,58 +6,648 @@
 # @file: utilities.py
 # @desc:
 
+import os
+import json
+import uuid
+import shutil
+import hashlib
 import numpy as np
 from datetime import date
 import pandas as pd
+import date_utils
+import sampling
 from logs import logger
+from logs.instrument import traced
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    import pyarrow.dataset as ds
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError:  # columnar cache, output and csv engine are optional, fall back to pandas csv
+    pa = None
+    pc = None
+    pa_csv = None
+    ds = None
+    feather = None
+    pq = None
+
+
+# column names of raw data, renamed by position
+RAW_COLS = ['user_id', 'merchant_id', 'coupon_id', 'discount_rate', 'distance', 'date_received', 'date']
+# column names of online data (ccf_online_stage1_train.csv), action is 0 click, 1 buy, 2 receive coupon
+ONLINE_COLS = ['user_id', 'merchant_id', 'action', 'coupon_id', 'discount_rate', 'date_received', 'date']
+# compact dtypes of raw data, ids and dates are nullable since coupon may be null
+RAW_DTYPES = {
+    'user_id': 'Int32',
+    'merchant_id': 'Int32',
+    'action': 'Int8',
+    'coupon_id': 'Int32',
+    'discount_rate': 'category',
+    'distance': 'Int8',
+    'date_received': 'Int32',
+    'date': 'Int32',
+}
+# markers parsed as missing besides null, fixed price deals of online data have coupon_id fixed,
+# they are still told apart by discount_rate fixed
+EXTRA_NA = {'coupon_id': ['fixed']}
+# missing markers of pyarrow engine, same as the ones of pandas found in the data
+ARROW_NA = ['', 'null', 'NULL', 'NaN', 'nan', 'NA', 'N/A']
+# csv engine, pyarrow parses with all cores, c is the pandas parser
+CSV_ENGINE = 'pyarrow' if pa_csv is not None else 'c'
+# bytes of each block decoded by the pyarrow stream before regrouping into chunks
+ARROW_BLOCK_SZ = 1 << 24
+# format version of the columnar cache, bump it when parsing changes in a way the cache tag does not capture
+CACHE_VERSION = 2
+
+
+def get_file_hash(file_path, block_sz=1 << 22):
+    """
+    get md5 of file content
+    :param file_path: string,
+    :param block_sz: int, bytes read each time
+    :return: string
+    """
+    md5 = hashlib.md5()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_sz), b''):
+            md5.update(block)
+
+    return md5.hexdigest()
+
+
+def get_cache_path(file_path, cols, typed, engine=None):
+    """
+    get path of columnar cache next to the source file
+    the tag covers every setting the parsed frame depends on, so a change of dtypes, missing markers,
+    engine or cache format never loads a cache parsed with the old settings
+    :param file_path: string, path of source csv
+    :param cols: list, column names
+    :param typed: boolean,
+    :param engine: string, csv engine, default is CSV_ENGINE
+    :return: tuple, path of cache and path of its meta file
+    """
+    settings = [CACHE_VERSION, cols, typed, get_engine(engine), RAW_DTYPES, EXTRA_NA, ARROW_NA]
+    tag = hashlib.md5(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:8]
+    cache_path = '{0}.{1}.feather'.format(file_path, tag)
+
+    return cache_path, cache_path + '.meta.json'
+
+
+def check_cache(file_path, cache_path, meta_path):
+    """
+    check columnar cache is still valid for the source file
+    cache is valid if source mtime and size are unchanged, otherwise the source hash is compared
+    :param file_path: string,
+    :param cache_path: string,
+    :param meta_path: string,
+    :return: boolean
+    """
+    if feather is None or not os.path.exists(cache_path) or not os.path.exists(meta_path):
+        return False
+
+    with open(meta_path) as f:
+        meta = json.load(f)
+    stat = os.stat(file_path)
+    if meta['mtime'] != stat.st_mtime or meta['size'] != stat.st_size:
+        if meta['size'] != stat.st_size or meta['md5'] != get_file_hash(file_path):
+            return False
+        # touched but not modified, refresh mtime
+        meta['mtime'] = stat.st_mtime
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+
+    return True
+
+
+def load_cache(file_path, cache_path, meta_path, usecols=None):
+    """
+    load columnar cache if it is still valid for the source file
+    :param file_path: string,
+    :param cache_path: string,
+    :param meta_path: string,
+    :param usecols: list, cols to load, None for all
+    :return: DataFrame or None
+    """
+    if not check_cache(file_path, cache_path, meta_path):
+        return None
+
+    return feather.read_table(cache_path, columns=usecols, memory_map=True).to_pandas()
+
+
+def save_cache(df, file_path, cache_path, meta_path):
+    """
+    save parsed DataFrame as uncompressed feather so it can be memory-mapped
+    :param df: DataFrame,
+    :param file_path: string,
+    :param cache_path: string,
+    :param meta_path: string,
+    :return:
+    """
+    if feather is None:
+        return
+
+    stat = os.stat(file_path)
+    meta = {'mtime': stat.st_mtime, 'size': stat.st_size, 'md5': get_file_hash(file_path)}
+    feather.write_feather(df.reset_index(drop=True), cache_path, compression='uncompressed')
+    with open(meta_path, 'w') as f:
+        json.dump(meta, f)
+
+
+# rows of each chunk streamed when sampling
+SAMPLE_CHUNK_SZ = 500000
+
+
+def get_engine(engine=None):
+    """
+    :param engine: string, pyarrow or c, default is CSV_ENGINE
+    :return: string, validated engine
+    """
+    engine = CSV_ENGINE if engine is None else engine
+    if engine not in ('pyarrow', 'c'):
+        raise ValueError('engine must be pyarrow or c, got {0}.'.format(engine))
+    if engine == 'pyarrow' and pa_csv is None:
+        raise ImportError('pyarrow is required by the pyarrow csv engine.')
+
+    return engine
 
 
-def read_data(file_name, rename_col=None, sample_sz=10000, is_sample=False, data_dir=None):
+def get_csv_kwargs(cols, typed, usecols):
+    """
+    keyword args of pandas read_csv
+    :param cols: list, column names
+    :param typed: boolean,
+    :param usecols: list, cols to parse, None for all
+    :return: dict
+    """
+    usecols = cols if usecols is None else usecols
+    dtypes = {col: RAW_DTYPES[col] for col in usecols if col in RAW_DTYPES} if typed else None
+    na_values = {col: markers for col, markers in EXTRA_NA.items() if col in usecols}
+
+    return {'header': 0, 'names': cols, 'usecols': usecols, 'dtype': dtypes, 'keep_default_na': True,
+            'na_values': na_values}
+
+
+def get_arrow_type(dtype):
+    """
+    :param dtype: string, pandas dtype of RAW_DTYPES, nullable int or category
+    :return: pyarrow DataType
+    """
+    if dtype == 'category':
+        return pa.dictionary(pa.int32(), pa.string())
+
+    return pa.from_numpy_dtype(pd.api.types.pandas_dtype(dtype).numpy_dtype)
+
+
+def get_arrow_options(cols, typed, usecols, block_sz=None):
+    """
+    options of pyarrow csv reader, missing markers become null at parse time and only usecols are decoded
+    cols with extra missing markers are parsed as string and converted by fix_arrow_table
+    :param cols: list, column names
+    :param typed: boolean,
+    :param usecols: list, cols to parse, None for all
+    :param block_sz: int, bytes of each parsed block, default is pyarrow default
+    :return: tuple, read options and convert options
+    """
+    usecols = cols if usecols is None else usecols
+    column_types = {col: get_arrow_type(RAW_DTYPES[col]) for col in usecols if typed and col in RAW_DTYPES}
+    column_types.update({col: pa.string() for col in EXTRA_NA if col in usecols})
+
+    read_kwargs = {'use_threads': True, 'column_names': cols, 'skip_rows': 1}
+    if block_sz is not None:
+        read_kwargs['block_size'] = block_sz
+    convert_options = pa_csv.ConvertOptions(column_types=column_types, include_columns=usecols,
+                                            null_values=ARROW_NA, strings_can_be_null=True)
+
+    return pa_csv.ReadOptions(**read_kwargs), convert_options
+
+
+def fix_arrow_table(table, typed):
+    """
+    turn extra missing markers into null and cast these cols to their dtype
+    :param table: pyarrow Table or RecordBatch
+    :param typed: boolean,
+    :return: pyarrow Table or RecordBatch
+    """
+    for col, markers in EXTRA_NA.items():
+        if col not in table.column_names:
+            continue
+        values = table.column(col)
+        values = pc.if_else(pc.is_in(values, value_set=pa.array(markers)), pa.scalar(None, pa.string()), values)
+        arrow_type = get_arrow_type(RAW_DTYPES[col]) if typed and col in RAW_DTYPES else pa.int64()
+        table = table.set_column(table.column_names.index(col), col, pc.cast(values, arrow_type))
+
+    return table
+
+
+def arrow_to_pandas(table, typed):
+    """
+    same dtypes as pandas read_csv, nullable ints and categories sorted by value
+    :param table: pyarrow Table
+    :param typed: boolean,
+    :return: DataFrame
+    """
+    types_mapper = {pa.int8(): pd.Int8Dtype(), pa.int16(): pd.Int16Dtype(), pa.int32(): pd.Int32Dtype(),
+                    pa.int64(): pd.Int64Dtype()}.get if typed else None
+    df = table.to_pandas(types_mapper=types_mapper)
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.reorder_categories(sorted(df[col].cat.categories))
+
+    return df
+
+
+def read_csv(file_path, cols, typed=True, usecols=None, engine=None):
+    """
+    parse a csv file at once
+    :param file_path: string,
+    :param cols: list, column names, renamed by position
+    :param typed: boolean, parse with compact dtypes of RAW_DTYPES
+    :param usecols: list, cols to parse, None for all
+    :param engine: string, pyarrow or c, default is CSV_ENGINE
+    :return: DataFrame
+    """
+    if get_engine(engine) == 'c':
+        return pd.read_csv(file_path, **get_csv_kwargs(cols, typed, usecols))
+
+    read_options, convert_options = get_arrow_options(cols, typed, usecols)
+    table = pa_csv.read_csv(file_path, read_options=read_options, convert_options=convert_options)
+
+    return arrow_to_pandas(fix_arrow_table(table, typed), typed)
+
+
+def iter_csv_arrow(file_path, cols, chunksize, typed=True, usecols=None):
+    """
+    stream a csv file with pyarrow, blocks are decoded in parallel and regrouped into chunks of chunksize rows
+    :param file_path: string,
+    :param cols: list,
+    :param chunksize: int,
+    :param typed: boolean,
+    :param usecols: list,
+    :return: generator of DataFrame, index continues across chunks, one empty chunk if there are no rows
+    """
+    read_options, convert_options = get_arrow_options(cols, typed, usecols, block_sz=ARROW_BLOCK_SZ)
+    reader = pa_csv.open_csv(file_path, read_options=read_options, convert_options=convert_options)
+
+    offset = 0
+    batches = []
+    n_rows = 0
+    for batch in reader:
+        batches.extend(fix_arrow_table(pa.Table.from_batches([batch]), typed).to_batches())
+        n_rows += batch.num_rows
+        while n_rows >= chunksize:
+            # dictionaries of category cols differ by batch, they are unified by combine_chunks
+            table = pa.Table.from_batches(batches).unify_dictionaries().combine_chunks()
+            df = arrow_to_pandas(table.slice(0, chunksize), typed)
+            df.index = pd.RangeIndex(offset, offset + len(df))
+            yield df
+            offset += len(df)
+            batches = table.slice(chunksize).to_batches()
+            n_rows -= chunksize
+    if n_rows or not offset:
+        # a file without rows still gives one empty typed chunk, like pandas
+        if batches:
+            table = pa.Table.from_batches(batches).unify_dictionaries().combine_chunks()
+        else:
+            table = fix_arrow_table(pa.Table.from_batches([], schema=reader.schema), typed)
+        df = arrow_to_pandas(table, typed)
+        df.index = pd.RangeIndex(offset, offset + len(df))
+        yield df
+
+
+def read_data_chunks(file_path, cols, chunksize, typed=True, use_cache=True, usecols=None, engine=None):
+    """
+    read local data file chunk by chunk, only one chunk is in memory at a time
+    chunks are sliced from the memory-mapped columnar cache if it is valid, otherwise parsed from csv
+    :param file_path: string,
+    :param cols: list, column names
+    :param chunksize: int, rows of each chunk
+    :param typed: boolean,
+    :param use_cache: boolean,
+    :param usecols: list, cols to read, None for all
+    :param engine: string, csv engine, pyarrow or c, default is CSV_ENGINE
+    :return: generator of DataFrame, index continues across chunks, one empty chunk if there are no rows
+    """
+    cache_path, meta_path = get_cache_path(file_path, cols, typed, engine)
+    if use_cache and check_cache(file_path, cache_path, meta_path):
+        table = feather.read_table(cache_path, columns=usecols, memory_map=True)
+        for offset in range(0, max(table.num_rows, 1), chunksize):
+            df = table.slice(offset, chunksize).to_pandas()
+            df.index = pd.RangeIndex(offset, offset + len(df))
+            yield df
+        return
+
+    if get_engine(engine) == 'pyarrow':
+        yield from iter_csv_arrow(file_path, cols, chunksize, typed=typed, usecols=usecols)
+        return
+
+    for df in pd.read_csv(file_path, chunksize=chunksize, **get_csv_kwargs(cols, typed, usecols)):
+        yield df
+
+
+@traced()
+def read_data(file_name, rename_col=None, sample_sz=10000, is_sample=False, data_dir=None, typed=True,
+              use_cache=True, chunksize=None, sample_by=None, sample_frac=0.05, seed=10, usecols=None, engine=None):
     """
     read local data file
+    samples are drawn while streaming the file, so the whole file is never loaded
     :param file_name: string, format is like xxx.csv
     :param rename_col: list
     :param sample_sz: int, size of sample data, default is 10k
     :param is_sample: boolean,
     :param data_dir: string,
+    :param typed: boolean, parse with compact dtypes of RAW_DTYPES
+    :param use_cache: boolean, load from (or build) columnar cache next to the csv
+    :param chunksize: int, if set return a generator of chunks with this number of rows,
+                      only sampling by keys is supported
+    :param sample_by: list, id cols like ['user_id'], keep every row of a hashed fraction of these entities
+                      instead of sample_sz random rows
+    :param sample_frac: float, fraction of entities kept when sampling by keys
+    :param seed: int, seed of sampling, the same seed keeps the same entities in every file
+    :param usecols: list, only these of the renamed cols are parsed, cache is only built when all cols are read
+    :param engine: string, csv engine, pyarrow parses with all cores, c is the pandas parser, default is CSV_ENGINE
     :return:
     """
     if data_dir is None:
 
         raise ValueError(print('data_dir cannot be None.'))
 
-    df = pd.read_csv('{0}/{1}'.format(data_dir, file_name), keep_default_na=True)
-    if not rename_col:
-        df.columns = ['user_id', 'merchant_id', 'coupon_id', 'discount_rate',
-                      'distance', 'date_received', 'date']
+    file_path = '{0}/{1}'.format(data_dir, file_name)
+    cols = rename_col if rename_col else RAW_COLS
+    if usecols is not None:
+        if set(usecols) - set(cols):
+            raise ValueError('unknown cols {0}.'.format(sorted(set(usecols) - set(cols))))
+        usecols = [col for col in cols if col in usecols]  # same order as the file in every engine
+
+    if chunksize is not None:
+        chunks = read_data_chunks(file_path, cols, chunksize, typed=typed, use_cache=use_cache, usecols=usecols,
+                                  engine=engine)
+        if not is_sample:
+            return chunks
+        if not sample_by:
+            raise ValueError('only sampling by keys is supported when reading by chunks.')
+        return sampling.hash_sample_chunks(chunks, sample_by, sample_frac, seed)
+
+    if is_sample:  # construct sample data
+        chunks = read_data_chunks(file_path, cols, SAMPLE_CHUNK_SZ, typed=typed, use_cache=use_cache,
+                                  usecols=usecols, engine=engine)
+        if sample_by:
+            df = pd.concat(list(sampling.hash_sample_chunks(chunks, sample_by, sample_frac, seed)))
+        else:
+            df = sampling.reservoir_sample(chunks, sample_sz, seed, columns=usecols or cols)
+        logger.info('{0} is sampled with length {1}'.format(file_path, len(df)))
+
+        return df
+
+    cache_path, meta_path = get_cache_path(file_path, cols, typed, engine)
+    df = load_cache(file_path, cache_path, meta_path, usecols=usecols) if use_cache else None
+    if df is None:
+        df = read_csv(file_path, cols, typed=typed, usecols=usecols, engine=engine)
+        if use_cache and usecols is None:
+            save_cache(df, file_path, cache_path, meta_path)
     else:
-        df.columns = rename_col
-    if not is_sample:
-        pass
-    else:  # construct sample data
-        idx = list(df.sample(n=sample_sz, random_state=10).index)  # sample is for shuffling
-        df = df.iloc[idx, :]
+        logger.info('{0} is loaded from cache {1}'.format(file_path, cache_path))
+
+    logger.info('{0} is read with length {1}'.format(file_path, len(df)))
+
+    return df
 
-    print('length of df:', len(df))
+
+def downcast(df, cols=None):
+    """
+    downcast numeric cols in place, int to the smallest int type holding its values and float to float32
+    nullable and non numeric cols are kept
+    :param df: DataFrame,
+    :param cols: list, default is all cols
+    :return: DataFrame
+    """
+    for col in df.columns if cols is None else cols:
+        dtype = df[col].dtype
+        if dtype.kind in 'iu' and isinstance(dtype, np.dtype):
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+        elif dtype == np.float64:
+            df[col] = df[col].astype(np.float32)
 
     return df
 
 
-def save_data(df, file_name, data_dir):
+# file extension of each output format and csv compression
+SAVE_EXTS = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather'}
+CSV_COMPRESSION_EXTS = {'gzip': '.gz', 'bz2': '.bz2', 'xz': '.xz', 'zstd': '.zst', 'zip': '.zip'}
+
+
+def get_save_ext(fmt, compression=None):
+    """
+    extension of saved files, compressed csv gets the extension its compression is inferred from
+    :param fmt: string, csv, parquet or feather
+    :param compression: string,
+    :return: string
+    """
+    if fmt not in SAVE_EXTS:
+        raise ValueError('format {0} is not supported.'.format(fmt))
+    ext = SAVE_EXTS[fmt]
+    if fmt == 'csv' and compression:
+        ext += CSV_COMPRESSION_EXTS.get(compression, '')
+
+    return ext
+
+
+def get_partitions(df, partition_by, n_buckets=16):
+    """
+    partition of each row
+    :param df: DataFrame,
+    :param partition_by: string, month (of date_received) or a key col hashed into n_buckets
+    :param n_buckets: int,
+    :return: tuple, partition name and ndarray of partition values
+    """
+    if partition_by == 'month':
+        return 'month', date_utils.get_month(df['date_received'])
+
+    values = pd.Series(df[partition_by], copy=False).astype('float64').to_numpy()
+
+    return partition_by + '_bucket', (pd.util.hash_array(values) % n_buckets).astype(np.int64)
+
+
+def write_file(df, path, fmt, compression=None, row_group_size=None):
+    """
+    write one file without partition
+    :param df: DataFrame,
+    :param path: string,
+    :param fmt: string, csv, parquet or feather
+    :param compression: string, e.g. gzip for csv, snappy/zstd for parquet, lz4/zstd for feather
+    :param row_group_size: int, rows of each parquet row group or feather record batch
+    :return:
+    """
+    if fmt == 'csv':
+        df.to_csv(path, index=False, compression=compression)
+        return
+
+    if pa is None:
+        raise ImportError('pyarrow is required to save {0}.'.format(fmt))
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    if fmt == 'parquet':
+        pq.write_table(table, path, compression=compression or 'snappy', row_group_size=row_group_size)
+    elif fmt == 'feather':
+        feather.write_feather(table, path, compression=compression, chunksize=row_group_size)
+    else:
+        raise ValueError('format {0} is not supported.'.format(fmt))
+
+
+def replace_path(tmp_path, path):
+    """
+    move finished temp output to its final path, the old output is only removed after the move
+    :param tmp_path: string,
+    :param path: string,
+    :return:
+    """
+    if os.path.isdir(path):
+        old_path = tmp_path + '.old'
+        os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path)
+    else:
+        os.replace(tmp_path, path)
+
+
+@traced()
+def save_data(df, file_name, data_dir, fmt='csv', compression=None, row_group_size=None, partition_by=None,
+              n_buckets=16):
     """
     save processed data
+    output is written to a temp file (or dir) in data_dir then renamed, readers never see partial files
     :param df:
     :param file_name:
     :param data_dir:
-    :return:
+    :param fmt: string, csv, parquet or feather
+    :param compression: string, e.g. gzip for csv, snappy/zstd for parquet, lz4/zstd for feather
+    :param row_group_size: int, rows of each parquet row group or feather record batch
+    :param partition_by: string, month (of date_received) or a key col like user_id hashed into n_buckets,
+        partitions are written as file_name/<partition>=<value>/part-0.<fmt>
+    :param n_buckets: int, number of hash buckets if partitioned by key col
+    :return: string, path of saved file or dir
     """
 
     if data_dir is None:
         raise ValueError(print('data_dir cannot be None.'))
 
-    df.to_csv('{0}/{1}.csv'.format(data_dir, file_name), index=False)
+    ext = get_save_ext(fmt, compression)
+    path = '{0}/{1}'.format(data_dir, file_name) + ('' if partition_by else ext)
+    tmp_path = '{0}/.tmp-{1}-{2}'.format(data_dir, file_name, uuid.uuid4().hex)
+
+    try:
+        if partition_by:
+            os.makedirs(tmp_path)
+            name, parts = get_partitions(df, partition_by, n_buckets)
+            for part in np.unique(parts):
+                part_dir = os.path.join(tmp_path, '{0}={1}'.format(name, part))
+                os.makedirs(part_dir)
+                write_file(df[parts == part], os.path.join(part_dir, 'part-0' + ext), fmt,
+                           compression=compression, row_group_size=row_group_size)
+        else:
+            write_file(df, tmp_path, fmt, compression=compression, row_group_size=row_group_size)
+        replace_path(tmp_path, path)
+    except BaseException:
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path, ignore_errors=True)
+        elif os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
     logger.info('{0}/{1} is saved with length {2}'.format(data_dir, file_name, len(df)))
 
+    return path
+
+
+def get_partition_value(value):
+    """
+    value of a hive partition dir name, int if it is one like the partitioning of pyarrow datasets
+    :param value: string,
+    :return: int or string
+    """
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def read_csv_partitions(path, ext, columns=None, compression=None):
+    """
+    csv partitions written by save_data as <partition>=<value>/part-0<ext>, partition col is added to the rows
+    :param path: string, dir of partitions
+    :param ext: string, extension of part files
+    :param columns: list, cols to read, None for all
+    :param compression: string,
+    :return: DataFrame
+    """
+    parts = [part.split('=', 1) for part in os.listdir(path) if '=' in part]
+    frames = []
+    for name, value in sorted(parts):
+        usecols = None if columns is None else [col for col in columns if col != name]
+        df = pd.read_csv(os.path.join(path, '{0}={1}'.format(name, value), 'part-0' + ext), usecols=usecols,
+                         compression=compression or 'infer')
+        if columns is None or name in columns:
+            df[name] = get_partition_value(value)
+        frames.append(df)
+    df = pd.concat(frames, ignore_index=True)
+
+    return df if columns is None else df[columns]
+
+
+def load_data(file_name, data_dir, fmt='parquet', columns=None, filters=None, compression=None):
+    """
+    load data saved by save_data, only the needed columns and partitions are read
+    :param file_name: string, same as save_data
+    :param data_dir: string,
+    :param fmt: string, csv, parquet or feather, same as save_data
+    :param columns: list, cols to read, None for all
+    :param filters: list, partition filters of parquet like [('month', 'in', [5, 6])]
+    :param compression: string, same as save_data, only needed for csv whose extension depends on it
+    :return: DataFrame, partitioned data gets the partition col
+    """
+    ext = get_save_ext(fmt, compression)
+    path = '{0}/{1}'.format(data_dir, file_name)
+    is_partitioned = os.path.isdir(path)
+
+    if fmt == 'csv':
+        if is_partitioned:
+            return read_csv_partitions(path, ext, columns=columns, compression=compression)
+        return pd.read_csv(path + ext, usecols=columns, compression=compression or 'infer')
+    if pa is None:
+        raise ImportError('pyarrow is required to load {0}.'.format(fmt))
+    if not is_partitioned:
+        path += ext
+    if fmt == 'parquet':
+        return pq.read_table(path, columns=columns, filters=filters).to_pandas()
+    if is_partitioned:
+        return ds.dataset(path, format='feather', partitioning='hive').to_table(columns=columns).to_pandas()
+
+    return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+
+@traced()
+def save_data_chunks(chunks, file_name, data_dir):
+    """
+    save processed data chunk by chunk, appending to the same csv as save_data
+    :param chunks: iterable of DataFrame
+    :param file_name:
+    :param data_dir:
+    :return: int, number of saved rows
+    """
+
+    if data_dir is None:
+        raise ValueError('data_dir cannot be None.')
+
+    file_path = '{0}/{1}.csv'.format(data_dir, file_name)
+    n_rows = 0
+    for i, df in enumerate(chunks):
+        df.to_csv(file_path, index=False, mode='w' if i == 0 else 'a', header=(i == 0))
+        n_rows += len(df)
+    logger.info('{0}/{1} is saved with length {2}'.format(data_dir, file_name, n_rows))
+
+    return n_rows
+
 
 # get features
 def get_month(s):
@@ -110,6 +700,7 @@ def get_diff_btw_dates(x, y):
         return delta.days
 
 
+@traced()
 def add_agg_feat_names(df, df_grp, grp_cols, val_col, agg_ops, col_names):
     """
 
@@ -131,6 +722,7 @@ def add_agg_feat_names(df, df_grp, grp_cols, val_col, agg_ops, col_names):
     return df
 
 
+@traced()
 def add_agg_feats(df, df_grp, grp_cols, val_col, agg_ops, kws):
     """
 
@@ -153,6 +745,7 @@ def add_agg_feats(df, df_grp, grp_cols, val_col, agg_ops, kws):
     return df
 
 
+@traced()
 def add_count_new_feats(df, df_grp, grp_cols, new_feat_name):
     """
     process count features
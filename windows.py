@@ -0,0 +1,198 @@
+# !/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @time: 2026-10-18 12:51
+# @author: agent
+# @contact: agent@local
+# @file: windows.py
+# @desc: leak-free feature and label windows built in one pass
+
+# packages
+from collections import namedtuple
+import time
+import numpy as np
+import pandas as pd
+import utilities as utils
+import date_utils
+import data_preprocess as prep
+import feature_engineering as fe
+import backends
+from logs import logger
+from logs.instrument import traced
+
+
+# set global args
+origin_data_dir = 'data/origin'
+feat_data_dir = 'data/features'
+
+# one window
+# name: string, like train, valid or test
+# feat_window: tuple, first and last yyyyMMdd day of rows features are computed from
+# label_window: tuple, first and last yyyyMMdd day of coupons received, these rows are labeled
+# labeled: boolean, label rows come from offline train data, otherwise from test data without label
+Window = namedtuple('Window', ['name', 'feat_window', 'label_window', 'labeled'])
+
+# offline train data covers 20160101 - 20160630, test data receives coupons in 201607
+WINDOWS = [
+    Window('train', (20160101, 20160413), (20160414, 20160514), True),
+    Window('valid', (20160201, 20160514), (20160515, 20160615), True),
+    Window('test', (20160301, 20160630), (20160701, 20160731), False),
+]
+TEST_COLS = ['user_id', 'merchant_id', 'coupon_id', 'discount_rate', 'distance', 'date_received']
+
+
+def get_bounds(windows, field):
+    """
+    :param windows: list of Window
+    :param field: string, feat_window or label_window
+    :return: tuple, ndarray of first and last day numbers of each window
+    """
+    dates = np.array([getattr(window, field) for window in windows], dtype=np.float64)
+
+    return date_utils.to_day_number(dates[:, 0]), date_utils.to_day_number(dates[:, 1])
+
+
+def assign_windows(days, starts, ends):
+    """
+    rows of each window by comparing every day with all bounds at once, windows may overlap
+    :param days: ndarray, day numbers of rows, NaN is in no window
+    :param starts: ndarray, first day number of each window
+    :param ends: ndarray, last day number of each window
+    :return: tuple, window index and row position, sorted by window then row
+    """
+    with np.errstate(invalid='ignore'):
+        member = (days[None, :] >= starts[:, None]) & (days[None, :] <= ends[:, None])
+
+    return np.nonzero(member)
+
+
+@traced()
+def stack_feat_rows(df, windows):
+    """
+    rows of every feature window stacked with window_id
+    a row belongs to the window of its receiving day, or of its consuming day if no coupon is received;
+    consuming days after the end of the window are hidden
+    :param df: DataFrame, output of prep.get_new_feats
+    :param windows: list of Window
+    :return: DataFrame
+    """
+    received = date_utils.to_day_number(df['date_received'])
+    used = date_utils.to_day_number(df['date'])
+    starts, ends = get_bounds(windows, 'feat_window')
+    window_ids, pos = assign_windows(np.where(np.isnan(received), used, received), starts, ends)
+
+    df_win = df.iloc[pos].reset_index(drop=True)
+    df_win['window_id'] = window_ids
+    with np.errstate(invalid='ignore'):
+        leaked = used[pos] > ends[window_ids]
+    df_win['date'] = df_win['date'].mask(leaked)
+
+    return df_win
+
+
+@traced()
+def stack_label_rows(df, windows, window_ids):
+    """
+    coupons received in the label window of the given windows stacked with window_id
+    :param df: DataFrame, output of prep.get_new_feats
+    :param windows: list of Window
+    :param window_ids: list, index of each of windows in all windows
+    :return: DataFrame
+    """
+    df = df[df['coupon_id'].notna()]
+    starts, ends = get_bounds(windows, 'label_window')
+    ids, pos = assign_windows(date_utils.to_day_number(df['date_received']), starts, ends)
+
+    df_win = df.iloc[pos].reset_index(drop=True)
+    df_win['window_id'] = np.asarray(window_ids, dtype=np.int64)[ids]
+
+    return df_win
+
+
+@traced()
+def get_window_feats(df_win):
+    """
+    features of all families, grouped by window_id and the keys of each family
+    :param df_win: DataFrame, from stack_feat_rows
+    :return: list, (features DataFrame, key cols) of each family
+    """
+    family_feats = []
+    for feats, post_func, _ in fe.FAMILIES:
+        feats = [feat._replace(keys=['window_id'] + list(feat.keys)) for feat in feats]
+        family_feats.append((post_func(backends.aggregate(df_win, feats)), feats[0].keys))
+
+    return family_feats
+
+
+@traced()
+def build_windows(df, windows, df_test=None):
+    """
+    features and labels of all windows with one scan of the data
+    features only see rows of the feature window, labels only come from coupons received in the label window;
+    rows of all windows are stacked so each family is aggregated once with window_id as an extra key
+    :param df: DataFrame, offline train data with renamed cols
+    :param windows: list of Window
+    :param df_test: DataFrame, offline test data with renamed cols, required by windows without label
+    :return: dict, window name -> DataFrame with cols of test data, features and label if labeled
+    """
+    logger.info('======== WINDOW FEATURE PREPROCESS START ========')
+    t0 = time.time()
+
+    labeled = [i for i, window in enumerate(windows) if window.labeled]
+    unlabeled = [i for i, window in enumerate(windows) if not window.labeled]
+    if unlabeled and df_test is None:
+        raise ValueError('df_test is required by windows without label: {0}.'.format(
+            [windows[i].name for i in unlabeled]))
+
+    df_res = backends.get_new_feats(df)
+    df_feats = get_window_feats(stack_feat_rows(df_res, windows))
+
+    df_labels = []
+    if labeled:
+        df_label = stack_label_rows(df_res, [windows[i] for i in labeled], labeled)
+        df_labels.append(prep.get_new_label(df_label).drop(['date', 'days_gap'], axis=1))
+    if unlabeled:
+        df_test_res = backends.get_new_feats(df_test)
+        df_labels.append(stack_label_rows(df_test_res, [windows[i] for i in unlabeled], unlabeled))
+    df_label = pd.concat(df_labels, ignore_index=True)
+
+    for df_feat, keys in df_feats:
+        df_label = df_label.merge(df_feat, on=keys, how='left')
+    df_label.drop_duplicates(inplace=True)
+
+    res = {}
+    for i, window in enumerate(windows):
+        df_window = df_label[df_label['window_id'] == i].drop('window_id', axis=1).reset_index(drop=True)
+        # label is missing in rows of windows without label after the concat, and is put last
+        label = df_window.pop('label') if 'label' in df_window.columns else None
+        if window.labeled:
+            df_window['label'] = label.astype(np.int64)
+        res[window.name] = df_window
+        logger.info('window {0} has {1} rows'.format(window.name, len(df_window)))
+
+    logger.info('process used time {0}s.'.format(round(time.time() - t0, 3)))
+    logger.info('======== WINDOW FEATURE PREPROCESS END ========')
+
+    return res
+
+
+@traced()
+def window_feature_generator(windows=None):
+    """
+    build and save the data set of each window
+    :param windows: list of Window, default is WINDOWS
+    :return:
+    """
+    windows = WINDOWS if windows is None else windows
+    df_train = utils.read_data(file_name='ccf_offline_stage1_train.csv', data_dir=origin_data_dir)
+    df_test = None
+    if not all(window.labeled for window in windows):
+        df_test = utils.read_data(file_name='ccf_offline_stage1_test_revised.csv', rename_col=TEST_COLS,
+                                  data_dir=origin_data_dir)
+
+    for name, df_window in build_windows(df_train, windows, df_test).items():
+        utils.save_data(df_window, file_name='{0}_window_feature'.format(name), data_dir=feat_data_dir)
+
+
+if __name__ == '__main__':
+
+    window_feature_generator()